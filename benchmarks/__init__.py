@@ -0,0 +1,13 @@
+""" Benchmarks of the request handlers of enactus_app against a synthetic dataset
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.run --users 2000 --teams 200 --tasks 100 --output baseline.json
+    python -m benchmarks.run --users 2000 --teams 200 --tasks 100 --compare baseline.json
+
+The production-sized dataset (20k users, 2k teams, 500 tasks, 10M task statuses) is seeded with
+--users 20000 --teams 2000 --tasks 500. See python -m benchmarks.run --help for all options.
+
+python -m benchmarks.query_plans sends one request to every endpoint against the same dataset, and fails if the
+database's query planner reads any hot table in full.
+"""
@@ -0,0 +1,114 @@
+import random
+
+import constants
+import ingest
+
+ADMIN_EMAIL = "admin@benchmark.local"
+MEMBER_EMAIL = "member@benchmark.local"
+
+
+def seed(app_module, users, teams, tasks, statuses_per_user=None, random_seed=0, batch_size=10000):
+    """ Creates the tables of the app and populates them with a synthetic dataset, and commits. The first user is an
+    administrator with ADMIN_EMAIL, and the second is a team member with MEMBER_EMAIL. Every user is assigned
+    statuses_per_user tasks, and the rows are inserted in batches so that memory use does not depend on the size of
+    the dataset.
+
+    Args:
+        app_module: the enactus_app module, with its database configured
+        users: the number of users, at least 2
+        teams: the number of teams
+        tasks: the number of tasks
+        statuses_per_user: the number of tasks assigned to each user, or None to assign every task
+        random_seed: the seed of the generated points and statuses
+        batch_size: the number of rows inserted per statement
+
+    Returns: a dict of the ids of the seeded rows used by the benchmarks
+
+    """
+    db = app_module.db
+    rng = random.Random(random_seed)
+    if statuses_per_user is None:
+        statuses_per_user = tasks
+    statuses_per_user = min(statuses_per_user, tasks)
+    db.drop_all()
+    db.create_all()
+
+    def insert(model, rows):
+        for chunk in ingest.iter_chunks(rows, batch_size):
+            db.session.execute(model.__table__.insert(), chunk)
+        db.session.commit()
+
+    insert(app_module.Team, ({
+        "id": teamid,
+        "name": "Team %d" % teamid,
+        "charter": "Charter of team %d. " % teamid * 5,
+        "leader_id": None,
+        "version": 0
+    } for teamid in range(1, teams + 1)))
+    insert(app_module.User, ({
+        "id": userid,
+        "email": ADMIN_EMAIL if userid == 1 else MEMBER_EMAIL if userid == 2 else "user%d@benchmark.local" % userid,
+        "display_name": "User %d" % userid,
+        "privilege": 4 if userid == 1 else 1,
+        "quiz_completed": userid % 2 == 0,
+        "goals_set": userid % 3 == 0,
+        "learning_profile": "profile-%d" % (userid % 7),
+        "team_id": (userid % teams) + 1 if teams > 0 and userid > 1 else None,
+        "version": 0
+    } for userid in range(1, users + 1)))
+    insert(app_module.Task, ({
+        "id": taskid,
+        "name": "Task %d" % taskid,
+        "max_points": 100,
+        "type": constants.TASK_FILE_SUBMISSION if taskid % 2 == 0 else constants.TASK_READ_ONLY,
+        "category": taskid % (constants.MAX_CATEGORY + 1),
+        "description": ("Description of task %d. " % taskid * 50)[:1000],
+        "image": "https://example.com/task%d.png" % taskid,
+        "url": "https://example.com/task%d.html" % taskid,
+        "change_seq": 0
+    } for taskid in range(1, tasks + 1)))
+
+    def task_statuses():
+        for userid in range(1, users + 1):
+            for taskid in range(1, statuses_per_user + 1):
+                # The administrator's tasks are left open so that submissions and grades can be benchmarked
+                status = constants.STATUS_AVAILABLE if userid == 1 else rng.choice([
+                    constants.STATUS_UNAVAILABLE, constants.STATUS_AVAILABLE, constants.STATUS_SUBMITTED,
+                    constants.STATUS_COMPLETED])
+                yield {
+                    "user_id": userid,
+                    "task_id": taskid,
+                    "status": status,
+                    "points": rng.randint(0, 100) if status == constants.STATUS_COMPLETED else 0,
+                    "version": 0,
+                    "change_seq": 0
+                }
+
+    insert(app_module.TaskStatus, task_statuses())
+    # Each team is led by its first member
+    leaders = {}
+    for userid in range(2, users + 1):
+        if teams > 0:
+            leaders.setdefault((userid % teams) + 1, userid)
+    team = app_module.Team.__table__
+    if len(leaders) > 0:
+        db.session.execute(team.update().where(team.c.id == db.bindparam("b_id"))
+                           .values(leader_id=db.bindparam("b_leader_id")),
+                           [{"b_id": teamid, "b_leader_id": userid} for teamid, userid in leaders.items()])
+    db.session.commit()
+    app_module.rebuild_leaderboard()
+    job = app_module.Job()
+    job.kind = "assign"
+    job.status = constants.JOB_COMPLETED
+    job.params = "{}"
+    job.result = '{"inserted": 0, "promoted": 0}'
+    db.session.add(job)
+    db.session.commit()
+    return {
+        "admin_id": 1,
+        "member_id": 2 if users > 1 else 1,
+        "team_ids": list(range(1, teams + 1)),
+        "task_ids": list(range(1, tasks + 1)),
+        "job_id": job.id,
+        "statuses_per_user": statuses_per_user
+    }
@@ -0,0 +1,156 @@
+""" Checks the query plans of the queries issued by every benchmarked endpoint, and fails if a query on a hot table
+reads the whole table instead of using an index.
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.query_plans --users 2000 --teams 200 --tasks 100
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+
+from sqlalchemy import event
+
+from benchmarks import dataset
+from benchmarks.run import Benchmark, StubGoogleClient
+
+# The tables that grow with the number of users, which must never be scanned in full by a request
+HOT_TABLES = frozenset(["user", "taskstatus", "submission", "userscore"])
+
+SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(.*)$")
+
+
+class StatementRecorder(object):
+    """ Records the distinct statements issued while a request is handled, with the parameters of their first use """
+
+    def __init__(self):
+        self.endpoint = None
+        self.statements = {}
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.endpoint is None or (self.endpoint, statement) in self.statements:
+            return
+        if executemany:
+            parameters = parameters[0]
+        self.statements[(self.endpoint, statement)] = parameters
+
+
+def explainable(statement):
+    """ Returns: whether a statement reads rows, i.e. it is a SELECT, UPDATE, DELETE or INSERT ... SELECT """
+    words = statement.lstrip().split(None, 1)
+    if len(words) == 0:
+        return False
+    verb = words[0].upper()
+    return verb in ("SELECT", "UPDATE", "DELETE") or (verb == "INSERT" and re.search(r"\bSELECT\b", statement, re.I))
+
+
+def full_scans(engine, statement, parameters):
+    """ Returns the tables a statement reads in full, according to the database's query planner
+
+    Args:
+        engine: the engine of the database, which must be SQLite or MySQL
+        statement: the statement, in the driver's paramstyle
+        parameters: the parameters of the statement
+
+    Returns: a list of the names of the scanned tables
+
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if engine.dialect.name == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            scans = []
+            for row in cursor.fetchall():
+                match = SQLITE_SCAN.match(row[-1])
+                # "SCAN t USING [COVERING] INDEX i" walks an index, e.g. for ORDER BY ... LIMIT
+                if match is not None and "USING" not in match.group(2):
+                    scans.append(match.group(1))
+            return scans
+        cursor.execute("EXPLAIN " + statement, parameters)
+        columns = [column[0] for column in cursor.description]
+        return [row[columns.index("table")] for row in cursor.fetchall() if row[columns.index("type")] == "ALL"]
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+def check(app_module, ids, rng):
+    """ Sends one request to every benchmarked endpoint, then explains the statements they issued
+
+    Returns: a list of (endpoint, table, statement) tuples of the full scans of hot tables
+
+    """
+    recorder = StatementRecorder()
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+    event.listen(engine, "before_cursor_execute", recorder)
+    benchmark = Benchmark(app_module, ids, rng)
+    for name, client, make_request in benchmark.endpoints():
+        method, path, kwargs = make_request()
+        recorder.endpoint = name
+        response = getattr(client, method)(path, **kwargs)
+        response.get_data()
+        recorder.endpoint = None
+        if name == "POST /team" and response.status_code == 200:
+            benchmark.created_teams.append(json.loads(response.get_data())["data"]["id"])
+    event.remove(engine, "before_cursor_execute", recorder)
+    regressions = []
+    for (endpoint, statement), parameters in sorted(recorder.statements.items()):
+        if not explainable(statement):
+            continue
+        for table in full_scans(engine, statement, parameters):
+            if table in HOT_TABLES:
+                regressions.append((endpoint, table, statement))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checks that no endpoint of enactus_app scans a hot table in full")
+    parser.add_argument("--database-uri", help="SQLAlchemy URI of a throwaway SQLite or MySQL database, whose tables "
+                                               "are dropped and recreated. Defaults to a temporary SQLite database")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--teams", type=int, default=200)
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--statuses-per-user", type=int, default=None,
+                        help="number of tasks assigned to each user, defaults to all tasks")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="enactus-query-plans-")
+    try:
+        import enactus_app
+        import uploads
+        app = enactus_app.app
+        app.config["SQLALCHEMY_DATABASE_URI"] = args.database_uri or "sqlite:///%s" % os.path.join(workdir, "plans.db")
+        app.config["GOOGLE_CLIENT"] = StubGoogleClient(dataset.ADMIN_EMAIL)
+        app.config["SLOW_REQUEST_THRESHOLD"] = float("inf")
+        enactus_app.submission_store = uploads.ContentStore(os.path.join(workdir, "uploads"),
+                                                            app.config["UPLOAD_CHUNK_SIZE"],
+                                                            app.config["MAX_SUBMISSION_SIZE"])
+        with app.app_context():
+            ids = dataset.seed(enactus_app, args.users, args.teams, args.tasks, args.statuses_per_user, args.seed)
+            # Planners only pick the indexes the access paths need once they have statistics
+            enactus_app.db.session.execute("ANALYZE" if app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite")
+                                           else "ANALYZE TABLE user, taskstatus, submission, userscore")
+            enactus_app.db.session.commit()
+        ids["users"] = args.users
+        regressions = check(enactus_app, ids, random.Random(args.seed))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for endpoint, table, statement in regressions:
+        print "%-34s scans %s: %s" % (endpoint, table, " ".join(statement.split()))
+    if len(regressions) > 0:
+        return 1
+    print "No endpoint scans a hot table in full"
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
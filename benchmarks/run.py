@@ -0,0 +1,361 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+import constants
+from benchmarks import dataset
+
+
+class StubGoogleResponse(object):
+    ok = True
+
+    def __init__(self, data):
+        self.data = data
+        self.text = json.dumps(data)
+
+    def json(self):
+        return self.data
+
+
+class StubGoogleClient(object):
+    """ Stands in for Flask-Dance's Google session, always authorized as the specified account """
+
+    authorized = True
+
+    def __init__(self, email):
+        self.email = email
+        self.token = {"access_token": "benchmark-token", "expires_at": time.time() + 86400}
+
+    def get(self, url):
+        return StubGoogleResponse({"emails": [{"value": self.email}]})
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+class Benchmark(object):
+    """ Drives the request handlers of the app with the Flask test client, and measures each endpoint """
+
+    def __init__(self, app_module, ids, rng):
+        self.app_module = app_module
+        self.ids = ids
+        self.rng = rng
+        self.counter = 0
+        self.created_teams = []
+        self.admin = self.client(dataset.ADMIN_EMAIL)
+        self.member = self.client(dataset.MEMBER_EMAIL)
+
+    def client(self, email):
+        client = self.app_module.app.test_client()
+        with client.session_transaction() as session:
+            session["username"] = email
+        return client
+
+    def unique(self):
+        self.counter += 1
+        return self.counter
+
+    def endpoints(self):
+        """ Returns: a list of (name, client, function returning (method, path, kwargs)) tuples of the benchmarked
+            requests, in the order they are run
+        """
+        ids = self.ids
+        rng = self.rng
+        json_body = lambda data: {"data": json.dumps(data), "content_type": "application/json"}
+        file_task_ids = [taskid for taskid in ids["task_ids"][:ids["statuses_per_user"]] if taskid % 2 == 0]
+        return [
+            ("GET /", self.admin, lambda: ("get", "/", {})),
+            ("GET /user/<userid>", self.member, lambda: ("get", "/user/%d" % rng.randint(1, ids["users"]), {})),
+            ("GET /user", self.member, lambda: ("get", "/user", {})),
+            ("PUT /user", self.member, lambda: ("put", "/user", json_body({
+                "id": ids["member_id"], "display_name": "Member %d" % self.unique()}))),
+            ("POST /user", self.admin, lambda: ("post", "/user", json_body({
+                "email": "new%d@benchmark.local" % self.unique(), "display_name": "New", "privilege": 1}))),
+            ("POST /users/bulk", self.admin, lambda: ("post", "/users/bulk", json_body([
+                {"email": "bulk%d@benchmark.local" % self.unique(), "display_name": "Bulk", "privilege": 1}
+                for i in range(50)]))),
+            ("GET /task/<taskid>", self.member, lambda: ("get", "/task/%d" % rng.choice(ids["task_ids"]), {})),
+            ("GET /tasks", self.member, lambda: ("get", "/tasks", {})),
+            ("GET /tasks?fields=task_id,status", self.member, lambda: ("get", "/tasks?fields=task_id,status", {})),
+            ("GET /user/<userid>/tasks", self.admin,
+             lambda: ("get", "/user/%d/tasks" % rng.randint(1, ids["users"]), {})),
+            ("GET /tasks/changes", self.member, lambda: ("get", "/tasks/changes?since=0", {})),
+            ("PUT /task", self.admin, lambda: ("put", "/task", json_body(dict(
+                self.task_fields(rng.choice(ids["task_ids"]), with_id=True),
+                description="Updated %d" % self.unique())))),
+            ("POST /task", self.admin, lambda: ("post", "/task", json_body(dict(
+                self.task_fields(0), name="New task %d" % self.unique())))),
+            ("POST /tasks/bulk", self.admin, lambda: ("post", "/tasks/bulk", json_body([
+                self.task_fields(taskid) for taskid in rng.sample(ids["task_ids"], min(20, len(ids["task_ids"])))]))),
+            ("POST /task/<taskid>/submission", self.admin,
+             lambda: ("post", "/task/%d/submission" % rng.choice(file_task_ids), {
+                 "data": os.urandom(65536), "content_type": "application/octet-stream"})),
+            ("POST /assign", self.admin, lambda: ("post", "/assign", json_body({
+                "users": [rng.randint(1, ids["users"]) for i in range(50)],
+                "tasks": rng.sample(ids["task_ids"], min(10, len(ids["task_ids"])))}))),
+            ("POST /assignAll", self.admin, lambda: ("post", "/assignAll", json_body({
+                "users": [rng.randint(1, ids["users"]) for i in range(5)]}))),
+            ("GET /jobs/<jobid>", self.admin, lambda: ("get", "/jobs/%d" % ids["job_id"], {})),
+            # The administrator's tasks are not graded, so that they stay open for submissions
+            ("POST /grade", self.admin, lambda: ("post", "/grade", json_body([{
+                "user_id": rng.randint(2, ids["users"]),
+                "task_id": rng.choice(ids["task_ids"][:ids["statuses_per_user"]]),
+                "status": 3,
+                "points": rng.randint(0, 100)} for i in range(50)]))),
+            ("GET /team/<teamid>", self.member, lambda: ("get", "/team/%d" % rng.choice(ids["team_ids"]), {})),
+            ("GET /teams", self.member, lambda: ("get", "/teams?limit=100", {})),
+            ("GET /teams?name=", self.member, lambda: ("get", "/teams?name=%d" % rng.randint(1, 99), {})),
+            ("POST /team", self.admin, lambda: ("post", "/team", json_body({
+                "name": "New team %d" % self.unique(), "charter": "Created by the benchmark"}))),
+            ("PUT /team", self.admin, lambda: ("put", "/team", json_body({
+                "id": rng.choice(ids["team_ids"]), "charter": "Updated %d" % self.unique()}))),
+            ("DELETE /team/<teamid>", self.admin,
+             lambda: ("delete", "/team/%d" % self.created_teams.pop(), {})),
+            ("GET /leaderboard/users", self.member, lambda: ("get", "/leaderboard/users?limit=100", {})),
+            ("GET /leaderboard/teams", self.member, lambda: ("get", "/leaderboard/teams?limit=100", {})),
+            ("GET /stats/tasks", self.admin, lambda: ("get", "/stats/tasks", {})),
+            ("GET /stats/teams", self.admin, lambda: ("get", "/stats/teams", {})),
+            ("GET /metrics", self.admin, lambda: ("get", "/metrics", {})),
+            ("GET /test", self.member, lambda: ("get", "/test", {})),
+        ]
+
+    def task_fields(self, taskid, with_id=False):
+        fields = {
+            "name": "Task %d" % taskid,
+            "max_points": 100,
+            "type": constants.TASK_FILE_SUBMISSION if taskid % 2 == 0 else constants.TASK_READ_ONLY,
+            "category": 0,
+            "description": "Description of task %d" % taskid,
+            "image": "https://example.com/task%d.png" % taskid,
+            "url": "https://example.com/task%d.html" % taskid
+        }
+        if with_id:
+            fields["id"] = taskid
+        return fields
+
+    def run(self, requests, warmup):
+        """ Runs every endpoint
+
+        Args:
+            requests: the number of measured requests per endpoint
+            warmup: the number of unmeasured requests per endpoint run first
+
+        Returns: a dict of endpoint names to their results
+
+        """
+        query_counter = QueryCounter()
+        with self.app_module.app.app_context():
+            engine = self.app_module.db.engine
+        event.listen(engine, "before_cursor_execute", query_counter)
+        results = {}
+        for name, client, make_request in self.endpoints():
+            latencies = []
+            queries = 0
+            errors = 0
+            start_rss = reset_peak_rss()
+            for i in range(warmup + requests):
+                method, path, kwargs = make_request()
+                query_count = query_counter.count
+                start = time.time()
+                response = getattr(client, method)(path, **kwargs)
+                body = response.get_data()
+                elapsed = time.time() - start
+                if response.status_code >= 400 or (response.mimetype == "application/json" and
+                                                   not json.loads(body).get("success", False)):
+                    errors += 1
+                if name == "POST /team" and response.status_code == 200:
+                    self.created_teams.append(json.loads(body)["data"]["id"])
+                if i >= warmup:
+                    latencies.append(elapsed)
+                    queries += query_counter.count - query_count
+            results[name] = summarize(latencies, queries, errors, start_rss,
+                                      memory_status("VmHWM") if start_rss is not None else None)
+            print_result(name, results[name])
+        event.remove(engine, "before_cursor_execute", query_counter)
+        return results
+
+
+def reset_peak_rss():
+    """ Resets the peak resident set size of the process (VmHWM) to its current resident set size, so that the peak
+    measured afterwards is that of the following requests rather than of the whole run. Only supported on Linux 4.0
+    and later.
+
+    Returns: the resident set size in kilobytes, or None if the peak could not be reset
+
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except (IOError, OSError):
+        return None
+    return memory_status("VmRSS")
+
+
+def memory_status(field):
+    """ Returns: a memory field of /proc/self/status (e.g. VmRSS) in kilobytes, or None if it is unavailable """
+    try:
+        with open("/proc/self/status") as status:
+            match = re.search(r"^%s:\s+(\d+) kB" % field, status.read(), re.M)
+    except (IOError, OSError):
+        return None
+    return int(match.group(1)) if match is not None else None
+
+
+def summarize(latencies, queries, errors, start_rss, peak_rss):
+    """ Returns: a dict of the throughput, latency percentiles in milliseconds, mean query count, error count, and
+        the peak resident set size of the process while the endpoint was run and its growth over the resident set
+        size before, in kilobytes. The sizes are None where they cannot be measured per endpoint.
+    """
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / total if total > 0 else None,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "queries": float(queries) / len(latencies) if len(latencies) > 0 else 0,
+        "errors": errors,
+        "peak_rss_kb": peak_rss,
+        "rss_growth_kb": peak_rss - start_rss if peak_rss is not None and start_rss is not None else None
+    }
+
+
+def percentile(values, percent):
+    """ Returns: the nearest-rank percentile of sorted values, or 0 if there are none """
+    if len(values) == 0:
+        return 0
+    rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def print_result(name, result):
+    if result["peak_rss_kb"] is not None:
+        rss = "%7.1fMB peak RSS (+%.1fMB)" % (result["peak_rss_kb"] / 1024.0, result["rss_growth_kb"] / 1024.0)
+    else:
+        rss = "peak RSS n/a"
+    print "%-34s %8.1f req/s  p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  %6.1f queries  %4d errors  %s" % (
+        name, result["throughput"] or 0, result["p50_ms"], result["p95_ms"], result["p99_ms"], result["queries"],
+        result["errors"], rss)
+    sys.stdout.flush()
+
+
+def compare(baseline, results, tolerance):
+    """ Prints the change of each endpoint's latency and query count from a baseline
+
+    Args:
+        baseline: the endpoint results of the baseline
+        results: the endpoint results of this run
+        tolerance: the fraction by which p95 latency may increase before it is reported as a regression
+
+    Returns: a list of the names of the endpoints that regressed
+
+    """
+    regressions = []
+    print
+    print "Compared to baseline:"
+    for name in sorted(set(baseline) & set(results)):
+        old, new = baseline[name], results[name]
+        regressed = new["p95_ms"] > old["p95_ms"] * (1 + tolerance) or new["queries"] > old["queries"]
+        if regressed:
+            regressions.append(name)
+        print "%-34s p50 %8.2f -> %8.2fms  p95 %8.2f -> %8.2fms  queries %6.1f -> %6.1f%s" % (
+            name, old["p50_ms"], new["p50_ms"], old["p95_ms"], new["p95_ms"], old["queries"], new["queries"],
+            "  REGRESSION" if regressed else "")
+    for name in sorted(set(baseline) ^ set(results)):
+        print "%-34s only in the %s" % (name, "baseline" if name in baseline else "current run")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the request handlers of enactus_app against a synthetic "
+                                                 "dataset")
+    parser.add_argument("--database-uri", help="SQLAlchemy URI of a throwaway database, whose tables are dropped "
+                                               "and recreated. Defaults to a temporary SQLite database")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--teams", type=int, default=200)
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--statuses-per-user", type=int, default=None,
+                        help="number of tasks assigned to each user, defaults to all tasks")
+    parser.add_argument("--requests", type=int, default=50, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests per endpoint run first")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="fraction by which p95 latency may increase before it is reported as a regression")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="enactus-benchmark-")
+    try:
+        import enactus_app
+        import uploads
+        app = enactus_app.app
+        app.config["SQLALCHEMY_DATABASE_URI"] = args.database_uri or "sqlite:///%s" % os.path.join(workdir, "bench.db")
+        app.config["SQLALCHEMY_ECHO"] = False
+        app.config["GOOGLE_CLIENT"] = StubGoogleClient(dataset.ADMIN_EMAIL)
+        app.config["SLOW_REQUEST_THRESHOLD"] = float("inf")
+        enactus_app.submission_store = uploads.ContentStore(os.path.join(workdir, "uploads"),
+                                                            app.config["UPLOAD_CHUNK_SIZE"],
+                                                            app.config["MAX_SUBMISSION_SIZE"])
+        start = time.time()
+        with app.app_context():
+            ids = dataset.seed(enactus_app, args.users, args.teams, args.tasks, args.statuses_per_user, args.seed)
+        ids["users"] = args.users
+        print "Seeded %d users, %d teams, %d tasks and %d task statuses in %.1fs" % (
+            args.users, args.teams, args.tasks, args.users * ids["statuses_per_user"], time.time() - start)
+        results = Benchmark(enactus_app, ids, random.Random(args.seed)).run(args.requests, args.warmup)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "database": app.config["SQLALCHEMY_DATABASE_URI"].split("://")[0],
+        "dataset": {
+            "users": args.users,
+            "teams": args.teams,
+            "tasks": args.tasks,
+            "statuses_per_user": ids["statuses_per_user"],
+            "seed": args.seed
+        },
+        "requests": args.requests,
+        "endpoints": results
+    }
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare) as baseline:
+            regressions = compare(json.load(baseline)["endpoints"], results, args.tolerance)
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """ Thread-safe cache holding at most maxsize entries, evicting the least recently used entry when full.
+    Entries expire ttl seconds after they are set.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """ Returns the value cached for the key, or default if there is none or it has expired """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.time():
+                return default
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, ttl=None):
+        """ Caches a value for the key
+
+        Args:
+            key: the key
+            value: the value to cache
+            ttl: the time-to-live of the entry in seconds, or None to use the cache's ttl
+
+        """
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) > 0 and len(self._entries) >= self.maxsize:
+                self._entries.popitem(last=False)
+            self._entries[key] = (time.time() + ttl, value)
+
+    def invalidate(self, key):
+        """ Removes the value cached for the key, if any """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class VersionedSnapshot(object):
+    """ Holds an immutable snapshot built by a loader function, and rebuilds it when a shared version counter
+    changes. The counter is checked at most once every check_interval seconds, unless a maximum age is requested.
+    """
+
+    def __init__(self, load, get_version, check_interval):
+        """
+        Args:
+            load: function taking a version and returning the snapshot for it
+            get_version: function returning the current version
+            check_interval: the minimum number of seconds between version checks
+        """
+        self._load = load
+        self._get_version = get_version
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+        self._checked_at = 0
+
+    def get(self, max_age=None):
+        """ Returns the snapshot, rebuilding it first if the version counter has changed
+
+        Args:
+            max_age: the maximum number of seconds since the version was last checked, or None for check_interval
+
+        Returns: the snapshot
+
+        """
+        if max_age is None:
+            max_age = self.check_interval
+        if self._snapshot is not None and time.time() - self._checked_at < max_age:
+            return self._snapshot
+        with self._lock:
+            checked_at = time.time()
+            version = self._get_version()
+            if self._snapshot is None or version != self._version:
+                self._snapshot = self._load(version)
+                self._version = version
+            self._checked_at = checked_at
+            return self._snapshot
+
+    def current(self):
+        """ Returns the snapshot without checking the version counter, building it only if it has never been built.
+        Unlike get, this never queries the version counter of an existing snapshot.
+        """
+        if self._snapshot is None:
+            return self.get()
+        return self._snapshot
+
+    def invalidate(self):
+        """ Forces the version counter to be checked on the next call to get """
+        self._checked_at = 0
@@ -0,0 +1,60 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The supported content codings, in order of preference
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/plain", "text/html")
+
+
+def compress(data, encoding, level=6):
+    """ Compresses data with a content coding
+
+    Args:
+        data: the string to compress
+        encoding: the content coding, which must be one of ENCODINGS
+        level: the compression level, from 1 (fastest) to 9 (smallest). For brotli, it is used as the quality.
+
+    Returns: the compressed string
+
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_compressed(chunks, encoding, level=6):
+    """ Lazily compresses an iterable of strings with a content coding. The output is flushed after each chunk, so
+    that every chunk of a streamed response reaches the client without waiting for the following ones.
+
+    Args:
+        chunks: the iterable of strings to compress
+        encoding: the content coding, which must be one of ENCODINGS
+        level: see compress
+
+    Returns: a generator of the compressed strings
+
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            compressed = process(chunk) + flush()
+            if compressed:
+                yield compressed
+        yield finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
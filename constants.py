@@ -14,4 +14,10 @@ STATUS_AVAILABLE = 1
 STATUS_SUBMITTED = 2
 STATUS_COMPLETED = 3
 
-ALLOWED_IMAGE_EXTENSIONS = ["jpg", "png", "jpeg", "gif"]
\ No newline at end of file
+ALLOWED_IMAGE_EXTENSIONS = ["jpg", "png", "jpeg", "gif"]
+
+# Background job statuses
+JOB_QUEUED = 0
+JOB_RUNNING = 1
+JOB_COMPLETED = 2
+JOB_FAILED = 3
@@ -1,31 +1,172 @@
-from flask import Flask, json, request, redirect, url_for, session, escape, abort, render_template, jsonify, g
+from flask import Flask, json, request, redirect, url_for, session, escape, abort, render_template, jsonify, g, \
+    Response, has_request_context, stream_with_context
 from oauthlib.oauth2.rfc6749.errors import InvalidGrantError, TokenExpiredError, OAuth2Error
 from flask_dance.contrib.google import make_google_blueprint, google
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from sqlalchemy.sql.dml import UpdateBase
 from pymysql import IntegrityError
 from enactus_keys import ServerParams
 from functools import wraps
+from contextlib import contextmanager
 import logging
-from logging.handlers import RotatingFileHandler
+import atexit
+import uuid
+import datetime
+import time
+import bisect
+import itertools
+import hashlib
+import re
+import click
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+from Queue import Queue
 import error_codes
 import constants
+import jobs
+import metrics
+import serializers
+import ngram_index
+import caching
+import ingest
+import migrations
+import uploads
+import compression
+import structured_logging
 
 server_params = ServerParams()
 app = Flask(__name__)
 app.secret_key = server_params.secret_key
 app.config["SQLALCHEMY_DATABASE_URI"] = "mysql+pymysql://enactus:%s@localhost/enactusdb" % server_params.local_db_password
-app.config["SQLALCHEMY_ECHO"] = True
+app.config["SQLALCHEMY_ECHO"] = False
+# The database of bind REPLICA_BIND (e.g. {"replica": "mysql+pymysql://..."}) is a read replica of the primary database,
+# which serves the reads of request handlers declared with read_replica. Without it, all queries go to the primary.
+app.config["SQLALCHEMY_BINDS"] = {}
+app.config["SQLALCHEMY_POOL_SIZE"] = 10
+app.config["SQLALCHEMY_MAX_OVERFLOW"] = 20
+app.config["SQLALCHEMY_POOL_TIMEOUT"] = 10
+app.config["SQLALCHEMY_POOL_RECYCLE"] = 3600
+# Whether connections that have been idle in the pool for more than DATABASE_PING_IDLE_TIME seconds are checked to be
+# alive when they are checked out, reconnecting if the server has closed them
+app.config["DATABASE_PRE_PING"] = True
+app.config["DATABASE_PING_IDLE_TIME"] = 10
 app.config["JSON_SORT_KEYS"] = False
+# The number of serializers compiled for the "fields" and "expand" parameters of requests that are kept
+app.config["SELECTION_CACHE_SIZE"] = 1000
+app.config["ASSIGN_BATCH_SIZE"] = 5000
+app.config["JOB_WORKERS"] = 2
+# Whether each process recovers the jobs left behind by a restart when it handles its first request. Only enable this
+# when a single process serves the app, as a process would otherwise fail the jobs running in the others. Otherwise,
+# run "flask recover-jobs" once per deployment, after the old processes have stopped.
+app.config["RECOVER_JOBS_ON_START"] = False
+app.config["SLOW_REQUEST_THRESHOLD"] = 1.0
+app.config["STREAM_BATCH_SIZE"] = 500
+app.config["MAX_PAGE_SIZE"] = 1000
+app.config["TEAM_INDEX_MAX_AGE"] = 300
+app.config["CURRENT_USER_CACHE_SIZE"] = 10000
+app.config["CURRENT_USER_CACHE_TTL"] = 60
+app.config["GOOGLE_CLIENT"] = None
+app.config["GOOGLE_PROFILE_CACHE_SIZE"] = 10000
+app.config["GOOGLE_PROFILE_CACHE_TTL"] = 3600
+app.config["TASK_CATALOG_CHECK_INTERVAL"] = 1
+app.config["LEADERBOARD_DEFAULT_SIZE"] = 10
+app.config["BULK_CHUNK_SIZE"] = 500
+app.config["GRADE_CHUNK_SIZE"] = 500
+app.config["UPLOAD_DIR"] = "uploads"
+app.config["UPLOAD_CHUNK_SIZE"] = 65536
+app.config["MAX_SUBMISSION_SIZE"] = 536870912
+app.config["UPLOAD_EXPIRY"] = 86400
+app.config["CHANGES_MAX_WAIT"] = 30
+app.config["CHANGES_POLL_INTERVAL"] = 1
+app.config["TASK_CACHE_MAX_AGE"] = 60
+app.config["COMPRESSION_MIN_SIZE"] = 1024
+app.config["COMPRESSION_LEVEL"] = 6
+app.config["STATS_CACHE_TTL"] = 30
+app.config["LOG_FILE"] = "messages.log"
+app.config["LOG_LEVEL"] = logging.INFO
+app.config["LOG_MAX_BYTES"] = 104857600
+app.config["LOG_BACKUP_COUNT"] = 10
+app.config["LOG_ROTATE_WHEN"] = None
+app.config["LOG_QUEUE_SIZE"] = 10000
+app.config["LOG_SQL_SAMPLE_RATE"] = 0.0
+app.config["LOG_DEBUG_SAMPLE_RATE"] = 0.0
+# Deployments override the settings above (e.g. the database URIs) in the file named by ENACTUS_SETTINGS
+app.config.from_envvar("ENACTUS_SETTINGS", silent=True)
 blueprint = make_google_blueprint(
     client_id=server_params.google_clientid,
     client_secret=server_params.google_clientsecret,
     scope=["profile", "email"]
 )
 app.register_blueprint(blueprint, url_prefix="/login")
-handler = RotatingFileHandler("messages.log", maxBytes=1048576, backupCount=1)
-handler.setLevel(logging.INFO)
+# Request threads only enqueue log records, and log_listener writes them as JSON lines from a background thread.
+# The log is rotated by size, or by time if LOG_ROTATE_WHEN is set (e.g. "midnight").
+if app.config["LOG_ROTATE_WHEN"] is not None:
+    log_file_handler = TimedRotatingFileHandler(app.config["LOG_FILE"], when=app.config["LOG_ROTATE_WHEN"],
+                                                backupCount=app.config["LOG_BACKUP_COUNT"])
+else:
+    log_file_handler = RotatingFileHandler(app.config["LOG_FILE"], maxBytes=app.config["LOG_MAX_BYTES"],
+                                           backupCount=app.config["LOG_BACKUP_COUNT"])
+log_file_handler.setFormatter(structured_logging.JsonFormatter())
+log_listener = structured_logging.QueueListener(Queue(app.config["LOG_QUEUE_SIZE"]), log_file_handler)
+handler = structured_logging.QueueHandler(log_listener.queue)
+handler.addFilter(structured_logging.ContextFilter(lambda: g.get("request_id") if has_request_context() else None))
+handler.addFilter(structured_logging.SamplingFilter(app.config["LOG_SQL_SAMPLE_RATE"], name="sqlalchemy.engine"))
+handler.addFilter(structured_logging.SamplingFilter(app.config["LOG_DEBUG_SAMPLE_RATE"], below_level=logging.INFO))
+app.logger.setLevel(app.config["LOG_LEVEL"])
 app.logger.addHandler(handler)
-db = SQLAlchemy(app)
+logging.getLogger(jobs.__name__).addHandler(handler)
+if app.config["LOG_SQL_SAMPLE_RATE"] > 0:
+    # Statements are logged at INFO by the sqlalchemy.engine logger, and parameters at DEBUG
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+    logging.getLogger("sqlalchemy.engine").addHandler(handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+REPLICA_BIND = "replica"
+
+
+class RoutingSession(SignallingSession):
+    """ Session that sends reads to the read replica while use_replica is set, and everything else to the primary.
+    Once the session writes, use_replica is cleared so that later reads see the writes.
+    """
+
+    def __init__(self, db, **options):
+        SignallingSession.__init__(self, db, **options)
+        self.use_replica = False
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.use_replica:
+            if self._flushing or isinstance(clause, UpdateBase) or \
+                    getattr(clause, "_for_update_arg", None) is not None:
+                self.use_replica = False
+            elif REPLICA_BIND in (self.app.config["SQLALCHEMY_BINDS"] or {}):
+                return db.get_engine(self.app, bind=REPLICA_BIND)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return RoutingSession(self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        # SQLite engines do not use a QueuePool, which is the only pool accepting the pool sizing options
+        if info.drivername == "sqlite":
+            for key in ("pool_size", "pool_timeout", "max_overflow"):
+                options.pop(key, None)
+        SQLAlchemy.apply_driver_hacks(self, app, info, options)
+
+
+db = RoutingSQLAlchemy(app)
+job_pool = jobs.WorkerPool(app.config["JOB_WORKERS"])
+request_metrics = metrics.MetricsRegistry()
+team_name_index = ngram_index.NgramIndex()
+current_user_cache = caching.TTLCache(app.config["CURRENT_USER_CACHE_SIZE"], app.config["CURRENT_USER_CACHE_TTL"])
+google_profile_cache = caching.TTLCache(app.config["GOOGLE_PROFILE_CACHE_SIZE"],
+                                        app.config["GOOGLE_PROFILE_CACHE_TTL"])
+submission_store = uploads.ContentStore(app.config["UPLOAD_DIR"], app.config["UPLOAD_CHUNK_SIZE"],
+                                        app.config["MAX_SUBMISSION_SIZE"], app.config["UPLOAD_EXPIRY"])
 
 
 class User(db.Model):
@@ -37,6 +178,9 @@ class User(db.Model):
     goals_set = db.Column(db.Boolean)
     learning_profile = db.Column(db.String(255))
     team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Covers the team fingerprints of show_team and get_teams as well as team membership scans
+    __table_args__ = ( db.Index("user_team_version", "team_id", "version"), )
     team = db.relationship("Team", back_populates="users")
     task_statuses = db.relationship("TaskStatus", back_populates="user")
 
@@ -50,16 +194,7 @@ class User(db.Model):
                 self.learning_profile)
 
     def serialize(self):
-        return {
-            "id":self.id,
-            "email":self.email,
-            "display_name":self.display_name,
-            "privilege":self.privilege,
-            "quiz_completed":self.quiz_completed,
-            "goals_set":self.goals_set,
-            "learning_profile":self.learning_profile,
-            "team_id":self.team_id
-        }
+        return serializer.to_data(self)
 
 
 class Task(db.Model):
@@ -71,22 +206,15 @@ class Task(db.Model):
     description = db.Column(db.String(1000))
     image = db.Column(db.String(255))
     url = db.Column(db.String(255))
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default="0", index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
     def __repr__(self):
         return "<Task %d: %r,%r,%r,%r,%r>" % \
                (self.id, self.name, self.max_points, self.type, self.category, self.url)
 
     def serialize(self):
-        return {
-            "id":self.id,
-            "name":self.name,
-            "max_points":self.max_points,
-            "type":self.type,
-            "category":self.category,
-            "description":self.description,
-            "image":self.image,
-            "url":self.url
-        }
+        return serializer.to_data(self)
 
 
 class TaskStatus(db.Model):
@@ -96,17 +224,36 @@ class TaskStatus(db.Model):
     task_id = db.Column(db.Integer, db.ForeignKey("task.id"))
     status = db.Column(db.Integer, nullable=False, default=0)
     points = db.Column(db.Integer, nullable=False, default=0)
-    __table_args__ = ( db.UniqueConstraint("user_id", "task_id", name="unique_user_task"), )
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    __table_args__ = ( db.UniqueConstraint("user_id", "task_id", name="unique_user_task"),
+                       db.Index("taskstatus_user_change", "user_id", "change_seq"),
+                       db.Index("taskstatus_task_status", "task_id", "status"),
+                       db.Index("taskstatus_user_status", "user_id", "status", "task_id") )
     task = db.relationship("Task")
     user = db.relationship("User", back_populates="task_statuses")
 
     def serialize(self):
-        return {
-            "user_id": self.user_id,
-            "task": self.task.serialize(),
-            "status": self.status,
-            "points": self.points
-        }
+        return serializer.to_data(self)
+
+
+class Submission(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey("task.id"), nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    __table_args__ = ( db.Index("submission_user_task", "user_id", "task_id"), )
+
+    def __init__(self, user_id, task_id, sha256, size):
+        self.user_id = user_id
+        self.task_id = task_id
+        self.sha256 = sha256
+        self.size = size
+
+    def serialize(self):
+        return serializer.to_data(self)
 
 
 class Team(db.Model):
@@ -114,16 +261,11 @@ class Team(db.Model):
     name = db.Column(db.String(255), nullable=False, unique=True)
     charter = db.Column(db.String(1000))
     leader_id = db.Column(db.Integer, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     users = db.relationship("User", back_populates="team")
 
     def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "charter": self.charter,
-            "leader_id": self.leader_id,
-            "users": [user.serialize() for user in self.users]
-        }
+        return serializer.to_data(self)
 
     def get_leader(self):
         if self.leader_id is None:
@@ -136,28 +278,182 @@ class Team(db.Model):
                 return self.leader
         return None
 
-class ResponseJson(object):
 
-    def __init__(self, success, code, data):
-        self.success = success
-        self.code = code
-        self.data = data
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(80), nullable=False)
+    status = db.Column(db.Integer, nullable=False, default=constants.JOB_QUEUED)
+    params = db.Column(db.Text(16777215), nullable=False)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(db.Text)
+    created_by = db.Column(db.String(80))
 
     def serialize(self):
-        serialdata = self.serialize_helper(self.data)
-        print serialdata
         return {
-            "success": self.success,
-            "code": self.code,
-            "data": serialdata
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "processed": self.processed,
+            "total": self.total,
+            "result": json.loads(self.result) if self.result is not None else None
         }
 
-    def serialize_helper(self, obj):
-        if hasattr(obj, "__iter__"):
-            return [self.serialize_helper(elem) for elem in obj]
-        if callable(getattr(obj, "serialize", None)):
-            return obj.serialize()
-        return obj
+
+class UserScore(db.Model):
+    __tablename__ = "userscore"
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True, autoincrement=False)
+    team_id = db.Column(db.Integer, db.ForeignKey("team.id"), nullable=True, index=True)
+    points = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = ( db.Index("userscore_points", "points", "user_id"), )
+
+    def __init__(self, user_id, team_id):
+        self.user_id = user_id
+        self.team_id = team_id
+        self.points = 0
+        self.completed = 0
+
+
+class TeamScore(db.Model):
+    __tablename__ = "teamscore"
+    team_id = db.Column(db.Integer, db.ForeignKey("team.id"), primary_key=True, autoincrement=False)
+    points = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = ( db.Index("teamscore_points", "points", "team_id"), )
+
+    def __init__(self, team_id):
+        self.team_id = team_id
+        self.points = 0
+        self.completed = 0
+
+
+class CacheVersion(db.Model):
+    __tablename__ = "cacheversion"
+    name = db.Column(db.String(80), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TaskCatalog(object):
+    """ Immutable snapshot of all tasks, serialized and encoded once per version of the task catalog """
+
+    def __init__(self, version, tasks):
+        self.version = version
+        self.tasks = dict((task.id, serializer.to_data(task)) for task in tasks)
+        self.encoded_tasks = dict((taskid, serializer.encoder.encode(task)) for taskid, task in self.tasks.items())
+        self.change_seqs = dict((task.id, task.change_seq) for task in tasks)
+        self.ids = tuple(sorted(self.tasks))
+        self._compressed_envelopes = {}
+
+    def compressed_envelope(self, taskid, encoding):
+        """ Returns the successful response envelope of a task compressed with a content coding, compressing it on
+        first use only
+
+        Args:
+            taskid: the id of the task, which must be in the catalog
+            encoding: the content coding, which must be one of compression.ENCODINGS
+
+        Returns: the compressed envelope
+
+        """
+        compressed = self._compressed_envelopes.get((taskid, encoding))
+        if compressed is None:
+            compressed = compression.compress(serializer.encode_envelope_raw(True, 0, self.encoded_tasks[taskid]),
+                                              encoding, app.config["COMPRESSION_LEVEL"])
+            self._compressed_envelopes[(taskid, encoding)] = compressed
+        return compressed
+
+
+# Keys must be listed in the same order as the previous dict literals so that the encoded output is unchanged
+serializer = serializers.Serializer(app.json_encoder(separators=(",", ":"), sort_keys=app.config["JSON_SORT_KEYS"]),
+                                    app.config["SELECTION_CACHE_SIZE"])
+serializer.register(User, ["id", "email", "display_name", "privilege", "quiz_completed", "goals_set",
+                           "learning_profile", "team_id"])
+serializer.register(Task, ["id", "name", "max_points", "type", "category", "description", "image", "url"])
+serializer.register(TaskStatus, ["user_id", "task", "status", "points"],
+                    getters={"task": lambda taskstatus: catalog_task(taskstatus)},
+                    collapsed={"task": ("task_id", lambda taskstatus: taskstatus.task_id)},
+                    columns={"task": ["task_id"]})
+serializer.register(Submission, ["id", "user_id", "task_id", "sha256", "size"])
+serializer.register(Team, ["id", "name", "charter", "leader_id", "users"], nested=["users"])
+serialize_team_without_users = serializer.compile(["id", "name", "charter", "leader_id", "users"],
+                                                getters={"users": lambda team: None})
+
+
+def get_cache_version(name):
+    """ Returns the current version of a shared cache, as recorded in the cacheversion table
+
+    Args:
+        name: the name of the cache
+
+    Returns: the version, or 0 if the cache has never been invalidated
+
+    """
+    version = db.session.query(CacheVersion.version).filter_by(name=name).scalar()
+    return version if version is not None else 0
+
+
+def bump_cache_version(name):
+    """ Increments the version of a shared cache in the current transaction, so that every process holding a copy of
+    the cache rebuilds it once the transaction is committed
+
+    Args:
+        name: the name of the cache
+
+    """
+    cacheversion = CacheVersion.__table__
+    db.session.execute(insert_ignore(cacheversion).values(name=name, version=0))
+    db.session.execute(cacheversion.update().where(cacheversion.c.name == name)
+                       .values(version=cacheversion.c.version + 1))
+
+
+# The change_seq of the taskStatus written by a transaction before it allocates its change sequence number. Readers never
+# see it, as the rows are stamped with the allocated number before the transaction commits.
+PENDING_CHANGE_SEQ = -1
+
+
+def next_change_seq():
+    """ Allocates the next change sequence number in the current transaction, to be stored in the change_seq of every
+    Task and TaskStatus the transaction writes. The counter stays locked until the transaction ends, so sequence
+    numbers are committed in the order they are allocated and a reader that has seen number N will never later find
+    a new row numbered N or below. It should therefore be allocated as late in the transaction as possible.
+
+    Returns: the sequence number
+
+    """
+    bump_cache_version("change_seq")
+    # Every write of a taskStatus allocates a sequence number, so the progress statistics are checked on their next use
+    stats_changed()
+    return get_cache_version("change_seq")
+
+
+def load_task_catalog(version):
+    with primary_reads():
+        return TaskCatalog(version, Task.query.order_by(Task.id).all())
+
+
+def task_catalog_version():
+    with primary_reads():
+        return get_cache_version("task_catalog")
+
+
+task_catalog = caching.VersionedSnapshot(load_task_catalog, task_catalog_version,
+                                         app.config["TASK_CATALOG_CHECK_INTERVAL"])
+
+
+def catalog_task(taskstatus):
+    """ Returns the serialized task of a taskStatus from the current task catalog, without checking whether the
+    catalog is up to date. Falls back to loading the task if it is missing from the catalog, e.g. if it was inserted
+    into the database directly.
+
+    Args:
+        taskstatus: the taskStatus
+
+    Returns: the serialized task
+
+    """
+    task = task_catalog.current().tasks.get(taskstatus.task_id)
+    return task if task is not None else taskstatus.task.serialize()
 
 
 # Overall Helper Functions
@@ -172,8 +468,169 @@ def success_response(data):
     Returns: the successful JSON HTTP response
 
     """
-    resp = ResponseJson(True, 0, data)
-    return jsonify(resp.serialize())
+    start = time.time()
+    response = Response(serializer.encode_envelope(True, 0, data, request_selection()), mimetype="application/json")
+    record_serialize_time(time.time() - start)
+    return response
+
+
+def stream_success_response(items):
+    """ Returns a successful JSON response which streams the specified items as the data array. The items are only
+        consumed while the response is being sent, so they may be a lazily evaluated query.
+
+    Args:
+        items: an iterable of the items to return
+
+    Returns: the streamed successful JSON HTTP response
+
+    """
+    return Response(stream_with_context(serializer.iter_envelope(True, 0, items, selection=request_selection(),
+                                                                 record_time=record_serialize_time)),
+                    mimetype="application/json")
+
+
+def iter_keyset(query, key, batch_size, limit=None):
+    """ Iterates over the results of a query in batches ordered by a unique key, issuing one query per batch.
+    Unlike Query.yield_per, this can be combined with eager loading of collections.
+
+    Args:
+        query: the query to iterate over
+        key: the unique column to order and page the results by
+        batch_size: the number of results to fetch per query
+        limit: the maximum number of results, or None for no limit
+
+    Returns: a generator of results
+
+    """
+    last_key = None
+    while limit is None or limit > 0:
+        size = batch_size if limit is None else min(batch_size, limit)
+        batch_query = query if last_key is None else query.filter(key > last_key)
+        batch = batch_query.order_by(key).limit(size).all()
+        for result in batch:
+            yield result
+        if len(batch) < size:
+            return
+        if limit is not None:
+            limit -= len(batch)
+        last_key = getattr(batch[-1], key.key)
+
+
+def iter_by_keys(query, key, keys, batch_size):
+    """ Iterates over the results of a query with the specified keys, in the order of the keys, issuing one query per
+    batch of keys
+
+    Args:
+        query: the query to iterate over
+        key: the unique column the keys are values of
+        keys: a sorted list of keys
+        batch_size: the number of results to fetch per query
+
+    Returns: a generator of results
+
+    """
+    for batch in chunks(keys, batch_size):
+        for result in query.filter(key.in_(batch)).order_by(key):
+            yield result
+
+
+def keyset_page_args():
+    """ Parses the keyset pagination request args. "after" is the key of the last result of the previous page, and
+    "limit" is the maximum number of results, capped to MAX_PAGE_SIZE.
+
+    Returns: a tuple (after, limit), where each is None if not specified
+    Raises:
+        ValueError: if either arg is not an integer
+
+    """
+    after = request.args.get("after", None)
+    limit = request.args.get("limit", None)
+    if after is not None:
+        after = int(after)
+    if limit is not None:
+        limit = min(max(int(limit), 0), app.config["MAX_PAGE_SIZE"])
+    return after, limit
+
+
+def request_selection():
+    """ Returns the selection of the data to return, parsed from the "fields" and "expand" request args and memoised
+    for the request. See serializers.parse_selection for their format.
+
+    Returns: the serializers.Selection, or None if the full data is to be returned
+
+    """
+    if not has_request_context():
+        return None
+    if "selection" not in g:
+        g.selection = serializers.parse_selection(request.args.get("fields"), request.args.get("expand"))
+    return g.selection
+
+
+def load_selected_columns(query, model):
+    """ Restricts a query to the columns of a model that are read to serialize the selected data
+
+    Args:
+        query: the query for instances of the model
+        model: the model class
+
+    Returns: the query with the load_only option applied if only some columns are read
+
+    """
+    names = serializer.selected_columns(model, request_selection())
+    if names is None:
+        return query
+    return query.options(db.load_only(*(names + [column.key for column in db.inspect(model).primary_key])))
+
+
+def encoded_success_response(encoded_data):
+    """ Returns a successful JSON response with data that has already been encoded
+
+    Args:
+        encoded_data: the encoded JSON of the data to return
+
+    Returns: the successful JSON HTTP response
+
+    """
+    return Response(serializer.encode_envelope_raw(True, 0, encoded_data), mimetype="application/json")
+
+
+def conditional_response(fingerprint, build_response, cache_control="private, no-cache"):
+    """ Returns a response with a strong ETag derived from a fingerprint of the data it returns, or an empty
+    304 Not Modified response if the ETag matches the request's If-None-Match header. The fingerprint must be cheap to
+    compute (e.g. row versions or aggregates of them), as build_response is only called if the ETag does not match.
+
+    Args:
+        fingerprint: a tuple of values that changes whenever the returned data changes. The ETag also depends on the
+            request's path and query string.
+        build_response: function returning the full response
+        cache_control: the Cache-Control header of the response
+
+    Returns: the HTTP response
+
+    """
+    etag = hashlib.sha1(repr((request.path, request.query_string, fingerprint))).hexdigest()
+    # Each content coding of the response is a different representation, so needs a different strong ETag
+    if response_encoding() is not None:
+        etag += "-" + response_encoding()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = build_response()
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def response_encoding():
+    """ Returns the content coding that responses to the request are compressed with, if they are large enough,
+    negotiated from the request's Accept-Encoding header and memoised for the request
+
+    Returns: one of compression.ENCODINGS, or None if responses are not compressed
+
+    """
+    if "response_encoding" not in g:
+        g.response_encoding = request.accept_encodings.best_match(compression.ENCODINGS)
+    return g.response_encoding
 
 
 def error_response(code, message):
@@ -186,8 +643,10 @@ def error_response(code, message):
     Returns: the error JSON HTTP response
 
     """
-    resp = ResponseJson(False, code, message)
-    return jsonify(resp.serialize())
+    start = time.time()
+    response = Response(serializer.encode_envelope(False, code, message), mimetype="application/json")
+    record_serialize_time(time.time() - start)
+    return response
 
 def authorize_check(level):
     """ Decorator generator for checking whether the user is logged in and authorized to the level required for
@@ -204,7 +663,8 @@ def authorize_check(level):
         def func_wrapper(*args, **kwargs):
             if "username" not in session:
                 return redirect(url_for("google.login"))
-            priv = session.get("privilege", 0)
+            user = current_user()
+            priv = user["privilege"] if user is not None else 0
             if (priv < level):
                 return error_response(error_codes.INSUFFICIENT_PRIVILEGE, error_codes.INSUFFICIENT_PRIVILEGE_STR)
             return func(*args, **kwargs)
@@ -212,6 +672,161 @@ def authorize_check(level):
     return authorize_decorator
 
 
+def loading_profile(**options):
+    """ Decorator generator declaring the eager-loading strategies used by a request handler's main query, so that
+        serializing the result does not lazily issue one query per row
+
+    Args:
+        **options: the loader options (e.g. db.joinedload, db.subqueryload) to apply to the handler's main query,
+            keyed by the serialized key of the relationship they load
+
+    Returns:
+        The decorator
+    """
+    def loading_profile_decorator(func):
+        @wraps(func)
+        def func_wrapper(*args, **kwargs):
+            g.loading_profile = options
+            return func(*args, **kwargs)
+        return func_wrapper
+    return loading_profile_decorator
+
+
+def read_replica(func):
+    """ Decorator sending the reads of a request handler to the read replica, if one is configured. Reads made after
+    the request writes go to the primary, but the replica may lag behind writes made by earlier requests, so it must
+    only be used by handlers for which slightly stale data is acceptable.
+
+    Args:
+        func: the request handler
+
+    Returns:
+        The decorated request handler
+    """
+    @wraps(func)
+    def func_wrapper(*args, **kwargs):
+        db.session().use_replica = True
+        return func(*args, **kwargs)
+    return func_wrapper
+
+
+@contextmanager
+def primary_reads():
+    """ Context manager sending the reads made within it to the primary. Process-wide caches are loaded from the
+    primary, so that handlers reading from a lagging replica never roll them back to an older version.
+    """
+    session = db.session()
+    use_replica = session.use_replica
+    session.use_replica = False
+    try:
+        yield
+    finally:
+        session.use_replica = use_replica
+
+
+def profiled(query):
+    """ Applies the loading profile declared for the current request handler to a query. Only the relationships that
+    are serialized for the request's selection are loaded, and only the selected columns of the query's model and of
+    the loaded relationships are read.
+
+    Args:
+        query: the query to apply the loader options to
+
+    Returns: the query with the loader options applied
+
+    """
+    model = query.column_descriptions[0]["type"]
+    selection = request_selection()
+    embedded_keys = serializer.embedded_keys(model, selection)
+    options = []
+    for key, option in g.get("loading_profile", {}).items():
+        if key not in embedded_keys:
+            continue
+        if selection is not None:
+            nested_model = db.inspect(model).relationships[key].mapper.class_
+            names = serializer.selected_columns(nested_model, selection.nested.get(key))
+            if names is not None:
+                option = option.load_only(*(names + [column.key for column in db.inspect(nested_model).primary_key]))
+        options.append(option)
+    return load_selected_columns(query.options(*options), model)
+
+
+def current_user():
+    """ Returns the logged in user's details, as serialized by User.serialize. The details are memoised for the
+    request, and cached across requests for CURRENT_USER_CACHE_TTL seconds, so changes made by other processes
+    (e.g. to the user's privilege) are picked up within that time. The returned dict must not be modified.
+
+    Returns: the user's details, or None if no user is logged in or the user does not exist
+
+    """
+    if "current_user" not in g:
+        email = session.get("username")
+        g.current_user = lookup_user(email) if email is not None else None
+    return g.current_user
+
+
+def lookup_user(email):
+    """ Returns the details of the user with the specified email, as serialized by User.serialize, using the cache
+    described in current_user. The returned dict must not be modified.
+
+    Args:
+        email: the user's email
+
+    Returns: the user's details, or None if the user does not exist
+
+    """
+    user = current_user_cache.get(email)
+    if user is None:
+        user_row = User.query.filter_by(email=email).first()
+        if user_row is not None:
+            user = serializer.to_data(user_row)
+            current_user_cache.set(email, user)
+    return user
+
+
+def google_client():
+    """ Returns the Google OAuth client, which is Flask-Dance's Google session unless GOOGLE_CLIENT is set (e.g. to a
+    local stub for tests and benchmarks). The client must provide the authorized and token attributes and the get
+    method of Flask-Dance's OAuth2Session.
+
+    Returns: the Google OAuth client
+
+    """
+    client = app.config["GOOGLE_CLIENT"]
+    return client if client is not None else google
+
+
+def google_profile_email(client):
+    """ Returns the email of the Google account the client is authorized for. The email is cached against the OAuth
+    access token until GOOGLE_PROFILE_CACHE_TTL seconds have passed or the token expires, whichever is sooner, so
+    repeat visits do not call the Google API.
+
+    Args:
+        client: the authorized Google OAuth client
+
+    Returns: the email
+    Raises:
+        TokenExpiredError: if the token has expired and the email is not cached
+
+    """
+    token = client.token or {}
+    cache_key = None
+    if token.get("access_token") is not None:
+        cache_key = hashlib.sha256(token["access_token"]).hexdigest()
+        email = google_profile_cache.get(cache_key)
+        if email is not None:
+            return email
+    resp = client.get("/plus/v1/people/me")
+    assert resp.ok, resp.text
+    email = resp.json()["emails"][0]["value"]
+    ttl = app.config["GOOGLE_PROFILE_CACHE_TTL"]
+    if token.get("expires_at") is not None:
+        ttl = min(ttl, token["expires_at"] - time.time())
+    if cache_key is not None and ttl > 0:
+        google_profile_cache.set(cache_key, email, ttl)
+    return email
+
+
 @app.errorhandler(401)
 def unauthorized(error):
     return render_template("unauthorized.html"), 401
@@ -233,48 +848,205 @@ def populate_attrs_from_keys(dst, src, keys):
             setattr(dst, key, src[key])
     return dst
 
+
+# Instrumentation
+# ---------------------------------------------------------------
+
+@event.listens_for(Pool, "checkin")
+def record_checkin_time(dbapi_connection, connection_record):
+    connection_record.info["checked_in_at"] = time.time()
+
+
+@event.listens_for(Pool, "checkout")
+def ping_connection(dbapi_connection, connection_record, connection_proxy):
+    # Checks that a pooled connection is still alive before it is used. The ping is made on the DBAPI connection, so
+    # it is not counted in the request statistics, and is skipped for connections used recently. Raising
+    # DisconnectionError has the pool discard the connection and check out a new one.
+    if not app.config["DATABASE_PRE_PING"]:
+        return
+    checked_in_at = connection_record.info.get("checked_in_at")
+    if checked_in_at is None or time.time() - checked_in_at <= app.config["DATABASE_PING_IDLE_TIME"]:
+        return
+    try:
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        finally:
+            cursor.close()
+    except Exception:
+        raise exc.DisconnectionError()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_times", []).append(time.time())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.time() - conn.info["query_start_times"].pop()
+    if has_request_context() and "request_stats" in g:
+        g.request_stats.record_query(statement, elapsed)
+
+
+def record_serialize_time(elapsed):
+    """ Adds time spent serializing a response to the current request's statistics
+
+    Args:
+        elapsed: the time spent, in seconds
+
+    """
+    if has_request_context() and "request_stats" in g:
+        g.request_stats.serialize_time += elapsed
+
+
+@app.before_request
+def assign_request_id():
+    # The id is taken from the X-Request-Id header set by the reverse proxy, if any, and is added to every log record
+    # of the request and returned in the response's X-Request-Id header
+    request_id = request.headers.get("X-Request-Id", "")
+    g.request_id = request_id if REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+
+
+@app.after_request
+def add_request_id_header(response):
+    if "request_id" in g:
+        response.headers["X-Request-Id"] = g.request_id
+    return response
+
+
+REQUEST_ID_PATTERN = re.compile(r"\A[A-Za-z0-9._-]{1,64}\Z")
+
+
+@app.before_request
+def start_request_stats():
+    g.request_start_time = time.time()
+    g.request_stats = metrics.RequestStats(request_id=g.get("request_id"))
+
+
+@app.after_request
+def record_request_stats(response):
+    if "request_stats" not in g:
+        return response
+    # Streamed responses are still running their queries at this point, so they are recorded once fully sent
+    description = "%s %s" % (request.method, request.path)
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    if response.is_streamed:
+        response.response = iter_recording_stats(response.response, description, route, g.request_start_time,
+                                                 g.request_stats)
+    else:
+        finish_request_stats(description, route, g.request_start_time, g.request_stats,
+                             response.calculate_content_length())
+    return response
+
+
+def iter_recording_stats(body, description, route, start_time, stats):
+    """ Wraps a streamed response body to record the request's statistics once it has been fully sent
+
+    Args:
+        body: the iterable response body
+        description: the request method and path
+        route: the route the request was dispatched to
+        start_time: the time the request started
+        stats: the request's statistics
+
+    Returns: a generator yielding the body
+
+    """
+    response_bytes = 0
+    for chunk in body:
+        response_bytes += len(chunk)
+        yield chunk
+    finish_request_stats(description, route, start_time, stats, response_bytes)
+
+
+def finish_request_stats(description, route, start_time, stats, response_bytes):
+    elapsed = time.time() - start_time
+    request_metrics.observe("enactus_request_duration_seconds", route, elapsed)
+    request_metrics.observe("enactus_request_queries", route, stats.query_count)
+    request_metrics.observe("enactus_request_db_seconds", route, stats.db_time)
+    request_metrics.observe("enactus_request_serialize_seconds", route, stats.serialize_time)
+    if response_bytes is not None:
+        request_metrics.observe("enactus_response_bytes", route, response_bytes)
+    if elapsed >= app.config["SLOW_REQUEST_THRESHOLD"]:
+        app.logger.warning("Slow request %s: %.3fs, %d queries taking %.3fs, worst queries:\n%s",
+                           description, elapsed, stats.query_count, stats.db_time,
+                           "\n".join("%.3fs: %s" % query for query in stats.worst_queries()),
+                           extra={"request_id": stats.request_id, "route": route, "duration": elapsed,
+                                  "queries": stats.query_count, "db_time": stats.db_time})
+
+
+@app.after_request
+def compress_response(response):
+    ### Compresses responses with the content coding negotiated by response_encoding
+    # Runs before record_request_stats, so the recorded response sizes are the compressed sizes
+    # Responses smaller than COMPRESSION_MIN_SIZE are sent uncompressed, and streamed responses are compressed
+    # incrementally as they are sent
+    if response.mimetype not in compression.COMPRESSIBLE_MIMETYPES or response.direct_passthrough:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = response_encoding()
+    if encoding is None or response.status_code != 200 or "Content-Encoding" in response.headers:
+        return response
+    level = app.config["COMPRESSION_LEVEL"]
+    if response.is_streamed:
+        response.response = compression.iter_compressed(response.response, encoding, level)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config["COMPRESSION_MIN_SIZE"]:
+            return response
+        response.set_data(compression.compress(data, encoding, level))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
 # Request handlers
 
 
 @app.route("/")
 def index():
-    if not google.authorized:
+    client = google_client()
+    if not client.authorized:
         return redirect(url_for("google.login"))
     try:
-        resp = google.get("/plus/v1/people/me")
+        email = google_profile_email(client)
     except TokenExpiredError:
         return redirect(url_for("google.login"))
-    assert resp.ok, resp.text
-    jsresp = resp.json()
-    email = jsresp["emails"][0]["value"]
-    user = User.query.filter_by(email=email).first()
+    user = lookup_user(email)
     if (user is None):
         return "You are not a registered user on Enactus Learning Platform Alpha"
     session["username"] = email
-    session["privilege"] = user.privilege
+    session["privilege"] = user["privilege"]
     return render_template("index.html")
     #return "You are {name} [{email}] on Google".format(email=email, name=jsresp["displayName"])
 
 
 @app.route("/user/<userid>", methods=["GET"])
 @authorize_check(1)
+@read_replica
 def show_user(userid):
     ### Shows a user's details
     # Any user can view any other user's details
-    user = User.query.filter_by(id=userid).first()
-    if user is None:
+    version = db.session.query(User.version).filter_by(id=userid).scalar()
+    if version is None:
         return error_response(error_codes.NO_SUCH_USER, error_codes.NO_SUCH_USER_STR)
-    return success_response(user)
+    return conditional_response((userid, version),
+                                lambda: success_response(load_selected_columns(User.query.filter_by(id=userid),
+                                                                               User).first()))
 
 
 @app.route("/user", methods=["GET"])
 @authorize_check(1)
 def show_current_user():
     ### Shows the current user's details
-    user = User.query.filter_by(email=session["username"]).first()
+    user = current_user()
     if user is None:
         return error_response(error_codes.NO_SUCH_USER, error_codes.NO_SUCH_USER_STR)
-    return success_response(user)
+    if request_selection() is not None:
+        return success_response(user)
+    # The cached details are encoded as they are, so that their keys are in the same order as in GET /user/<userid>
+    return encoded_success_response(serializer.encoder.encode(user))
 
 
 @app.route("/user", methods=["PUT"])
@@ -291,12 +1063,14 @@ def update_user():
     user = User.query.filter_by(id=userid).first()
     if user is None:
         return error_response(error_codes.NO_SUCH_USER, error_codes.NO_SUCH_USER_STR)
-    if user.email != session["username"] and session["privilege"] <= user.privilege:
+    if user.email != session["username"] and current_user()["privilege"] <= user.privilege:
         return error_response(error_codes.INSUFFICIENT_PRIVILEGE, error_codes.INSUFFICIENT_PRIVILEGE_STR)
     if jsondata.get("display_name", "") == "":
         return error_response(error_codes.DISPLAY_NAME_NOT_SPECIFIED, "Display name must be specified")
     populate_attrs_from_keys(user, jsondata, ["display_name", "quiz_completed", "goals_set", "learning_profile"])
+    user.version = User.version + 1
     db.session.commit()
+    current_user_cache.invalidate(user.email)
     return success_response(user)
 
 
@@ -317,55 +1091,382 @@ def create_user():
     user = User.query.filter_by(email=requested_email).first()
     if user is not None:
         return error_response(error_codes.USER_ALREADY_EXISTS, "User already exists")
+    error = validate_new_user(jsondata, current_user()["privilege"])
+    if error is not None:
+        return error_response(*error)
+    user = User(requested_email, int(jsondata["privilege"]))
+    populate_attrs_from_keys(user, jsondata, ["display_name", "quiz_completed", "goals_set", "learning_profile"])
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(UserScore(user.id, None))
+    db.session.commit()
+    current_user_cache.invalidate(user.email)
+    return success_response(user)
+
+
+def validate_new_user(jsondata, creator_privilege):
+    """ Validates the details of a user to be created, except for whether the user already exists
+
+    Args:
+        jsondata: the user object
+        creator_privilege: the privilege of the user creating the user
+
+    Returns: None if valid, otherwise a tuple of the error code and message
+
+    """
+    if jsondata.get("email", "") == "":
+        return error_codes.EMAIL_NOT_SPECIFIED, "Email must be specified"
     try:
         requested_privilege = int(jsondata.get("privilege", 0))
     except (TypeError, ValueError):
-        return error_response(error_codes.INVALID_PRIVILEGE_LEVEL, "Invalid privilege specified")
+        return error_codes.INVALID_PRIVILEGE_LEVEL, "Invalid privilege specified"
     if requested_privilege < 1 or requested_privilege > 4:
-        return error_response(error_codes.INVALID_PRIVILEGE_LEVEL, "Invalid privilege specified")
-    if session["privilege"] == 3 and requested_privilege > 2:
-        return error_response(error_codes.INSUFFICIENT_PRIVILEGE, error_codes.INSUFFICIENT_PRIVILEGE_STR)
+        return error_codes.INVALID_PRIVILEGE_LEVEL, "Invalid privilege specified"
+    if creator_privilege == 3 and requested_privilege > 2:
+        return error_codes.INSUFFICIENT_PRIVILEGE, error_codes.INSUFFICIENT_PRIVILEGE_STR
     if jsondata.get("display_name", "") == "":
-        return error_response(error_codes.DISPLAY_NAME_NOT_SPECIFIED, "Display name must be specified")
-    user = User(requested_email, requested_privilege)
-    populate_attrs_from_keys(user, jsondata, ["display_name", "quiz_completed", "goals_set", "learning_profile"])
-    db.session.add(user)
-    db.session.commit()
-    return success_response(user)
+        return error_codes.DISPLAY_NAME_NOT_SPECIFIED, "Display name must be specified"
+    if not isinstance(jsondata["display_name"], basestring):
+        return error_codes.INVALID_USER_DETAILS, "Display name must be a string"
+    for key in ["quiz_completed", "goals_set"]:
+        if jsondata.get(key) is not None and not isinstance(jsondata[key], bool):
+            return error_codes.INVALID_USER_DETAILS, "%s must be a boolean" % key
+    if jsondata.get("learning_profile") is not None and not isinstance(jsondata["learning_profile"], basestring):
+        return error_codes.INVALID_USER_DETAILS, "learning_profile must be a string"
+    return None
+
+
+@app.route("/users/bulk", methods=["POST"])
+@authorize_check(3)
+def create_users_bulk():
+    ### Create many new users
+    # Handles POST request to create users. Requires privilege level FF(3) and above
+    # The request body is either a JSON array of user objects, or CSV (Content-Type text/csv) with a header row naming
+    # the user fields. Each user is validated as in POST /user, and users that are invalid or already exist are
+    # skipped. Users are inserted in chunks of BULK_CHUNK_SIZE, each committed separately.
+    # Returns an array of { row, email, success, code, message, id } for each user, in order. If the request body is
+    # malformed, the last result reports the error, and the users from its row onwards are not created.
+    if request.mimetype == "text/csv":
+        records = (csv_user_record(record) for record in ingest.iter_csv_records(request.stream))
+    elif request.mimetype == "application/json":
+        records = ingest.iter_json_array(request.stream)
+    else:
+        abort(400)
+    return stream_success_response(import_users(records, current_user()["privilege"]))
+
+
+def csv_user_record(record):
+    """ Converts the boolean fields of a user parsed from CSV. Empty values are treated as unspecified.
+
+    Args:
+        record: the dict of user fields to values, as strings
+
+    Returns: the user object
+
+    """
+    user = dict((key, value) for key, value in record.items() if value is not None and value != "")
+    for key in ["quiz_completed", "goals_set"]:
+        if key in user:
+            user[key] = user[key].strip().lower() in ["1", "true", "yes"]
+    return user
+
+
+def import_users(records, creator_privilege):
+    """ Validates and inserts users in chunks, checking for existing users with one query per chunk
+
+    Args:
+        records: an iterable of user objects
+        creator_privilege: the privilege of the user creating the users
+
+    Returns: a generator of the result for each user. If a chunk cannot be inserted, it is rolled back and each of its
+        users is reported as failed with DATABASE_ERROR, as the response has already started
+
+    """
+    fields = ["display_name", "quiz_completed", "goals_set", "learning_profile"]
+    rownum = 0
+    try:
+        for chunk in ingest.iter_chunks(records, app.config["BULK_CHUNK_SIZE"]):
+            results = []
+            for record in chunk:
+                error = None
+                if not isinstance(record, dict):
+                    error = (error_codes.INVALID_PARAMETERS, "User must be an object")
+                elif not isinstance(record.get("email", ""), basestring):
+                    error = (error_codes.EMAIL_NOT_SPECIFIED, "Email must be a string")
+                else:
+                    error = validate_new_user(record, creator_privilege)
+                results.append({
+                    "row": rownum,
+                    "email": record.get("email") if isinstance(record, dict) else None,
+                    "success": error is None,
+                    "code": error[0] if error is not None else 0,
+                    "message": error[1] if error is not None else "",
+                    "id": None
+                })
+                rownum += 1
+            emails = [result["email"] for result in results if result["success"]]
+            existing_emails = set()
+            if len(emails) > 0:
+                existing_emails = set(email.lower() for (email,) in
+                                      db.session.query(User.email).filter(User.email.in_(emails)))
+            rows = []
+            for record, result in zip(chunk, results):
+                if not result["success"]:
+                    continue
+                if result["email"].lower() in existing_emails:
+                    result["success"] = False
+                    result["code"] = error_codes.USER_ALREADY_EXISTS
+                    result["message"] = "User already exists"
+                    continue
+                existing_emails.add(result["email"].lower())
+                row = dict((field, record.get(field)) for field in fields)
+                row["email"] = result["email"]
+                row["privilege"] = int(record["privilege"])
+                rows.append(row)
+            if len(rows) > 0:
+                try:
+                    db.session.execute(User.__table__.insert(), rows)
+                    inserted_users = db.session.query(User.email, User.id) \
+                        .filter(User.email.in_([row["email"] for row in rows]))
+                    userids = dict((email.lower(), userid) for (email, userid) in inserted_users)
+                    db.session.execute(UserScore.__table__.insert(),
+                                       [{"user_id": userid, "team_id": None, "points": 0, "completed": 0}
+                                        for userid in userids.values()])
+                    db.session.commit()
+                except exc.SQLAlchemyError:
+                    app.logger.exception("Failed to insert users from row %d", results[0]["row"])
+                    db.session.rollback()
+                    userids = {}
+                    for result in results:
+                        if result["success"]:
+                            result["success"] = False
+                            result["code"] = error_codes.DATABASE_ERROR
+                            result["message"] = "The users of this chunk could not be created"
+                for result in results:
+                    if result["success"]:
+                        result["id"] = userids.get(result["email"].lower())
+                        current_user_cache.invalidate(result["email"])
+            for result in results:
+                yield result
+    except ValueError as e:
+        db.session.rollback()
+        yield {
+            "row": rownum,
+            "email": None,
+            "success": False,
+            "code": error_codes.INVALID_PARAMETERS,
+            "message": "Malformed request body: %s" % e,
+            "id": None
+        }
 
 
 @app.route("/task/<taskid>", methods=["GET"])
 @authorize_check(1)
+@read_replica
 def show_task(taskid):
     ### Show a task details
     # Any user can view any task's details
     # TODO: Check if it is necessary to prevent users from viewing tasks that are unassigned/unavailable
-    task = Task.query.filter_by(id=taskid).first()
-    if task is None:
+    # Task details may be cached by the client for TASK_CACHE_MAX_AGE seconds, but not by shared caches, as they are
+    # only shown to logged in users
+    catalog = task_catalog.get()
+    try:
+        encoded_task = catalog.encoded_tasks.get(int(taskid))
+    except ValueError:
+        encoded_task = None
+    if encoded_task is None:
         return error_response(error_codes.NO_SUCH_TASK, error_codes.NO_SUCH_TASK_STR)
-    return success_response(task)
+    if request_selection() is not None:
+        build_response = lambda: success_response(catalog.tasks[int(taskid)])
+    elif response_encoding() is not None:
+        build_response = lambda: Response(catalog.compressed_envelope(int(taskid), response_encoding()),
+                                          mimetype="application/json",
+                                          headers={"Content-Encoding": response_encoding()})
+    else:
+        build_response = lambda: encoded_success_response(encoded_task)
+    return conditional_response((int(taskid), catalog.change_seqs[int(taskid)]), build_response,
+                                "private, max-age=%d" % app.config["TASK_CACHE_MAX_AGE"])
 
 
 @app.route("/tasks", methods=["GET"])
 @authorize_check(1)
+@read_replica
 def get_task_statuses():
     ### Show tasks that the current user is assigned
-    # Returns an array of taskStatus assigned to the current user
-    user = User.query.filter_by(email=session["username"]).first()
+    # Returns an array of taskStatus assigned to the current user, ordered by task id
+    # Supports keyset pagination: "after" is the task id of the last taskStatus of the previous page, and "limit" is
+    # the maximum number of taskStatus to return
+    try:
+        after, limit = keyset_page_args()
+    except ValueError:
+        return error_response(error_codes.INVALID_PARAMETERS, "after and limit must be integers")
+    user = current_user()
     if user is None:
         abort(400)
-    return success_response(user.task_statuses)
+    return conditional_response(task_statuses_fingerprint(user["id"]),
+                                lambda: stream_success_response(task_statuses_page(user["id"], after, limit)))
+
+
+def task_statuses_page(userid, after, limit):
+    """ Returns the query for a page of a user's taskStatus
+
+    Args:
+        userid: the id of the user
+        after: the task id of the last taskStatus of the previous page, or None for the first page
+        limit: the maximum number of taskStatus to return, or None for no limit
+
+    Returns: a generator of the taskStatus ordered by task id, which fetches them in batches of STREAM_BATCH_SIZE so
+        that memory use does not depend on the size of the page. Query.yield_per is not used, as PyMySQL's default
+        cursor buffers the whole result on the client anyway.
+
+    """
+    # The embedded tasks are read from the task catalog, which is brought up to date once for the whole page
+    task_catalog.get(max_age=0)
+    # The task id is the key of the batches, so it is loaded even if it is not selected
+    query = load_selected_columns(TaskStatus.query.filter_by(user_id=userid), TaskStatus) \
+        .options(db.undefer(TaskStatus.task_id))
+    if after is not None:
+        query = query.filter(TaskStatus.task_id > after)
+    return iter_keyset(query, TaskStatus.task_id, app.config["STREAM_BATCH_SIZE"], limit)
+
+
+@app.route("/user/<userid>/tasks", methods=["GET"])
+@authorize_check(3)
+@read_replica
+def get_task_statuses_of_user(userid):
+    ### Show tasks that are assigned to a specified user
+    # Returns an array of taskStatus that are assigned to the specified user, ordered by task id
+    # Supports keyset pagination: "after" is the task id of the last taskStatus of the previous page, and "limit" is
+    # the maximum number of taskStatus to return
+    try:
+        after, limit = keyset_page_args()
+    except ValueError:
+        return error_response(error_codes.INVALID_PARAMETERS, "after and limit must be integers")
+    userid = db.session.query(User.id).filter_by(id=userid).scalar()
+    if userid is None:
+        return error_response(error_codes.NO_SUCH_USER, error_codes.NO_SUCH_USER_STR)
+    return conditional_response(task_statuses_fingerprint(userid),
+                                lambda: stream_success_response(task_statuses_page(userid, after, limit)))
+
+
+def task_statuses_fingerprint(userid):
+    """ Returns a fingerprint of a user's taskStatus and the tasks embedded in them, for conditional_response.
+    Every write of a taskStatus stamps it with a new change_seq, so the count and maximum change_seq change whenever
+    any of the user's taskStatus does.
+
+    Args:
+        userid: the id of the user
+
+    Returns: the fingerprint
+
+    """
+    count, max_change_seq = db.session.query(db.func.count(TaskStatus.id), db.func.max(TaskStatus.change_seq)) \
+        .filter(TaskStatus.user_id == userid).one()
+    return userid, count, max_change_seq, task_catalog.get(max_age=0).version
+
+@app.route("/tasks/changes", methods=["GET"])
+@authorize_check(1)
+def get_task_status_changes():
+    ### Show the taskStatus of the current user and the tasks that changed since a cursor
+    # "since" is the cursor returned by the previous call. If it is not specified, all of the user's taskStatus are
+    # returned
+    # "wait" is the number of seconds (at most CHANGES_MAX_WAIT) to hold the request until a change occurs if nothing
+    # has changed since the cursor, defaulting to 0. Each held request occupies a worker for that time.
+    # Returns { cursor, task_statuses, tasks }, where task_statuses is an array of the changed taskStatus, tasks is an
+    # array of the changed tasks, and cursor is to be passed as "since" in the next call
+    try:
+        since = request.args.get("since")
+        since = int(since) if since is not None else None
+        wait = min(max(float(request.args.get("wait", 0)), 0), app.config["CHANGES_MAX_WAIT"])
+    except ValueError:
+        return error_response(error_codes.INVALID_PARAMETERS, "since and wait must be numbers")
+    user = current_user()
+    if user is None:
+        abort(400)
+    deadline = time.time() + wait
+    checked_cursor = since
+    while True:
+        cursor = get_cache_version("change_seq")
+        if cursor != checked_cursor:
+            task_statuses = TaskStatus.query.filter(TaskStatus.user_id == user["id"], TaskStatus.change_seq <= cursor)
+            tasks = []
+            if since is not None:
+                task_statuses = task_statuses.filter(TaskStatus.change_seq > since)
+                tasks = Task.query.filter(Task.change_seq > since, Task.change_seq <= cursor).order_by(Task.id).all()
+            task_statuses = task_statuses.order_by(TaskStatus.task_id).all()
+            if len(task_statuses) > 0 or len(tasks) > 0:
+                break
+            checked_cursor = cursor
+        if time.time() >= deadline:
+            task_statuses, tasks = [], []
+            break
+        # End the transaction so that the next check sees changes committed since
+        db.session.rollback()
+        time.sleep(app.config["CHANGES_POLL_INTERVAL"])
+    task_catalog.get(max_age=0)
+    return success_response({"cursor": cursor, "task_statuses": task_statuses, "tasks": tasks})
+
+
+class TaskValidator(object):
+    """ Validates task objects from requests, with the allowed values compiled once
+
+    Args:
+        max_task_type: the maximum task type. Types are clamped to 0 to max_task_type
+        max_category: the maximum category. Categories are clamped to 0 to max_category
+        image_extensions: the allowed image file extensions
+    """
+
+    def __init__(self, max_task_type, max_category, image_extensions):
+        self.max_task_type = max_task_type
+        self.max_category = max_category
+        self.image_url = re.compile(r"\.(?:%s)\Z" % "|".join(re.escape(ext) for ext in image_extensions))
+        self.task_url = re.compile(r"\.html\Z")
+
+    def validate(self, jsondata):
+        """ Validates a task object. Image and task URLs that are not strings are treated as unspecified (None).
+
+        Args:
+            jsondata: the task object
+
+        Returns: a tuple (fields, error). fields is a dict of the task attributes to set, and error is None if the
+            task is valid, otherwise a tuple of the error code and message
 
+        """
+        if jsondata.get("name", "") == "" or jsondata["name"] is None:
+            return None, (error_codes.INVALID_TASK_DETAILS, "Name must be specified")
+        if not isinstance(jsondata["name"], basestring):
+            return None, (error_codes.INVALID_TASK_DETAILS, "Name must be a string")
+        try:
+            max_points = int(jsondata["max_points"])
+            type = int(jsondata["type"])
+            category = int(jsondata["category"])
+        except KeyError:
+            return None, (error_codes.INVALID_TASK_DETAILS, "max_points, type and category must be specified")
+        except (TypeError, ValueError):
+            return None, (error_codes.INVALID_TASK_DETAILS, "Invalid numerical value(s)")
+        if max_points <= 0 or max_points > 10000:
+            return None, (error_codes.INVALID_TASK_DETAILS, "Max points must be between 1 and 10000")
+        fields = {
+            "name": jsondata["name"],
+            "max_points": max_points,
+            "type": min(max(type, 0), self.max_task_type),
+            "category": min(max(category, 0), self.max_category)
+        }
+        if "description" in jsondata:
+            fields["description"] = jsondata["description"]
+        if "image" in jsondata:
+            fields["image"] = jsondata["image"] if isinstance(jsondata["image"], basestring) else None
+            if fields["image"] is not None and self.image_url.search(fields["image"]) is None:
+                return None, (error_codes.INVALID_IMAGE_URL, "Image URL is invalid")
+        if "url" in jsondata:
+            fields["url"] = jsondata["url"] if isinstance(jsondata["url"], basestring) else None
+            if fields["url"] is not None and self.task_url.search(fields["url"]) is None:
+                return None, (error_codes.INVALID_TASK_URL, "Task URL must end with .html")
+        return fields, None
+
+
+task_validator = TaskValidator(constants.MAX_TASK_TYPE, constants.MAX_CATEGORY, constants.ALLOWED_IMAGE_EXTENSIONS)
 
-@app.route("/user/<userid>/tasks", methods=["GET"])
-@authorize_check(3)
-def get_task_statuses_of_user(userid):
-    ### Show tasks that are assigned to a specified user
-    # Returns an array of taskStatus that are assigned to the specified user
-    user = User.query.filter_by(id=userid).first()
-    if user is None:
-        return error_response(error_codes.NO_SUCH_USER, error_codes.NO_SUCH_USER_STR)
-    return success_response(user.task_statuses)
 
 @app.route("/task", methods=["PUT"])
 @authorize_check(3)
@@ -382,42 +1483,17 @@ def update_task():
     task = Task.query.filter_by(id=taskid).first()
     if task is None:
         return error_response(error_codes.NO_SUCH_TASK, error_codes.NO_SUCH_TASK_STR)
-    if "name" not in jsondata or jsondata["name"] == "":
-        return error_response(error_codes.INVALID_TASK_DETAILS, "Name must be specified")
-    try:
-        max_points = int(jsondata["max_points"])
-        type = int(jsondata["type"])
-        category = int(jsondata["category"])
-    except KeyError:
-        return error_response(error_codes.INVALID_TASK_DETAILS, "max_points, type and category must be specified")
-    except (TypeError, ValueError):
-        return error_response(error_codes.INVALID_TASK_DETAILS, "Invalid numerical value(s)")
-    if max_points <= 0 or max_points > 10000:
-        return error_response(error_codes.INVALID_TASK_DETAILS, "Max points must be between 1 and 10000")
-    type = min(max(type, 0), constants.MAX_TASK_TYPE)
-    category = min(max(category, 0), constants.MAX_CATEGORY)
-    if "image" in jsondata:
-        try:
-            tokens = jsondata["image"].split(".")
-            if len(tokens) == 1 or tokens[-1] not in constants.ALLOWED_IMAGE_EXTENSIONS:
-                return error_response(error_codes.INVALID_IMAGE_URL, "Image URL is invalid")
-        except AttributeError:
-            task.image = None
-    if "url" in jsondata:
-        try:
-            tokens = jsondata["url"].split(".")
-            if len(tokens) == 1 or tokens[-1] != "html":
-                return error_response(error_codes.INVALID_TASK_URL, "Task URL must end with .html")
-        except AttributeError:
-            task.url = None
-    task.max_points = max_points
-    task.type = type
-    task.category = category
-    populate_attrs_from_keys(task, jsondata, ["name", "description", "image", "url"])
+    fields, error = task_validator.validate(jsondata)
+    if error is not None:
+        return error_response(*error)
+    populate_attrs_from_keys(task, fields, fields.keys())
     try:
+        bump_cache_version("task_catalog")
+        task.change_seq = next_change_seq()
         db.session.commit()
     except IntegrityError:
         return error_response(error_codes.DUPLICATE_TASK_NAME, "A task with that name already exists")
+    task_catalog.invalidate()
     return success_response(task)
 
 
@@ -432,50 +1508,181 @@ def create_task():
     jsondata = request.get_json()
     if jsondata is None:
         abort(400)
-    if "name" not in jsondata:
-        return error_response(error_codes.INVALID_TASK_DETAILS, "Must specify task name")
-    taskname = jsondata["name"]
-    task = Task.query.filter_by(name=taskname).first()
+    fields, error = task_validator.validate(jsondata)
+    if error is not None:
+        return error_response(*error)
+    task = Task.query.filter_by(name=fields["name"]).first()
     if task is not None:
         return error_response(error_codes.DUPLICATE_TASK_NAME, "Task with that name already exists")
-    try:
-        max_points = int(jsondata["max_points"])
-        type = int(jsondata["type"])
-        category = int(jsondata["category"])
-    except KeyError:
-        return error_response(error_codes.INVALID_TASK_DETAILS, "max_points, type and category must be specified")
-    except (TypeError, ValueError):
-        return error_response(error_codes.INVALID_TASK_DETAILS, "Invalid numerical value(s)")
-    if max_points <= 0 or max_points > 10000:
-        return error_response(error_codes.INVALID_TASK_DETAILS, "Max points must be between 1 and 10000")
-    type = min(max(type, 0), constants.MAX_TASK_TYPE)
-    category = min(max(category, 0), constants.MAX_CATEGORY)
     task = Task()
-    if "image" in jsondata:
-        try:
-            tokens = jsondata["image"].split(".")
-            if len(tokens) == 1 or tokens[-1] not in constants.ALLOWED_IMAGE_EXTENSIONS:
-                return error_response(error_codes.INVALID_IMAGE_URL, "Image URL is invalid")
-        except AttributeError:
-            task.image = None
-    if "url" in jsondata:
-        try:
-            tokens = jsondata["url"].split(".")
-            if len(tokens) == 1 or tokens[-1] != "html":
-                return error_response(error_codes.INVALID_TASK_URL, "Task URL must end with .html")
-        except AttributeError:
-            task.url = None
-    task.max_points = max_points
-    task.type = type
-    task.category = category
-    populate_attrs_from_keys(task, jsondata, ["name", "description", "image", "url"])
+    populate_attrs_from_keys(task, fields, fields.keys())
     try:
         db.session.add(task)
+        bump_cache_version("task_catalog")
+        task.change_seq = next_change_seq()
         db.session.commit()
     except IntegrityError:
         return error_response(error_codes.DUPLICATE_TASK_NAME, "A task with that name already exists")
+    task_catalog.invalidate()
     return success_response(task)
 
+
+@app.route("/task/<taskid>/submission", methods=["POST"])
+@authorize_check(1)
+def submit_task_file(taskid):
+    ### Uploads the current user's file submission for a task
+    # The task must be a file submission task that is available to the user, or already submitted
+    # The request body is the raw file content, which is streamed to disk in chunks of UPLOAD_CHUNK_SIZE
+    # Uploads can be split across requests: "upload_id" identifies the upload (a new one is returned if not specified),
+    # "offset" is the number of bytes already sent, and "complete" is 0 for all but the last part (defaults to 1)
+    # Identical files are stored once, under the sha256 of their content
+    # Uploads that receive no data for UPLOAD_EXPIRY seconds expire, and resuming them fails with NO_SUCH_UPLOAD
+    # Returns { upload_id, offset, complete, submission } where offset is the number of bytes received, and
+    # submission is the created submission once the upload is complete. The taskStatus is then set to submitted.
+    user = current_user()
+    if user is None:
+        abort(400)
+    try:
+        taskid = int(taskid)
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return error_response(error_codes.INVALID_PARAMETERS, "offset must be an integer")
+    complete = request.args.get("complete", "1") not in ["0", "false"]
+    upload_id = request.args.get("upload_id")
+    if upload_id is None:
+        if offset != 0:
+            return error_response(error_codes.INVALID_UPLOAD, "upload_id must be specified to resume an upload")
+        upload_id = submission_store.new_upload_id()
+    task = task_catalog.get().tasks.get(taskid)
+    if task is None:
+        return error_response(error_codes.NO_SUCH_TASK, error_codes.NO_SUCH_TASK_STR)
+    if task["type"] != constants.TASK_FILE_SUBMISSION:
+        return error_response(error_codes.TASK_NOT_SUBMITTABLE, "Task does not accept file submissions")
+    status = db.session.query(TaskStatus.status).filter_by(user_id=user["id"], task_id=taskid).scalar()
+    if status not in [constants.STATUS_AVAILABLE, constants.STATUS_SUBMITTED]:
+        return error_response(error_codes.TASK_NOT_SUBMITTABLE, "Task is not open for submission")
+    # End the transaction so that no database connection is held while the body is received
+    db.session.rollback()
+    owner = "%d-%d" % (user["id"], taskid)
+    try:
+        size, digest = submission_store.append(owner, upload_id, offset, request.stream)
+    except uploads.UploadTooLarge as e:
+        return error_response(error_codes.SUBMISSION_TOO_LARGE, str(e))
+    except uploads.NoSuchUpload as e:
+        return error_response(error_codes.NO_SUCH_UPLOAD, str(e))
+    except uploads.UploadError as e:
+        return error_response(error_codes.INVALID_UPLOAD, str(e))
+    if not complete:
+        return success_response({"upload_id": upload_id, "offset": size, "complete": False, "submission": None})
+    # The status is updated before the file is moved into the store, so that no file is stored for a submission that
+    # is rejected
+    taskstatus = TaskStatus.__table__
+    updated = db.session.execute(
+        taskstatus.update()
+        .where(db.and_(taskstatus.c.user_id == user["id"], taskstatus.c.task_id == taskid,
+                       taskstatus.c.status.in_([constants.STATUS_AVAILABLE, constants.STATUS_SUBMITTED])))
+        .values(status=constants.STATUS_SUBMITTED, version=taskstatus.c.version + 1,
+                change_seq=next_change_seq())).rowcount
+    if updated == 0:
+        db.session.rollback()
+        submission_store.discard(owner, upload_id)
+        return error_response(error_codes.TASK_NOT_SUBMITTABLE, "Task is not open for submission")
+    submission_store.complete(owner, upload_id, digest)
+    submission = Submission(user["id"], taskid, digest, size)
+    db.session.add(submission)
+    db.session.commit()
+    return success_response({"upload_id": upload_id, "offset": size, "complete": True, "submission": submission})
+
+
+@app.cli.command("clean-uploads")
+def clean_uploads_command():
+    """Removes the partial files of expired submission uploads."""
+    click.echo("Removed %d expired uploads" % submission_store.remove_expired())
+
+
+@app.route("/tasks/bulk", methods=["POST"])
+@authorize_check(3)
+def upsert_tasks_bulk():
+    ### Creates or updates many tasks, keyed by name
+    # Requires privilege level FF(3) and above
+    # Expects a json array of task objects, each validated as in POST /task. A task whose name matches an existing
+    # task (case-insensitively) updates that task, otherwise a new task is created. Invalid tasks, and tasks whose
+    # name appears earlier in the array, are skipped. All other tasks are written in chunks of BULK_CHUNK_SIZE, each
+    # committed separately. If a chunk conflicts with a task created concurrently, none of its tasks are written and
+    # they are reported with DUPLICATE_TASK_NAME.
+    # Returns an array of { index, name, success, code, message, id, created } for each task, in order
+    jsondata = request.get_json()
+    if not isinstance(jsondata, list):
+        abort(400)
+    results = []
+    valid_fields = []
+    names = set()
+    for index, item in enumerate(jsondata):
+        fields, error = None, (error_codes.INVALID_PARAMETERS, "Task must be an object")
+        if isinstance(item, dict):
+            fields, error = task_validator.validate(item)
+        if error is None and fields["name"].lower() in names:
+            fields, error = None, (error_codes.DUPLICATE_TASK_NAME, "Task name is repeated")
+        results.append({
+            "index": index,
+            "name": item.get("name") if isinstance(item, dict) else None,
+            "success": error is None,
+            "code": error[0] if error is not None else 0,
+            "message": error[1] if error is not None else "",
+            "id": None,
+            "created": False
+        })
+        if error is None:
+            names.add(fields["name"].lower())
+            valid_fields.append((results[-1], fields))
+    for chunk in chunks(valid_fields, app.config["BULK_CHUNK_SIZE"]):
+        upsert_tasks(chunk)
+    if len(valid_fields) > 0:
+        task_catalog.invalidate()
+    return success_response(results)
+
+
+def upsert_tasks(valid_fields):
+    """ Creates or updates tasks keyed by their names, compared case-insensitively, and commits, recording the outcome
+    in each task's result. If the tasks conflict with tasks created concurrently, the transaction is rolled back and
+    every task is reported as a duplicate.
+
+    Args:
+        valid_fields: a list of tuples of the result and the validated fields of each task, whose names are unique
+
+    """
+    lowered_names = [fields["name"].lower() for result, fields in valid_fields]
+    existing_tasks = dict((task.name.lower(), task) for task in
+                          Task.query.filter(db.func.lower(Task.name).in_(lowered_names)))
+    tasks = []
+    for result, fields in valid_fields:
+        task = existing_tasks.get(fields["name"].lower())
+        created = task is None
+        if created:
+            task = Task()
+            db.session.add(task)
+        populate_attrs_from_keys(task, fields, fields.keys())
+        tasks.append((result, task, created))
+    try:
+        bump_cache_version("task_catalog")
+        change_seq = next_change_seq()
+        for result, task, created in tasks:
+            task.change_seq = change_seq
+        db.session.flush()
+        ids = [task.id for result, task, created in tasks]
+        db.session.commit()
+    except exc.IntegrityError:
+        db.session.rollback()
+        for result, fields in valid_fields:
+            result["success"] = False
+            result["code"] = error_codes.DUPLICATE_TASK_NAME
+            result["message"] = "A task with the same name was created concurrently"
+        return
+    for (result, task, created), taskid in zip(tasks, ids):
+        result["id"] = taskid
+        result["created"] = created
+
+
 @app.route("/assign", methods=["POST"])
 @authorize_check(3)
 def assign_tasks():
@@ -485,6 +1692,8 @@ def assign_tasks():
     # Ignores user and task ids that don't exist.
     # For each user/task pair, will set taskStatus to "available" if currently in the "unavailable"
     # or nonexistent state
+    # If "background" is true in the json object, the assignment is run as a background job and the job is returned.
+    # Poll /jobs/<jobid> for its progress and result.
     jsondata = request.get_json()
     if jsondata is None:
         abort(400)
@@ -514,8 +1723,10 @@ def assign_tasks():
             tasks.append(int(jsondata["tasks"]))
         except ValueError:
             return error_response(error_codes.INVALID_PARAMETERS, "tasks must be an id or array of ids")
-    assign_tasks_helper(users, tasks)
-    return success_response("")
+    if jsondata.get("background", False):
+        return success_response(enqueue_job("assign", {"users": users, "tasks": tasks}))
+    result = assign_tasks_helper(users, tasks)
+    return success_response(result)
 
 @app.route("/assignAll", methods=["POST"])
 @authorize_check(3)
@@ -526,6 +1737,8 @@ def assign_all_tasks():
     # Ignores user ids that don't exist.
     # For each user/task pair, will set taskStatus to "available" if currently in the "unavailable"
     # or nonexistent state
+    # If "background" is true in the json object, the assignment is run as a background job and the job is returned.
+    # Poll /jobs/<jobid> for its progress and result.
     jsondata = request.get_json()
     if jsondata is None:
         abort(400)
@@ -544,67 +1757,479 @@ def assign_all_tasks():
             users.append(int(jsondata["users"]))
         except ValueError:
             return error_response(error_codes.INVALID_PARAMETERS, "users must be an id or array of ids")
-    for result in Task.query.all():
-        tasks.append(result.id)
-    assign_tasks_helper(users, tasks)
-    return success_response("")
+    if jsondata.get("background", False):
+        return success_response(enqueue_job("assign", {"users": users, "all_tasks": True}))
+    tasks.extend(task_catalog.get().ids)
+    result = assign_tasks_helper(users, tasks)
+    return success_response(result)
+
+
+def insert_ignore(table):
+    """ Returns an INSERT statement for the table that silently skips rows violating a unique constraint
+
+    Args:
+        table: the table to insert into
+
+    Returns: the INSERT statement, prefixed for the current database dialect
+
+    """
+    if db.engine.dialect.name == "sqlite":
+        return table.insert().prefix_with("OR IGNORE")
+    return table.insert().prefix_with("IGNORE")
+
+
+def chunks(items, size):
+    """ Splits a list into consecutive chunks of at most the specified size
+
+    Args:
+        items: the list to split
+        size: the maximum chunk size
+
+    Returns: a generator of lists
+
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
 
-def assign_tasks_helper(userids, taskids):
+def assign_tasks_helper(userids, taskids, progress=None):
     """
     Helper method to assign specified tasks to specified users
+    Works on chunks of users so that each chunk covers at most ASSIGN_BATCH_SIZE user/task pairs. For each chunk,
+    existing "unavailable" task statuses are promoted with a single UPDATE, and the missing user/task pairs are
+    computed and inserted in SQL with a single INSERT ... SELECT, relying on the unique_user_task constraint to
+    skip rows inserted concurrently. The rows are written with PENDING_CHANGE_SEQ, and the chunk's change sequence
+    number is only allocated and stamped on them once they are written, so that it is held for as short as possible
+    and not allocated at all for chunks that change nothing.
     :param userids: a list of user ids to assign the tasks to
     :param taskids: a list of task ids to assign to the users
-    :return: true if successful
+    :param progress: optional callable invoked after each chunk with the number of user/task pairs processed so far.
+    If specified, it is responsible for committing the chunk.
+    :return: a dict with the number of task statuses inserted and promoted
     """
-    users = User.query.filter(User.id.in_(userids)).all()
-    tasks = Task.query.filter(Task.id.in_(taskids)).all()
-    for user in users:
-        existing_taskids = {}
-        for taskstatus in user.task_statuses:
-            existing_taskids[taskstatus.task_id] = taskstatus
-        for task in tasks:
-            if task.id in existing_taskids:
-                taskstatus = existing_taskids[task.id]
-                if taskstatus.status == constants.STATUS_UNAVAILABLE:
-                    taskstatus.status = constants.STATUS_AVAILABLE
-            else:
-                taskstatus = TaskStatus()
-                taskstatus.task = task
-                taskstatus.user = user
-                taskstatus.task_id = task.id
-                taskstatus.user_id = user.id
-                taskstatus.status = constants.STATUS_AVAILABLE
-                taskstatus.points = 0
-                db.session.add(taskstatus)
+    result = {"inserted": 0, "promoted": 0}
+    userids = sorted(set(userids))
+    taskids = sorted(set(taskids))
+    if len(userids) == 0 or len(taskids) == 0:
+        return result
+    users_per_chunk = max(1, app.config["ASSIGN_BATCH_SIZE"] // len(taskids))
+    taskstatus = TaskStatus.__table__
+    processed = 0
+    for chunk in chunks(userids, users_per_chunk):
+        promoted = db.session.execute(
+            taskstatus.update()
+            .where(taskstatus.c.user_id.in_(chunk))
+            .where(taskstatus.c.task_id.in_(taskids))
+            .where(taskstatus.c.status == constants.STATUS_UNAVAILABLE)
+            .values(status=constants.STATUS_AVAILABLE, version=taskstatus.c.version + 1,
+                    change_seq=PENDING_CHANGE_SEQ))
+        missing_pairs = db.select([
+            User.__table__.c.id,
+            Task.__table__.c.id,
+            db.literal(constants.STATUS_AVAILABLE),
+            db.literal(0),
+            db.literal(PENDING_CHANGE_SEQ),
+            db.literal(datetime.datetime.utcnow())
+        ]).where(User.__table__.c.id.in_(chunk)) \
+            .where(Task.__table__.c.id.in_(taskids)) \
+            .where(~db.exists().where(db.and_(taskstatus.c.user_id == User.__table__.c.id,
+                                              taskstatus.c.task_id == Task.__table__.c.id)))
+        inserted = db.session.execute(
+            insert_ignore(taskstatus).from_select(["user_id", "task_id", "status", "points", "change_seq", "updated_at"],
+                                                   missing_pairs))
+        if promoted.rowcount > 0 or inserted.rowcount > 0:
+            db.session.execute(
+                taskstatus.update()
+                .where(taskstatus.c.user_id.in_(chunk))
+                .where(taskstatus.c.change_seq == PENDING_CHANGE_SEQ)
+                .values(change_seq=next_change_seq()))
+        result["promoted"] += promoted.rowcount
+        result["inserted"] += inserted.rowcount
+        processed += len(chunk) * len(taskids)
+        if progress is not None:
+            progress(processed)
+    db.session.commit()
+    return result
+
+
+# Background jobs
+# ---------------------------------------------------------------
+
+def enqueue_job(kind, params):
+    """ Persists a new job and submits it to the background worker pool
+
+    Args:
+        kind: the kind of job, used to look up its runner in JOB_RUNNERS
+        params: a json-serializable dict of parameters for the runner
+
+    Returns: the queued job
+
+    """
+    job = Job()
+    job.kind = kind
+    job.status = constants.JOB_QUEUED
+    job.params = json.dumps(params)
+    job.created_by = session.get("username")
+    db.session.add(job)
+    db.session.commit()
+    job_pool.submit(run_job, job.id)
+    return job
+
+
+def run_job(jobid):
+    """ Runs a queued job in the current (background) thread, recording its progress and result in the job table
+
+    Args:
+        jobid: the id of the job to run
+
+    """
+    with app.app_context():
+        # The job is claimed atomically, as it may have been submitted by more than one process (see recover_jobs)
+        claimed = Job.query.filter_by(id=jobid, status=constants.JOB_QUEUED) \
+            .update({Job.status: constants.JOB_RUNNING}, synchronize_session=False)
+        db.session.commit()
+        if claimed == 0:
+            return
+        job = Job.query.filter_by(id=jobid).first()
+
+        def progress(processed):
+            job.processed = processed
+            db.session.commit()
+
+        try:
+            result = JOB_RUNNERS[job.kind](job, json.loads(job.params), progress)
+        except Exception:
+            app.logger.exception("Job %d failed", jobid)
+            db.session.rollback()
+            job.status = constants.JOB_FAILED
+            job.result = json.dumps("Job failed due to an internal error")
+            db.session.commit()
+            return
+        job.status = constants.JOB_COMPLETED
+        job.processed = job.total
+        job.result = json.dumps(result)
+        db.session.commit()
+
+
+def run_assign_job(job, params, progress):
+    """ Job runner for /assign and /assignAll. Commits after every chunk of assignments.
+
+    Args:
+        job: the running job
+        params: a dict containing "users", and either "tasks" or "all_tasks"
+        progress: the progress callback to pass to assign_tasks_helper
+
+    Returns: the counts returned by assign_tasks_helper
+
+    """
+    userids = set(params["users"])
+    if params.get("all_tasks", False):
+        taskids = set(task_catalog.get(max_age=0).ids)
+    else:
+        taskids = set(params["tasks"])
+    job.total = len(userids) * len(taskids)
     db.session.commit()
+    return assign_tasks_helper(list(userids), list(taskids), progress)
+
+
+JOB_RUNNERS = {
+    "assign": run_assign_job
+}
+
+
+def recover_jobs(submit=None):
+    """ Recovers the jobs left behind when the worker threads of a process stopped, e.g. because it was restarted.
+    Queued jobs are submitted again. Running jobs are marked as failed, as their progress is unknown, and commits.
+
+    Args:
+        submit: optional function taking run_job and a job id, which runs the job. Defaults to submitting it to the
+            worker pool
+
+    Returns: a tuple of the number of jobs resubmitted and the number of jobs failed
+
+    """
+    if submit is None:
+        submit = job_pool.submit
+    failed = Job.query.filter_by(status=constants.JOB_RUNNING) \
+        .update({Job.status: constants.JOB_FAILED, Job.result: json.dumps("Job was interrupted by a server restart")},
+                synchronize_session=False)
+    jobids = [jobid for (jobid,) in db.session.query(Job.id).filter_by(status=constants.JOB_QUEUED).order_by(Job.id)]
+    db.session.commit()
+    for jobid in jobids:
+        submit(run_job, jobid)
+    return len(jobids), failed
+
+
+@app.before_first_request
+def recover_jobs_on_start():
+    if app.config["RECOVER_JOBS_ON_START"]:
+        resubmitted, failed = recover_jobs()
+        if resubmitted > 0 or failed > 0:
+            app.logger.warning("Resubmitted %d queued jobs and failed %d interrupted jobs", resubmitted, failed)
+
+
+@app.cli.command("recover-jobs")
+def recover_jobs_command():
+    """Runs queued jobs and fails the jobs interrupted by a restart."""
+    # The worker pool's daemon threads would be stopped when the command exits, so the jobs are run by the command
+    resubmitted, failed = recover_jobs(lambda run, jobid: run(jobid))
+    click.echo("Ran %d queued jobs and failed %d interrupted jobs" % (resubmitted, failed))
+
+
+@app.route("/jobs/<jobid>", methods=["GET"])
+@authorize_check(3)
+def show_job(jobid):
+    ### Show a background job's progress
+    # Requires privilege level FF(3) and above
+    # Returns the job, including the number of user/task pairs processed, the total, and its result once completed
+    job = Job.query.filter_by(id=jobid).first()
+    if job is None:
+        return error_response(error_codes.NO_SUCH_JOB, error_codes.NO_SUCH_JOB_STR)
+    return success_response(job)
+
+
+@app.route("/grade", methods=["POST"])
+@authorize_check(3)
+def grade_task_statuses():
+    ### Grades many taskStatus at once
+    # Requires privilege level FF(3) and above
+    # Expects a json array of { user_id, task_id, status, points, version }. status must be available, submitted or
+    # completed, and points must be between 0 and the task's max_points. version is optional: if specified, the
+    # taskStatus is only updated if its version still matches, otherwise the item is reported as a conflict.
+    # Items are applied in chunks of GRADE_CHUNK_SIZE, each committed separately. Items that are invalid, conflict, or
+    # refer to tasks that are not assigned to the user are skipped.
+    # Returns an array of { index, user_id, task_id, success, code, message, version } for each item, in order,
+    # where version is the taskStatus's version after the update
+    jsondata = request.get_json()
+    if not isinstance(jsondata, list):
+        abort(400)
+    catalog = task_catalog.get(max_age=0)
+    results = []
+    grades = []
+    pairs = set()
+    for index, item in enumerate(jsondata):
+        result = {
+            "index": index,
+            "user_id": None,
+            "task_id": None,
+            "success": False,
+            "code": 0,
+            "message": "",
+            "version": None
+        }
+        results.append(result)
+        try:
+            grade = {
+                "user_id": int(item["user_id"]),
+                "task_id": int(item["task_id"]),
+                "status": int(item["status"]),
+                "points": int(item["points"]),
+                "version": int(item["version"]) if item.get("version") is not None else None,
+                "result": result
+            }
+        except (KeyError, TypeError, ValueError, AttributeError):
+            result["code"] = error_codes.INVALID_GRADE
+            result["message"] = "user_id, task_id, status and points must be specified as integers"
+            continue
+        result["user_id"] = grade["user_id"]
+        result["task_id"] = grade["task_id"]
+        task = catalog.tasks.get(grade["task_id"])
+        if task is None:
+            result["code"] = error_codes.NO_SUCH_TASK
+            result["message"] = error_codes.NO_SUCH_TASK_STR
+        elif grade["status"] not in [constants.STATUS_AVAILABLE, constants.STATUS_SUBMITTED,
+                                     constants.STATUS_COMPLETED]:
+            result["code"] = error_codes.INVALID_GRADE
+            result["message"] = "Invalid status specified"
+        elif grade["points"] < 0 or grade["points"] > task["max_points"]:
+            result["code"] = error_codes.INVALID_GRADE
+            result["message"] = "Points must be between 0 and %d" % task["max_points"]
+        elif (grade["user_id"], grade["task_id"]) in pairs:
+            result["code"] = error_codes.INVALID_GRADE
+            result["message"] = "Task status is repeated"
+        else:
+            pairs.add((grade["user_id"], grade["task_id"]))
+            grades.append(grade)
+    grades.sort(key=lambda grade: (grade["user_id"], grade["task_id"]))
+    for chunk in chunks(grades, app.config["GRADE_CHUNK_SIZE"]):
+        # A chunk is retried when a taskStatus it grades is modified concurrently, which means that another
+        # transaction has committed in the meantime
+        while not apply_grades(chunk):
+            db.session.rollback()
+        db.session.commit()
+    return success_response(results)
+
+
+def apply_grades(grades):
+    """ Applies grades to taskStatus with one SELECT and one UPDATE, in the current transaction, and records the
+    outcome in each grade's result. No rows are locked while the grades are checked: the UPDATE only applies if the
+    version of every graded taskStatus is unchanged since the SELECT.
+
+    Args:
+        grades: a list of dicts of user_id, task_id, status, points, version (or None) and result, sorted by user_id
+
+    Returns: whether the grades were applied, or False if a graded taskStatus was modified concurrently, in which
+        case the transaction must be rolled back and the grades applied again
+
+    """
+    taskstatus = TaskStatus.__table__
+    # Only the graded pairs are read, grouped by user so that each group is a range of the unique_user_task index
+    pairs = [db.and_(TaskStatus.user_id == userid, TaskStatus.task_id.in_([grade["task_id"] for grade in group]))
+             for userid, group in itertools.groupby(grades, key=lambda grade: grade["user_id"])]
+    current = {}
+    for row in db.session.query(TaskStatus.id, TaskStatus.user_id, TaskStatus.task_id, TaskStatus.status,
+                                TaskStatus.points, TaskStatus.version).filter(db.or_(*pairs)):
+        current[(row.user_id, row.task_id)] = row
+    updates = []
+    deltas = {}
+    for grade in grades:
+        result = grade["result"]
+        result.update({"success": False, "code": 0, "message": "", "version": None})
+        row = current.get((grade["user_id"], grade["task_id"]))
+        if row is None or row.status == constants.STATUS_UNAVAILABLE:
+            result["code"] = error_codes.TASK_NOT_ASSIGNED
+            result["message"] = "Task is not assigned to the user"
+            continue
+        if grade["version"] is not None and grade["version"] != row.version:
+            result["code"] = error_codes.VERSION_CONFLICT
+            result["message"] = "Task status has been modified"
+            result["version"] = row.version
+            continue
+        updates.append((row, grade))
+        result["success"] = True
+        result["version"] = row.version + 1
+        completed = int(grade["status"] == constants.STATUS_COMPLETED) - int(row.status == constants.STATUS_COMPLETED)
+        points, previous_completed = deltas.get(row.user_id, (0, 0))
+        deltas[row.user_id] = (points + grade["points"] - row.points, previous_completed + completed)
+    if len(updates) == 0:
+        return True
+    updated = db.session.execute(
+        taskstatus.update()
+        .where(taskstatus.c.id.in_([row.id for row, grade in updates]))
+        .where(taskstatus.c.version == db.case([(row.id, row.version) for row, grade in updates],
+                                               value=taskstatus.c.id))
+        .values(status=db.case([(row.id, grade["status"]) for row, grade in updates], value=taskstatus.c.id),
+                points=db.case([(row.id, grade["points"]) for row, grade in updates], value=taskstatus.c.id),
+                version=taskstatus.c.version + 1,
+                change_seq=next_change_seq())).rowcount
+    if updated != len(updates):
+        return False
+    apply_score_deltas(deltas)
     return True
 
 
 @app.route("/team/<teamid>", methods=["GET"])
 @authorize_check(1)
+@read_replica
+@loading_profile(users=db.joinedload(Team.users))
 def show_team(teamid):
     ### Show a team's details
     # Any user can view any team's details
     # Returns the Team object corresponding to the id
-    team = Team.query.filter_by(id=teamid).first()
-    if team is None:
+    # The team's version is bumped whenever its details or membership change, and its members' versions whenever
+    # their details change
+    fingerprint = db.session.query(Team.id, Team.version, db.func.count(User.id), db.func.sum(User.version)) \
+        .outerjoin(User, User.team_id == Team.id).filter(Team.id == teamid).group_by(Team.id, Team.version).first()
+    if fingerprint is None:
         return error_response(error_codes.NO_SUCH_TEAM, error_codes.NO_SUCH_TEAM_STR)
-    return success_response(team)
+    return conditional_response(tuple(fingerprint),
+                                lambda: success_response(profiled(Team.query.filter_by(id=teamid)).first()))
 
 
 @app.route("/teams", methods=["GET"])
 @authorize_check(1)
+@read_replica
+@loading_profile(users=db.subqueryload(Team.users))
 def get_teams():
     ### Searches for all teams.
     # Any user can search for all teams
     # If parameter "name" is specified in the request args, then the list of teams will be filtered and
-    # only those containing the specified "name" will be returned
+    # only those containing the specified "name" (case-insensitive) will be returned
+    # Supports keyset pagination: "after" is the id of the last team of the previous page, and "limit" is the maximum
+    # number of teams to return
     #
-    # Returns an array of Teams matching the criteria
+    # Returns an array of Teams matching the criteria, ordered by id
     search_name = request.args.get("name", "")
-    teams = Team.query.filter(Team.name.like("%" + search_name + "%"))
-    return success_response(teams)
+    try:
+        after, limit = keyset_page_args()
+    except ValueError:
+        return error_response(error_codes.INVALID_PARAMETERS, "after and limit must be integers")
+    # The fingerprint covers all teams and team members, as versions are only ever incremented
+    fingerprint = tuple(db.session.query(db.func.count(Team.id), db.func.max(Team.id), db.func.sum(Team.version))
+                        .one()) + \
+        tuple(db.session.query(db.func.count(User.id), db.func.sum(User.version)).filter(User.team_id.isnot(None)).one())
+    return conditional_response(fingerprint, lambda: teams_response(search_name, after, limit))
+
+
+def teams_response(search_name, after, limit):
+    """ Returns the streamed response of GET /teams
+
+    Args:
+        search_name: the text to search team names for, or "" to return all teams
+        after: the id of the last team of the previous page, or None for the first page
+        limit: the maximum number of teams to return, or None for no limit
+
+    Returns: the streamed successful JSON HTTP response
+
+    """
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+    query = profiled(Team.query)
+    if search_name != "":
+        teamids = sorted(get_team_name_index().search(search_name))
+        if after is not None:
+            teamids = teamids[bisect.bisect_right(teamids, after):]
+        if limit is not None:
+            teamids = teamids[:limit]
+        return stream_success_response(iter_by_keys(query, Team.id, teamids, batch_size))
+    if after is not None:
+        query = query.filter(Team.id > after)
+    return stream_success_response(iter_keyset(query, Team.id, batch_size, limit))
+
+
+def get_team_name_index():
+    """ Returns the team name index, rebuilding it from the database if it is older than TEAM_INDEX_MAX_AGE.
+    The index is kept in sync with the teams created, renamed and deleted by this process, and the periodic rebuild
+    picks up the changes made by other processes.
+
+    Returns: the team name index
+
+    """
+    built_at = team_name_index.built_at
+    if built_at is None or time.time() - built_at > app.config["TEAM_INDEX_MAX_AGE"]:
+        team_name_index.rebuild(db.session.query(Team.id, Team.name))
+    return team_name_index
+
+
+def parse_userids(jsondata):
+    """ Parses the "userids" array of a team object
+
+    Args:
+        jsondata: the team object
+
+    Returns: the set of user ids
+    Raises:
+        ValueError: if userids is not an array of ids
+
+    """
+    try:
+        return set(int(id) for id in jsondata["userids"])
+    except TypeError:
+        raise ValueError("userids must be an array of ids")
+
+
+def team_data(team, members):
+    """ Serializes a team with the specified members, without loading the team's users
+
+    Args:
+        team: the team
+        members: the serialized members of the team
+
+    Returns: the serialized team
+
+    """
+    data = serialize_team_without_users(team)
+    data["users"] = sorted(members, key=lambda user: user["id"])
+    return data
 
 
 @app.route("/team", methods=["POST"])
@@ -622,49 +2247,78 @@ def create_team():
         abort(400)
     if "name" not in jsondata or jsondata["name"] == "" or jsondata["name"] is None:
         return error_response(error_codes.TEAM_NAME_NOT_SPECIFIED, "Must specify team name")
+    error = validate_team_details(jsondata)
+    if error is not None:
+        return error_response(*error)
     teamname = jsondata["name"]
     team = Team.query.filter_by(name=teamname).first()
     if team is not None:
         return error_response(error_codes.TEAM_ALREADY_EXISTS, "Team with that name already exists")
-    userids = []
+    userids = set()
+    users = []
     if "userids" in jsondata:
         try:
-            for id in jsondata["userids"]:
-                userids.append(id)
-        except (TypeError, ValueError):
+            userids = parse_userids(jsondata)
+        except ValueError:
             return error_response(error_codes.INVALID_PARAMETERS, "userids must be an array of ids")
-        userids = list(set(userids))
-        users = User.query.filter(User.id.in_(userids)).all()
+        if len(userids) > 0:
+            users = User.query.filter(User.id.in_(userids)).all()
         if len(users) != len(userids):
             return error_response(error_codes.NO_SUCH_USER, "Non-existent user(s) specified")
-        userids = []
         for user in users:
             if user.team_id is not None and user.team_id > 0:
                 return error_response(error_codes.USERS_ALREADY_IN_TEAM, "User %d is already in a team" % user.id)
-            userids.append(user.id)
     team = Team()
     team.name = jsondata["name"]
+    team.charter = jsondata.get("charter")
+    team.leader_id = None
     try:
         leader_id = int(jsondata["leader_id"])
         if leader_id not in userids:
             return error_response(error_codes.LEADER_NOT_IN_TEAM, "leader_id is not a member of the team")
         team.leader_id = leader_id
-    except ValueError:
+    except (TypeError, ValueError):
         return error_response(error_codes.INVALID_PARAMETERS, "leader_id must be an id")
     except KeyError:
         pass
-    populate_attrs_from_keys(team, jsondata, "charter")
     db.session.add(team)
+    db.session.flush()
+    db.session.add(TeamScore(team.id))
+    if len(userids) > 0:
+        User.query.filter(User.id.in_(userids)).update({User.team_id: team.id, User.version: User.version + 1},
+                                                       synchronize_session=False)
+        move_user_scores(list(userids), team.id)
+    members = []
+    for user in users:
+        member = serializer.to_data(user)
+        member["team_id"] = team.id
+        members.append(member)
+    data = team_data(team, members)
     db.session.commit()
-    if "userids" in jsondata:
-        for user in users:
-            user.team_id = team.id
-        db.session.commit()
-    team = Team.query.filter_by(id=team.id).first()
-    return success_response(team)
+    team_name_index.add(data["id"], data["name"])
+    for user in users:
+        current_user_cache.invalidate(user.email)
+    return success_response(data)
+
+
+def validate_team_details(jsondata):
+    """ Validates the types of the name and charter of a team, if specified
+
+    Args:
+        jsondata: the team object
+
+    Returns: None if valid, otherwise a tuple of the error code and message
+
+    """
+    if jsondata.get("name") is not None and not isinstance(jsondata["name"], basestring):
+        return error_codes.INVALID_TEAM_DETAILS, "Team name must be a string"
+    if jsondata.get("charter") is not None and not isinstance(jsondata["charter"], basestring):
+        return error_codes.INVALID_TEAM_DETAILS, "Charter must be a string"
+    return None
 
 
 @app.route("/team", methods=["PUT"])
+@authorize_check(1)
 def update_team():
     ### Updates a team's details
     # Team leaders may update their own team's name and charter
@@ -683,13 +2337,16 @@ def update_team():
     team = Team.query.filter_by(id=teamid).first()
     if team is None:
         return error_response(error_codes.NO_SUCH_TEAM, error_codes.NO_SUCH_TEAM_STR)
-    if session["privilege"] == 1:
+    if current_user()["privilege"] == 1:
         team_leader = team.get_leader()
         if team_leader.email != session["username"]:
             return error_response(error_codes.INSUFFICIENT_PRIVILEGE, "You are not the team's leader")
         if "userids" in jsondata:
             return error_response(error_codes.INSUFFICIENT_PRIVILEGE,
                                   "Team leaders may not update the team's membership")
+    error = validate_team_details(jsondata)
+    if error is not None:
+        return error_response(*error)
     if "name" in jsondata and jsondata["name"] != team.name:
         if Team.query.filter_by(name=jsondata["name"]).first() is not None:
             return error_response(error_codes.TEAM_ALREADY_EXISTS, "Team with that name already exists")
@@ -698,47 +2355,52 @@ def update_team():
         team.name = jsondata["name"]
     if "charter" in jsondata:
         team.charter = jsondata["charter"]
-    userids = []
-    current_userids = [] # the list of existing team members who will remain in the team
-    new_userids = [] # the list of new team members who previously are not in the team
+    current_members = dict((user.id, user) for user in team.users)
+    userids = set(current_members) # the ids of the team members after the update
+    removed_userids = set() # the ids of existing team members who will leave the team
+    new_users = [] # the new team members who previously are not in the team
     if "userids" in jsondata:
         try:
-            for id in jsondata["userids"]:
-                userids.append(id)
-        except (TypeError, ValueError):
+            userids = parse_userids(jsondata)
+        except ValueError:
             return error_response(error_codes.INVALID_PARAMETERS, "userids must be an array of ids")
-        userids = list(set(userids))
-        for user in team.users:
-            if user.id not in userids:
-                user.team_id = None
-            else:
-                current_userids.append(user.id)
-        for id in userids:
-            if id not in current_userids:
-                new_userids.append(id)
+        removed_userids = set(current_members) - userids
+        new_userids = userids - set(current_members)
         if len(new_userids) > 0:
-            users = User.query.filter(User.id.in_(new_userids)).all()
-            if len(users) != len(new_userids):
-                return error_response(error_codes.NO_SUCH_USER, "Non-existent user(s) specified")
-            for user in users:
-                if user.team_id is not None and user.team_id > 0 and user.team_id != team.id:
-                    return error_response(error_codes.USERS_ALREADY_IN_TEAM, "User %d is already in a team" % user.id)
-                else:
-                    user.team_id = team.id
-    else:
-        for user in team.users:
-            current_userids.append(user.id)
+            new_users = User.query.filter(User.id.in_(new_userids)).all()
+        if len(new_users) != len(new_userids):
+            return error_response(error_codes.NO_SUCH_USER, "Non-existent user(s) specified")
+        for user in new_users:
+            if user.team_id is not None and user.team_id > 0 and user.team_id != team.id:
+                return error_response(error_codes.USERS_ALREADY_IN_TEAM, "User %d is already in a team" % user.id)
     if "leader_id" in jsondata:
         try:
             leader_id = int(jsondata["leader_id"])
         except (TypeError, ValueError):
             return error_response(error_codes.INVALID_PARAMETERS, "leader_id must be an id")
-        if leader_id not in new_userids and leader_id not in current_userids:
+        if leader_id not in userids:
             return error_response(error_codes.LEADER_NOT_IN_TEAM, "leader_id is not a member of the team")
         team.leader_id = leader_id
+    team.version = Team.version + 1
+    if len(removed_userids) > 0:
+        User.query.filter(User.id.in_(removed_userids), User.team_id == team.id) \
+            .update({User.team_id: None, User.version: User.version + 1}, synchronize_session=False)
+        move_user_scores(list(removed_userids), None)
+    if len(new_users) > 0:
+        User.query.filter(User.id.in_([user.id for user in new_users])) \
+            .update({User.team_id: team.id, User.version: User.version + 1}, synchronize_session=False)
+        move_user_scores([user.id for user in new_users], team.id)
+    members = [serializer.to_data(user) for userid, user in current_members.items() if userid in userids]
+    for user in new_users:
+        member = serializer.to_data(user)
+        member["team_id"] = team.id
+        members.append(member)
+    data = team_data(team, members)
     db.session.commit()
-    team = Team.query.filter_by(id=team.id).first()
-    return success_response(team)
+    team_name_index.add(data["id"], data["name"])
+    for user in new_users + [current_members[userid] for userid in removed_userids]:
+        current_user_cache.invalidate(user.email)
+    return success_response(data)
 
 
 @app.route("/team/<teamid>", methods=["DELETE"])
@@ -749,15 +2411,372 @@ def delete_team(teamid):
     team = Team.query.filter_by(id=teamid).first()
     if team is None:
         return error_response(error_codes.NO_SUCH_TEAM, error_codes.NO_SUCH_TEAM_STR)
+    teamid = team.id
+    emails = [user.email for user in team.users]
+    for user in team.users:
+        user.version = User.version + 1
+    move_user_scores([user.id for user in team.users], None)
+    TeamScore.query.filter_by(team_id=teamid).delete(synchronize_session=False)
     db.session.delete(team)
     db.session.commit()
+    team_name_index.remove(teamid)
+    for email in emails:
+        current_user_cache.invalidate(email)
     return success_response("")
 
 
+# Leaderboard
+# ---------------------------------------------------------------
+# The userscore and teamscore tables hold each user's and team's total points and number of completed tasks. They
+# are maintained incrementally: apply_score_deltas must be called whenever taskStatus points or statuses change, and
+# move_user_scores whenever users change teams, in the same transaction. rebuild_leaderboard recomputes both tables
+# from scratch, and must be run once to populate them for existing data.
+
+def ensure_user_scores(userids):
+    """ Creates empty userscore rows for users that do not have one
+
+    Args:
+        userids: the ids of the users
+
+    """
+    user = User.__table__
+    missing_scores = db.select([user.c.id, user.c.team_id, db.literal(0), db.literal(0)]) \
+        .where(user.c.id.in_(userids))
+    db.session.execute(insert_ignore(UserScore.__table__)
+                       .from_select(["user_id", "team_id", "points", "completed"], missing_scores))
+
+
+def apply_score_deltas(deltas):
+    """ Adds changes in taskStatus points and completions to the scores of the users and their teams
+
+    Args:
+        deltas: a dict of user ids to (points, completed) tuples of the amounts to add
+
+    """
+    deltas = dict((userid, delta) for userid, delta in deltas.items() if delta != (0, 0))
+    if len(deltas) == 0:
+        return
+    ensure_user_scores(list(deltas))
+    userscore = UserScore.__table__
+    db.session.execute(
+        userscore.update()
+        .where(userscore.c.user_id == db.bindparam("b_user_id"))
+        .values(points=userscore.c.points + db.bindparam("b_points"),
+                completed=userscore.c.completed + db.bindparam("b_completed")),
+        [{"b_user_id": userid, "b_points": points, "b_completed": completed}
+         for userid, (points, completed) in deltas.items()])
+    team_deltas = {}
+    for (userid, teamid) in db.session.query(UserScore.user_id, UserScore.team_id) \
+            .filter(UserScore.user_id.in_(list(deltas))):
+        add_team_score_delta(team_deltas, teamid, deltas[userid][0], deltas[userid][1])
+    apply_team_score_deltas(team_deltas)
+
+
+def move_user_scores(userids, teamid):
+    """ Moves the scores of users from their previous teams to a new team
+
+    Args:
+        userids: the ids of the users
+        teamid: the id of the new team, or None if the users are leaving their teams
+
+    """
+    if len(userids) == 0:
+        return
+    ensure_user_scores(userids)
+    team_deltas = {}
+    for (old_teamid, points, completed) in db.session.query(UserScore.team_id, UserScore.points, UserScore.completed) \
+            .filter(UserScore.user_id.in_(userids)):
+        if old_teamid != teamid:
+            add_team_score_delta(team_deltas, old_teamid, -points, -completed)
+            add_team_score_delta(team_deltas, teamid, points, completed)
+    UserScore.query.filter(UserScore.user_id.in_(userids)).update({UserScore.team_id: teamid},
+                                                                   synchronize_session=False)
+    apply_team_score_deltas(team_deltas)
+    bump_cache_version("team_membership")
+    stats_changed()
+
+
+def add_team_score_delta(team_deltas, teamid, points, completed):
+    if teamid is None:
+        return
+    current_points, current_completed = team_deltas.get(teamid, (0, 0))
+    team_deltas[teamid] = (current_points + points, current_completed + completed)
+
+
+def apply_team_score_deltas(team_deltas):
+    """ Adds amounts to the scores of teams, creating their teamscore rows if necessary
+
+    Args:
+        team_deltas: a dict of team ids to (points, completed) tuples of the amounts to add
+
+    """
+    team_deltas = dict((teamid, delta) for teamid, delta in team_deltas.items() if delta != (0, 0))
+    if len(team_deltas) == 0:
+        return
+    teamscore = TeamScore.__table__
+    db.session.execute(insert_ignore(teamscore),
+                       [{"team_id": teamid, "points": 0, "completed": 0} for teamid in team_deltas])
+    db.session.execute(
+        teamscore.update()
+        .where(teamscore.c.team_id == db.bindparam("b_team_id"))
+        .values(points=teamscore.c.points + db.bindparam("b_points"),
+                completed=teamscore.c.completed + db.bindparam("b_completed")),
+        [{"b_team_id": teamid, "b_points": points, "b_completed": completed}
+         for teamid, (points, completed) in team_deltas.items()])
+
+
+def rebuild_leaderboard():
+    """ Recomputes the userscore and teamscore tables from the taskstatus table, and commits """
+    user = User.__table__
+    taskstatus = TaskStatus.__table__
+    userscore = UserScore.__table__
+    completed = db.case([(taskstatus.c.status == constants.STATUS_COMPLETED, 1)], else_=0)
+    user_totals = db.select([
+        user.c.id,
+        user.c.team_id,
+        db.func.coalesce(db.func.sum(taskstatus.c.points), 0),
+        db.func.coalesce(db.func.sum(completed), 0)
+    ]).select_from(user.outerjoin(taskstatus, taskstatus.c.user_id == user.c.id)) \
+        .group_by(user.c.id, user.c.team_id)
+    team = Team.__table__
+    team_totals = db.select([
+        team.c.id,
+        db.func.coalesce(db.func.sum(userscore.c.points), 0),
+        db.func.coalesce(db.func.sum(userscore.c.completed), 0)
+    ]).select_from(team.outerjoin(userscore, userscore.c.team_id == team.c.id)) \
+        .group_by(team.c.id)
+    db.session.execute(TeamScore.__table__.delete())
+    db.session.execute(userscore.delete())
+    db.session.execute(userscore.insert().from_select(["user_id", "team_id", "points", "completed"], user_totals))
+    db.session.execute(TeamScore.__table__.insert().from_select(["team_id", "points", "completed"], team_totals))
+    db.session.commit()
+
+
+# Schema migrations
+# ---------------------------------------------------------------
+# Migrations bring databases created from older versions of the models up to date. The models remain the definition
+# of the schema, so every migration must leave the database matching them.
+
+schema_migrations = migrations.MigrationSet()
+
+
+@schema_migrations.migration(1, "Create the user, team, task and taskstatus tables")
+def create_base_tables(connection):
+    for model in (Team, User, Task, TaskStatus):
+        migrations.create_table(connection, model.__table__)
+
+
+@schema_migrations.migration(2, "Create the job, cacheversion, userscore and teamscore tables")
+def create_job_and_score_tables(connection):
+    for model in (Job, CacheVersion, UserScore, TeamScore):
+        migrations.create_table(connection, model.__table__)
+
+
+@schema_migrations.migration(3, "Add versions and change sequence numbers")
+def add_change_tracking(connection):
+    for column in (User.__table__.c.version, Team.__table__.c.version, Task.__table__.c.change_seq,
+                   Task.__table__.c.updated_at, TaskStatus.__table__.c.version, TaskStatus.__table__.c.change_seq,
+                   TaskStatus.__table__.c.updated_at):
+        migrations.add_column(connection, column)
+    migrations.create_index(connection, migrations.find_index(Task.__table__, "ix_task_change_seq"))
+    migrations.create_index(connection, migrations.find_index(TaskStatus.__table__, "taskstatus_user_change"))
+
+
+@schema_migrations.migration(4, "Create the submission table")
+def create_submission_table(connection):
+    migrations.create_table(connection, Submission.__table__)
+
+
+@schema_migrations.migration(5, "Index task statuses by task and status, and users by team")
+def add_access_path_indexes(connection):
+    # taskstatus_task_status serves per-task status rollups, taskstatus_user_status the task lists of a user filtered
+    # by status, and user_team_version team membership scans
+    migrations.create_index(connection, migrations.find_index(TaskStatus.__table__, "taskstatus_task_status"))
+    migrations.create_index(connection, migrations.find_index(TaskStatus.__table__, "taskstatus_user_status"))
+    migrations.create_index(connection, migrations.find_index(User.__table__, "user_team_version"))
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Applies the pending schema migrations to the database."""
+    applied = schema_migrations.upgrade(db.engine)
+    for migration in applied:
+        click.echo("Applied migration %d: %s" % (migration.version, migration.description))
+    if len(applied) == 0:
+        click.echo("The schema is up to date")
+
+
+@app.cli.command("rebuild-leaderboard")
+def rebuild_leaderboard_command():
+    """Recomputes the leaderboard tables from the task statuses."""
+    rebuild_leaderboard()
+
+
+def leaderboard_size():
+    """ Returns: the number of entries requested by the "limit" request arg, capped to MAX_PAGE_SIZE
+    Raises:
+        ValueError: if limit is not an integer
+    """
+    limit = int(request.args.get("limit", app.config["LEADERBOARD_DEFAULT_SIZE"]))
+    return min(max(limit, 0), app.config["MAX_PAGE_SIZE"])
+
+
+@app.route("/leaderboard/users", methods=["GET"])
+@authorize_check(1)
+def get_user_leaderboard():
+    ### Shows the users with the most points
+    # Any user can view the leaderboard
+    # "limit" is the number of users to return. Ties are ordered by descending user id
+    # Returns an array of { user_id, display_name, team_id, points, completed }, from the most points to the least
+    try:
+        limit = leaderboard_size()
+    except ValueError:
+        return error_response(error_codes.INVALID_PARAMETERS, "limit must be an integer")
+    results = db.session.query(UserScore.user_id, User.display_name, UserScore.team_id, UserScore.points,
+                               UserScore.completed) \
+        .join(User, User.id == UserScore.user_id) \
+        .order_by(UserScore.points.desc(), UserScore.user_id.desc()) \
+        .limit(limit)
+    keys = ["user_id", "display_name", "team_id", "points", "completed"]
+    return success_response([dict(zip(keys, result)) for result in results])
+
+
+@app.route("/leaderboard/teams", methods=["GET"])
+@authorize_check(1)
+def get_team_leaderboard():
+    ### Shows the teams with the most points
+    # Any user can view the leaderboard
+    # "limit" is the number of teams to return. Ties are ordered by descending team id
+    # Returns an array of { team_id, name, points, completed }, from the most points to the least
+    try:
+        limit = leaderboard_size()
+    except ValueError:
+        return error_response(error_codes.INVALID_PARAMETERS, "limit must be an integer")
+    results = db.session.query(TeamScore.team_id, Team.name, TeamScore.points, TeamScore.completed) \
+        .join(Team, Team.id == TeamScore.team_id) \
+        .order_by(TeamScore.points.desc(), TeamScore.team_id.desc()) \
+        .limit(limit)
+    keys = ["team_id", "name", "points", "completed"]
+    return success_response([dict(zip(keys, result)) for result in results])
+
+
+def status_counts(status):
+    """ Returns the aggregate columns counting the assigned taskStatus of a group by status, for stats_data
+
+    Args:
+        status: the status column
+
+    Returns: a list of the columns
+
+    """
+    count_status = lambda value: db.func.coalesce(db.func.sum(db.case([(status == value, 1)], else_=0)), 0)
+    return [db.func.count(status), count_status(constants.STATUS_AVAILABLE), count_status(constants.STATUS_SUBMITTED),
+            count_status(constants.STATUS_COMPLETED)]
+
+
+def stats_data(key, row):
+    """ Returns the progress statistics of a group from a row of a group id followed by the status_counts columns """
+    group_id, assigned, available, submitted, completed = row
+    return {
+        key: group_id,
+        "assigned": assigned,
+        "available": available,
+        "submitted": submitted,
+        "completed": completed,
+        "completion_rate": float(completed) / assigned if assigned > 0 else 0.0
+    }
+
+
+def load_task_stats(version):
+    taskstatus = TaskStatus.__table__
+    with primary_reads():
+        rows = db.session.execute(
+            db.select([taskstatus.c.task_id] + status_counts(taskstatus.c.status))
+            .where(taskstatus.c.status != constants.STATUS_UNAVAILABLE)
+            .group_by(taskstatus.c.task_id)
+            .order_by(taskstatus.c.task_id))
+        return serializer.encoder.encode([stats_data("task_id", row) for row in rows])
+
+
+def load_team_stats(version):
+    taskstatus = TaskStatus.__table__
+    user = User.__table__
+    with primary_reads():
+        rows = db.session.execute(
+            db.select([user.c.team_id] + status_counts(taskstatus.c.status))
+            .select_from(user.join(taskstatus, taskstatus.c.user_id == user.c.id))
+            .where(user.c.team_id.isnot(None))
+            .where(taskstatus.c.status != constants.STATUS_UNAVAILABLE)
+            .group_by(user.c.team_id)
+            .order_by(user.c.team_id))
+        return serializer.encoder.encode([stats_data("team_id", row) for row in rows])
+
+
+def task_stats_version():
+    with primary_reads():
+        return get_cache_version("change_seq")
+
+
+def team_stats_version():
+    with primary_reads():
+        return get_cache_version("change_seq"), get_cache_version("team_membership")
+
+
+# The statistics are encoded once per change sequence number (and for teams, per change of membership), which is
+# checked at most every STATS_CACHE_TTL seconds
+task_stats = caching.VersionedSnapshot(load_task_stats, task_stats_version, app.config["STATS_CACHE_TTL"])
+team_stats = caching.VersionedSnapshot(load_team_stats, team_stats_version, app.config["STATS_CACHE_TTL"])
+
+
+def stats_changed():
+    """ Records that the current transaction changes the progress statistics, so that they are checked on their next
+    use once it is committed. Checking them before the commit would cache the statistics from before the transaction
+    until STATS_CACHE_TTL passes.
+    """
+    db.session.info["stats_changed"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def invalidate_changed_stats(session):
+    if session.info.pop("stats_changed", False):
+        task_stats.invalidate()
+        team_stats.invalidate()
+
+
+@app.route("/stats/tasks", methods=["GET"])
+@authorize_check(3)
+@read_replica
+def get_task_stats():
+    ### Shows the progress of every assigned task
+    # Returns an array of { task_id, assigned, available, submitted, completed, completion_rate } ordered by task id,
+    # where assigned is the number of users the task is assigned to and completion_rate is completed / assigned
+    # The statistics may be up to STATS_CACHE_TTL seconds old
+    return encoded_success_response(task_stats.get())
+
+
+@app.route("/stats/teams", methods=["GET"])
+@authorize_check(3)
+@read_replica
+def get_team_stats():
+    ### Shows the progress of every team with assigned tasks
+    # Returns an array of { team_id, assigned, available, submitted, completed, completion_rate } ordered by team id,
+    # counting the taskStatus of the team's current members
+    # The statistics may be up to STATS_CACHE_TTL seconds old
+    return encoded_success_response(team_stats.get())
+
+
+@app.route("/metrics", methods=["GET"])
+@authorize_check(4)
+def show_metrics():
+    ### Shows per-route request metrics in the Prometheus text format
+    # Requires privilege level 4
+    return Response(request_metrics.render(), content_type="text/plain; version=0.0.4")
+
+
 ### Template routing
 @app.route("/test", methods=["GET"])
 @authorize_check(1)
 def test_method():
-    user = User.query.filter_by(email=session["username"]).first()
-    g.name = user.display_name
+    user = current_user()
+    g.name = user["display_name"]
     return render_template("test.html")
\ No newline at end of file
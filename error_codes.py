@@ -1,5 +1,6 @@
 #General error codes
 INVALID_PARAMETERS = 1001
+DATABASE_ERROR = 1002
 
 #Error codes relating to teams
 NO_SUCH_TEAM = 1201
@@ -7,6 +8,7 @@ TEAM_ALREADY_EXISTS = 1202
 USERS_ALREADY_IN_TEAM = 1203
 TEAM_NAME_NOT_SPECIFIED = 1204
 LEADER_NOT_IN_TEAM = 1205
+INVALID_TEAM_DETAILS = 1206
 
 NO_SUCH_TEAM_STR = "No such team"
 
@@ -16,6 +18,7 @@ USER_ALREADY_EXISTS = 1302
 INVALID_PRIVILEGE_LEVEL = 1303
 DISPLAY_NAME_NOT_SPECIFIED = 1304
 EMAIL_NOT_SPECIFIED = 1305
+INVALID_USER_DETAILS = 1306
 
 NO_SUCH_USER_STR = "No such user"
 
@@ -26,9 +29,21 @@ INVALID_IMAGE_URL = 1403
 INVALID_TASK_URL = 1404
 DUPLICATE_TASK_NAME = 1405
 USERS_OR_TASKS_NOT_SPECIFIED = 1406
+TASK_NOT_ASSIGNED = 1407
+INVALID_GRADE = 1408
+VERSION_CONFLICT = 1409
+TASK_NOT_SUBMITTABLE = 1410
+INVALID_UPLOAD = 1411
+SUBMISSION_TOO_LARGE = 1412
+NO_SUCH_UPLOAD = 1413
 
 NO_SUCH_TASK_STR = "No such task"
 
+#Error codes relating to background jobs
+NO_SUCH_JOB = 1501
+
+NO_SUCH_JOB_STR = "No such job"
+
 #Error codes relating to authorization
 INSUFFICIENT_PRIVILEGE = 1601
 
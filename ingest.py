@@ -0,0 +1,106 @@
+import codecs
+import csv
+import json
+import re
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_json_array(stream, read_size=65536):
+    """ Lazily parses the elements of a JSON array from a file-like object, so that arbitrarily large arrays can be
+    processed with memory bounded by the size of the largest element
+
+    Args:
+        stream: the file-like object containing UTF-8 encoded JSON
+        read_size: the number of bytes to read at a time
+
+    Returns: a generator of the parsed elements
+    Raises:
+        ValueError: if the stream does not contain a valid JSON array
+
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    # The buffer is parsed from pos onwards, and only the unparsed text is copied when more is read
+    buffer = u""
+    pos = 0
+    eof = False
+    started = False
+    first = True
+    expecting_value = False
+    while True:
+        pos = WHITESPACE.match(buffer, pos).end()
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            data = stream.read(read_size)
+            eof = len(data) == 0
+            buffer = text_decoder.decode(data, final=eof)
+            pos = 0
+            continue
+        if not started:
+            if buffer[pos] != u"[":
+                raise ValueError("Expected a JSON array")
+            pos += 1
+            started = True
+            continue
+        if buffer[pos] == u"]" and not expecting_value:
+            return
+        if not first and not expecting_value:
+            if buffer[pos] != u",":
+                raise ValueError("Expected , or ] in JSON array")
+            pos += 1
+            expecting_value = True
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            # A value ending at the end of the buffer may be truncated, e.g. a number
+            complete = end < len(buffer) or eof
+        except ValueError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            data = stream.read(read_size)
+            eof = len(data) == 0
+            buffer = buffer[pos:] + text_decoder.decode(data, final=eof)
+            pos = 0
+            continue
+        yield value
+        pos = end
+        first = False
+        expecting_value = False
+
+
+def iter_csv_records(stream):
+    """ Lazily parses the rows of a CSV file with a header row
+
+    Args:
+        stream: the iterable of lines of the UTF-8 encoded CSV file
+
+    Returns: a generator of dicts of the header fields to the row values. Missing values are None
+
+    """
+    for row in csv.DictReader(stream):
+        yield dict((key.decode("utf-8"), value.decode("utf-8") if value is not None else None)
+                   for key, value in row.items() if key is not None)
+
+
+def iter_chunks(iterable, size):
+    """ Lazily splits an iterable into consecutive lists of at most the specified size
+
+    Args:
+        iterable: the iterable to split
+        size: the maximum chunk size
+
+    Returns: a generator of lists
+
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
@@ -0,0 +1,49 @@
+import logging
+import threading
+from Queue import Queue
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool(object):
+    """ A fixed-size pool of daemon threads executing callables from a shared queue.
+    The threads are only started when the first piece of work is submitted.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._queue = Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """ Enqueues a callable to be executed by one of the worker threads
+
+        Args:
+            func: the callable to execute
+            *args: positional arguments for the callable
+            **kwargs: keyword arguments for the callable
+
+        """
+        self._start()
+        self._queue.put((func, args, kwargs))
+
+    def _start(self):
+        with self._lock:
+            if len(self._threads) > 0:
+                return
+            for index in range(self.size):
+                thread = threading.Thread(target=self._work, name="worker-%d" % index)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception("Unhandled exception in background worker")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,108 @@
+import bisect
+import heapq
+import threading
+
+# Histogram bucket upper bounds for each recorded metric
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+METRICS = {
+    "enactus_request_duration_seconds": ("Time taken to handle a request", TIME_BUCKETS),
+    "enactus_request_queries": ("Number of SQL statements executed by a request", COUNT_BUCKETS),
+    "enactus_request_db_seconds": ("Time spent executing SQL statements during a request", TIME_BUCKETS),
+    "enactus_request_serialize_seconds": ("Time spent serializing the response of a request", TIME_BUCKETS),
+    "enactus_response_bytes": ("Size of the response body", BYTES_BUCKETS),
+}
+
+
+class Histogram(object):
+    """ A cumulative histogram with fixed bucket upper bounds """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry(object):
+    """ Thread-safe in-memory store of per-route histograms for the metrics in METRICS """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, name, route, value):
+        """ Records a value in the histogram of the specified metric and route
+
+        Args:
+            name: the metric name, which must be a key of METRICS
+            route: the route the value was recorded for
+            value: the value to record
+
+        """
+        with self._lock:
+            histogram = self._histograms.get((name, route))
+            if histogram is None:
+                histogram = Histogram(METRICS[name][1])
+                self._histograms[(name, route)] = histogram
+            histogram.observe(value)
+
+    def render(self):
+        """ Renders all histograms in the Prometheus text exposition format
+
+        Returns: the rendered metrics
+
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(METRICS):
+                lines.append("# HELP %s %s" % (name, METRICS[name][0]))
+                lines.append("# TYPE %s histogram" % name)
+                for (metric, route) in sorted(self._histograms):
+                    if metric != name:
+                        continue
+                    histogram = self._histograms[(metric, route)]
+                    label = escape_label(route)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append('%s_bucket{route="%s",le="%s"} %d' % (name, label, bound, cumulative))
+                    lines.append('%s_bucket{route="%s",le="+Inf"} %d' % (name, label, histogram.count))
+                    lines.append('%s_sum{route="%s"} %s' % (name, label, histogram.sum))
+                    lines.append('%s_count{route="%s"} %d' % (name, label, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+class RequestStats(object):
+    """ Statistics collected while handling a single request. Keeps the slowest statements seen. """
+
+    def __init__(self, worst_queries=5, request_id=None):
+        self.request_id = request_id
+        self.query_count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self._worst_queries = []
+        self._max_worst_queries = worst_queries
+
+    def record_query(self, statement, elapsed):
+        self.query_count += 1
+        self.db_time += elapsed
+        if len(self._worst_queries) < self._max_worst_queries:
+            heapq.heappush(self._worst_queries, (elapsed, statement))
+        elif elapsed > self._worst_queries[0][0]:
+            heapq.heapreplace(self._worst_queries, (elapsed, statement))
+
+    def worst_queries(self):
+        """ Returns: a list of (elapsed, statement) tuples for the slowest statements, slowest first """
+        return sorted(self._worst_queries, reverse=True)
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
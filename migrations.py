@@ -0,0 +1,130 @@
+import datetime
+
+import sqlalchemy
+from sqlalchemy.engine.reflection import Inspector
+from sqlalchemy.schema import CreateColumn
+
+
+class Migration(object):
+
+    def __init__(self, version, description, upgrade):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+
+
+class MigrationSet(object):
+    """ An ordered set of schema migrations. The version of every migration applied to a database is recorded in its
+    schema_version table, so that each migration is applied once. Migrations should be written with the helpers below,
+    which skip the tables, columns and indexes that already exist, so that they can also be applied to databases
+    whose tables were created from the current models.
+    """
+
+    def __init__(self):
+        self.migrations = {}
+        self.table = sqlalchemy.Table(
+            "schema_version", sqlalchemy.MetaData(),
+            sqlalchemy.Column("version", sqlalchemy.Integer, primary_key=True, autoincrement=False),
+            sqlalchemy.Column("description", sqlalchemy.String(255), nullable=False),
+            sqlalchemy.Column("applied_at", sqlalchemy.DateTime, nullable=False))
+
+    def migration(self, version, description):
+        """ Decorator generator registering a function taking a connection as a migration
+
+        Args:
+            version: the version of the schema after the migration, unique within the set
+            description: a short description of the changes
+
+        Returns:
+            The decorator
+        """
+        def migration_decorator(func):
+            assert version not in self.migrations, "Duplicate migration version %d" % version
+            self.migrations[version] = Migration(version, description, func)
+            return func
+        return migration_decorator
+
+    def applied_versions(self, connection):
+        """ Returns: the set of the versions of the migrations applied to the database """
+        if not has_table(connection, self.table.name):
+            return set()
+        return set(row[0] for row in connection.execute(sqlalchemy.select([self.table.c.version])))
+
+    def pending(self, connection):
+        """ Returns: a list of the migrations not yet applied to the database, in order of version """
+        applied = self.applied_versions(connection)
+        return [self.migrations[version] for version in sorted(self.migrations) if version not in applied]
+
+    def upgrade(self, engine):
+        """ Applies the pending migrations in order of version, each in its own transaction. Note that some databases
+        (e.g. MySQL) commit DDL statements implicitly, so a failed migration may be partially applied, and is retried
+        in full the next time.
+
+        Args:
+            engine: the engine of the database
+
+        Returns: a list of the migrations applied
+
+        """
+        with engine.begin() as connection:
+            self.table.create(connection, checkfirst=True)
+        with engine.connect() as connection:
+            pending = self.pending(connection)
+        applied = []
+        for migration in pending:
+            with engine.begin() as connection:
+                migration.upgrade(connection)
+                connection.execute(self.table.insert().values(version=migration.version,
+                                                              description=migration.description,
+                                                              applied_at=datetime.datetime.utcnow()))
+            applied.append(migration)
+        return applied
+
+
+def has_table(connection, table_name):
+    return connection.dialect.has_table(connection, table_name)
+
+
+def create_table(connection, table):
+    """ Creates a table with its indexes, unless the table exists """
+    table.create(connection, checkfirst=True)
+
+
+def add_column(connection, column):
+    """ Adds a column to its table, unless the table already has a column of that name. The column must have a server
+    default (or be nullable) if the table may already have rows.
+
+    Args:
+        connection: the connection to the database
+        column: the column, which must be attached to the table it is added to
+    """
+    inspector = Inspector.from_engine(connection)
+    if column.name in [existing["name"] for existing in inspector.get_columns(column.table.name)]:
+        return
+    preparer = connection.dialect.identifier_preparer
+    connection.execute("ALTER TABLE %s ADD COLUMN %s" % (
+        preparer.format_table(column.table), CreateColumn(column).compile(dialect=connection.dialect)))
+
+
+def create_index(connection, index):
+    """ Creates an index, unless its table already has an index of the same name or on the same columns (e.g. the
+    index MySQL creates for a foreign key)
+
+    Args:
+        connection: the connection to the database
+        index: the index, which must be attached to its table
+    """
+    inspector = Inspector.from_engine(connection)
+    columns = [column.name for column in index.columns]
+    for existing in inspector.get_indexes(index.table.name):
+        if existing["name"] == index.name or existing["column_names"] == columns:
+            return
+    index.create(connection)
+
+
+def find_index(table, name):
+    """ Returns: the index of a table with the specified name """
+    for index in table.indexes:
+        if index.name == name:
+            return index
+    raise KeyError("Table %s has no index %s" % (table.name, name))
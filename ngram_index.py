@@ -0,0 +1,91 @@
+import threading
+import time
+
+
+class NgramIndex(object):
+    """ In-memory, case-insensitive substring index over short strings identified by ids.
+    Each string is split into overlapping n-grams, and a substring search intersects the posting sets of the n-grams
+    of the search text before verifying the candidates. Search texts shorter than n fall back to a scan.
+    """
+
+    def __init__(self, n=3):
+        self.n = n
+        self.built_at = None
+        self._lock = threading.Lock()
+        self._strings = {}
+        self._postings = {}
+
+    def ngrams(self, text):
+        return set(text[start:start + self.n] for start in range(len(text) - self.n + 1))
+
+    def rebuild(self, items):
+        """ Replaces the contents of the index
+
+        Args:
+            items: an iterable of (id, string) tuples
+
+        """
+        strings = {}
+        postings = {}
+        for (id, text) in items:
+            text = text.lower()
+            strings[id] = text
+            for ngram in self.ngrams(text):
+                postings.setdefault(ngram, set()).add(id)
+        with self._lock:
+            self._strings = strings
+            self._postings = postings
+            self.built_at = time.time()
+
+    def add(self, id, text):
+        """ Adds a string to the index, replacing the string previously indexed under the same id
+
+        Args:
+            id: the id of the string
+            text: the string
+
+        """
+        with self._lock:
+            self._remove(id)
+            text = text.lower()
+            self._strings[id] = text
+            for ngram in self.ngrams(text):
+                self._postings.setdefault(ngram, set()).add(id)
+
+    def remove(self, id):
+        """ Removes the string with the specified id from the index, if present
+
+        Args:
+            id: the id of the string
+
+        """
+        with self._lock:
+            self._remove(id)
+
+    def _remove(self, id):
+        text = self._strings.pop(id, None)
+        if text is None:
+            return
+        for ngram in self.ngrams(text):
+            posting = self._postings.get(ngram)
+            if posting is not None:
+                posting.discard(id)
+                if len(posting) == 0:
+                    del self._postings[ngram]
+
+    def search(self, text):
+        """ Finds the strings containing the search text
+
+        Args:
+            text: the search text
+
+        Returns: a set of the ids of the matching strings
+
+        """
+        text = text.lower()
+        with self._lock:
+            if len(text) < self.n:
+                return set(id for id, string in self._strings.items() if text in string)
+            postings = sorted((self._postings.get(ngram, set()) for ngram in self.ngrams(text)), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            return set(id for id in candidates if text in self._strings[id])
@@ -0,0 +1,361 @@
+import operator
+import time
+
+import caching
+
+try:
+    import simplejson as json_backend
+except ImportError:
+    import json as json_backend
+
+
+class Serializer(object):
+    """ Converts models to json-serializable data using extractors compiled once per model, and encodes the
+    {success, code, data} response envelope directly to compact JSON.
+
+    The default encoder uses the C speedups of simplejson when it is installed, falling back to the standard library
+    json module otherwise.
+    """
+
+    def __init__(self, encoder=None, selection_cache_size=1000):
+        """
+        Args:
+            encoder: optional JSONEncoder, which must encode compact JSON
+            selection_cache_size: the number of serializers compiled for selections that are kept, evicting the least
+                recently used. Selections come from request parameters, so their number must be bounded.
+        """
+        if encoder is None:
+            encoder = json_backend.JSONEncoder(separators=(",", ":"))
+        self.encoder = encoder
+        self._compiled = {}
+        self._specs = {}
+        self._selected = caching.TTLCache(selection_cache_size, float("inf"))
+        self._envelope_parts = {}
+
+    def register(self, model, keys, nested=(), getters=None, collapsed=None, columns=None):
+        """ Compiles and registers the serializer for a model, which to_data then uses for instances of the model
+
+        Args:
+            model: the model class
+            keys: see compile
+            nested: see compile
+            getters: see compile
+            collapsed: optional dict of the keys of nested objects to a tuple (key, function taking a model instance)
+                serialized instead when the nested object is not expanded (e.g. the id of the nested object).
+                Nested objects which are not expanded and have no entry are omitted. Keys in nested or collapsed are
+                the keys that can be expanded.
+            columns: optional dict of keys to the names of the column attributes read to serialize them. Defaults to
+                the key itself, or no columns for keys in nested, getters or collapsed.
+
+        Returns: the compiled serializer
+
+        """
+        serialize = self.compile(keys, nested, getters)
+        self._compiled[model] = serialize
+        self._specs[model] = (tuple(keys), frozenset(nested), getters or {}, collapsed or {}, columns or {})
+        return serialize
+
+    def compile(self, keys, nested=(), getters=None):
+        """ Compiles a serializer for a model
+
+        Args:
+            keys: the serialized keys, in order. Each key is read from the model attribute of the same name
+            nested: the keys whose values are themselves serialized (e.g. relationships)
+            getters: optional dict of keys to functions taking a model instance and returning the serialized value,
+                used instead of reading the attribute
+
+        Returns: the compiled serializer, a function taking a model instance and returning a dict
+
+        """
+        keys = tuple(keys)
+        if getters is None:
+            getters = {}
+        if len(nested) == 0 and len(getters) == 0:
+            extract = operator.attrgetter(*keys)
+            if len(keys) == 1:
+                serialize = lambda obj: {keys[0]: extract(obj)}
+            else:
+                serialize = lambda obj: dict(zip(keys, extract(obj)))
+        else:
+            extractors = [getters[key] if key in getters else
+                          self._nested_getter(key) if key in nested else
+                          operator.attrgetter(key) for key in keys]
+            serialize = lambda obj: dict(zip(keys, [extract(obj) for extract in extractors]))
+        return serialize
+
+    def _nested_getter(self, key, selection=None):
+        extract = operator.attrgetter(key)
+        return lambda obj: self.to_data(extract(obj), selection)
+
+    def _selected_getter(self, extract, selection):
+        return lambda obj: self.to_data(extract(obj), selection)
+
+    def _plan(self, model, selection):
+        """ Returns: a list of (key, extractor, column names, embedded) tuples of the keys of a registered model which
+            are serialized for a selection, where embedded is whether the key is a nested object that is expanded
+        """
+        keys, nested, getters, collapsed, columns = self._specs[model]
+        plan = []
+        for key in keys:
+            expandable = key in nested or key in collapsed
+            sub_selection = selection.nested.get(key)
+            if expandable and not (selection.expands(key) and selection.includes(key)):
+                replacement = collapsed.get(key)
+                if replacement is not None and (selection.includes(key) or selection.includes(replacement[0])):
+                    plan.append((replacement[0], replacement[1], columns.get(key, ()), False))
+                continue
+            if not selection.includes(key):
+                continue
+            if key in getters:
+                extract = getters[key]
+                if sub_selection is not None:
+                    extract = self._selected_getter(extract, sub_selection)
+            elif key in nested:
+                extract = self._nested_getter(key, sub_selection)
+            else:
+                extract = operator.attrgetter(key)
+            default_columns = () if expandable or key in getters else (key,)
+            plan.append((key, extract, columns.get(key, default_columns), key in nested))
+        return plan
+
+    def compile_selection(self, model, selection):
+        """ Compiles a serializer for a registered model, which only serializes the keys in a selection
+
+        Args:
+            model: the registered model class
+            selection: the Selection
+
+        Returns: the compiled serializer, a function taking a model instance and returning a dict
+
+        """
+        plan = self._plan(model, selection)
+        keys = tuple(key for key, extract, columns, embedded in plan)
+        extractors = [extract for key, extract, columns, embedded in plan]
+        return lambda obj: dict(zip(keys, [extract(obj) for extract in extractors]))
+
+    def selected_columns(self, model, selection):
+        """ Returns: a list of the names of the column attributes of a registered model that are read to serialize it
+            for a selection, or None if all columns are read
+        """
+        if selection is None or selection.keys is None or model not in self._specs:
+            return None
+        names = []
+        for key, extract, columns, embedded in self._plan(model, selection):
+            names.extend(name for name in columns if name not in names)
+        return names
+
+    def embedded_keys(self, model, selection):
+        """ Returns: a set of the keys of the nested objects of a registered model that are serialized for a
+            selection
+        """
+        keys, nested, getters, collapsed, columns = self._specs[model]
+        if selection is None:
+            return set(nested)
+        return set(key for key, extract, columns, embedded in self._plan(model, selection) if embedded)
+
+    def to_data(self, obj, selection=None):
+        """ Converts an object to json-serializable data. Registered models are converted with their compiled
+        serializer, dicts and iterables are converted element by element, and other objects are returned as is.
+
+        Args:
+            obj: the object to convert
+            selection: optional Selection of the keys of the object (or of each element, if it is iterable) to
+                convert, and of the nested objects to expand. Everything is converted if None.
+
+        Returns: the json-serializable data
+
+        """
+        if selection is None:
+            serialize = self._compiled.get(type(obj))
+        else:
+            serialize = self._selected.get((type(obj), selection.key))
+            if serialize is None and type(obj) in self._specs:
+                serialize = self.compile_selection(type(obj), selection)
+                self._selected.set((type(obj), selection.key), serialize)
+        if serialize is not None:
+            return serialize(obj)
+        if isinstance(obj, dict):
+            if selection is None:
+                return dict((key, self.to_data(value)) for key, value in obj.items())
+            return dict((key, self.to_data(value, selection.nested.get(key))) for key, value in obj.items()
+                        if selection.includes(key))
+        if hasattr(obj, "__iter__"):
+            return [self.to_data(elem, selection) for elem in obj]
+        if callable(getattr(obj, "serialize", None)):
+            return obj.serialize() if selection is None else self.to_data(obj.serialize(), selection)
+        return obj
+
+    def encode_envelope(self, success, code, data, selection=None):
+        """ Encodes a response envelope
+
+        Args:
+            success: whether the request succeeded
+            code: the error code, or 0 if successful
+            data: the data or error message to return
+            selection: optional Selection of the data to return, see to_data
+
+        Returns: the encoded JSON, terminated by a newline
+
+        """
+        return self.encoder.encode({
+            "success": success,
+            "code": code,
+            "data": self.to_data(data, selection)
+        }) + "\n"
+
+    def encode_envelope_raw(self, success, code, encoded_data):
+        """ Encodes a response envelope around data that has already been encoded
+
+        Args:
+            success: whether the request succeeded
+            code: the error code, or 0 if successful
+            encoded_data: the encoded JSON of the data
+
+        Returns: the encoded JSON, terminated by a newline. This is identical to
+            encode_envelope(success, code, data) for the data that was encoded.
+
+        """
+        prefix, suffix = self.envelope_parts(success, code)
+        return prefix + encoded_data + suffix + "\n"
+
+    def iter_envelope(self, success, code, items, buffer_size=65536, selection=None, record_time=None):
+        """ Encodes a response envelope whose data is an array, consuming the items lazily. The envelope's opening
+        is yielded before the first item is read, and the encoded items are yielded in buffers of roughly
+        buffer_size bytes. The concatenated output is identical to encode_envelope(success, code, list(items)).
+
+        Args:
+            success: whether the request succeeded
+            code: the error code, or 0 if successful
+            items: an iterable of the items of the data array
+            buffer_size: the approximate size of each yielded string
+            selection: optional Selection of the keys of each item to return, see to_data
+            record_time: optional function called with the number of seconds spent converting and encoding the items
+                once they have all been encoded. The time spent reading the items is excluded.
+
+        Returns: a generator of strings
+
+        """
+        prefix, suffix = self.envelope_parts(success, code)
+        yield prefix + "["
+        buffered = []
+        buffered_size = 0
+        separator = ""
+        elapsed = 0.0
+        for item in items:
+            start = time.time()
+            encoded = separator + self.encoder.encode(self.to_data(item, selection))
+            elapsed += time.time() - start
+            separator = ","
+            buffered.append(encoded)
+            buffered_size += len(encoded)
+            if buffered_size >= buffer_size:
+                yield "".join(buffered)
+                buffered = []
+                buffered_size = 0
+        if record_time is not None:
+            record_time(elapsed)
+        buffered.append("]" + suffix + "\n")
+        yield "".join(buffered)
+
+    def envelope_parts(self, success, code):
+        """ Returns: the encoded envelope before and after its data as a tuple of strings """
+        parts = self._envelope_parts.get((success, code))
+        if parts is None:
+            encoded = self.encoder.encode({
+                "success": success,
+                "code": code,
+                "data": ENVELOPE_DATA_MARKER
+            })
+            parts = tuple(encoded.split(self.encoder.encode(ENVELOPE_DATA_MARKER)))
+            self._envelope_parts[(success, code)] = parts
+        return parts
+
+
+ENVELOPE_DATA_MARKER = "__envelope_data__"
+
+
+class Selection(object):
+    """ The keys of an object to serialize, the keys of its nested objects to expand, and the selections of its nested
+    objects, as parsed by parse_selection. A selection must not be modified once its key has been computed.
+    """
+
+    def __init__(self, keys=None, expand=None):
+        """
+        Args:
+            keys: a set of the keys to serialize, or None for all keys
+            expand: a set of the keys of the nested objects to expand, or None to expand all nested objects
+        """
+        self.keys = keys
+        self.expand = expand
+        self.nested = {}
+        self.key = None
+
+    def includes(self, key):
+        return self.keys is None or key in self.keys
+
+    def expands(self, key):
+        return self.expand is None or key in self.expand
+
+    def child(self, key):
+        selection = self.nested.get(key)
+        if selection is None:
+            selection = Selection()
+            self.nested[key] = selection
+        return selection
+
+    def freeze(self):
+        """ Computes the hashable key identifying the selection, used to cache serializers compiled for it
+
+        Returns: the selection
+
+        """
+        for selection in self.nested.values():
+            selection.freeze()
+        self.key = (frozenset(self.keys) if self.keys is not None else None,
+                    frozenset(self.expand) if self.expand is not None else None,
+                    tuple(sorted((key, selection.key) for key, selection in self.nested.items())))
+        return self
+
+
+def parse_selection(fields, expand):
+    """ Parses sparse fieldset and expansion parameters
+
+    Args:
+        fields: comma-separated keys to serialize, or None for all keys. Keys of nested objects are prefixed with the
+            key of the nested object and a dot, e.g. "id,users.id" serializes the id of an object and the ids of its
+            users. The keys of a nested object that is specified without any of its keys are all serialized.
+        expand: comma-separated keys of the nested objects to expand, or None to expand all nested objects. Nested
+            objects that are not expanded are replaced by their ids or omitted. An empty string expands none.
+
+    Returns: the Selection, or None if both parameters are None
+
+    """
+    if fields is None and expand is None:
+        return None
+    selection = Selection()
+    if fields is not None:
+        selection.keys = set()
+        for field in fields.split(","):
+            path = [key.strip() for key in field.split(".")]
+            if "" in path:
+                continue
+            node = selection
+            for key in path[:-1]:
+                node.keys.add(key)
+                node = node.child(key)
+                if node.keys is None:
+                    node.keys = set()
+            node.keys.add(path[-1])
+    if expand is not None:
+        selection.expand = set()
+        for field in expand.split(","):
+            path = [key.strip() for key in field.split(".")]
+            if "" in path:
+                continue
+            node = selection
+            for key in path:
+                if node.expand is None:
+                    node.expand = set()
+                node.expand.add(key)
+                node = node.child(key)
+    return selection.freeze()
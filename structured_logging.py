@@ -0,0 +1,149 @@
+import datetime
+import json
+import logging
+import random
+import threading
+import zlib
+from Queue import Queue, Full
+
+# The attributes of every LogRecord, which are not serialized as extra fields
+RECORD_ATTRIBUTES = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | frozenset(["message", "asctime"])
+
+
+class QueueHandler(logging.Handler):
+    """ Handler that enqueues records for a QueueListener instead of writing them, so that logging never blocks the
+    calling thread on I/O. Records are dropped (and counted in dropped) if the queue is full.
+    """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.dropped = 0
+
+    def prepare(self, record):
+        """ Formats the message and exception of a record in the calling thread, as its arguments may not be safe
+        to use from another thread, and returns the record
+        """
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """ Writes the records enqueued by QueueHandlers to handlers from a background thread """
+
+    _SENTINEL = None
+
+    def __init__(self, queue, *handlers):
+        self.queue = queue
+        self.handlers = handlers
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._monitor, name="log-listener")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Writes the records already enqueued, then stops the background thread """
+        if self._thread is None:
+            return
+        self.queue.put(self._SENTINEL)
+        self._thread.join()
+        self._thread = None
+
+    def _monitor(self):
+        while True:
+            record = self.queue.get()
+            if record is self._SENTINEL:
+                return
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    try:
+                        handler.handle(record)
+                    except Exception:
+                        handler.handleError(record)
+
+
+class ContextFilter(logging.Filter):
+    """ Adds the id of the request being handled to records, as request_id """
+
+    def __init__(self, get_request_id):
+        """
+        Args:
+            get_request_id: function returning the id of the current request, or None outside of requests
+        """
+        logging.Filter.__init__(self)
+        self.get_request_id = get_request_id
+
+    def filter(self, record):
+        if getattr(record, "request_id", None) is None:
+            record.request_id = self.get_request_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """ Passes a fraction of the records from a logger (and its children) or below a level, and all other records.
+    Records with a request_id are sampled by request, so either all or none of a request's records pass.
+    """
+
+    def __init__(self, rate, name=None, below_level=None):
+        """
+        Args:
+            rate: the fraction of the matching records to pass, from 0 to 1
+            name: the name of the logger whose records are sampled, or None for all loggers
+            below_level: the level below which records are sampled, or None for all levels
+        """
+        logging.Filter.__init__(self)
+        self.rate = rate
+        self.prefix = name + "." if name is not None else None
+        self.logger_name = name
+        self.below_level = below_level
+
+    def filter(self, record):
+        if self.logger_name is not None and record.name != self.logger_name and \
+                not record.name.startswith(self.prefix):
+            return True
+        if self.below_level is not None and record.levelno >= self.below_level:
+            return True
+        if self.rate >= 1:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            return (zlib.crc32(request_id) & 0xffffffff) < self.rate * 0x100000000
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """ Formats records as single-line JSON objects of the time, level, logger, message, request_id and any extra
+    fields passed to the logging call
+    """
+
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None)
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES and key not in data:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=repr, sort_keys=True)
@@ -0,0 +1,6 @@
+""" Tests of enactus_app against a temporary SQLite database seeded with the benchmark dataset
+
+Run from the repository root with
+
+    python -m unittest discover tests
+"""
@@ -0,0 +1,104 @@
+import atexit
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+import enactus_app
+import uploads
+from benchmarks import dataset
+from benchmarks.run import StubGoogleClient
+
+USERS = 60
+TEAMS = 6
+TASKS = 12
+
+_workdir = tempfile.mkdtemp(prefix="enactus-tests-")
+atexit.register(shutil.rmtree, _workdir, True)
+
+app = enactus_app.app
+app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///%s" % os.path.join(_workdir, "tests.db")
+app.config["SQLALCHEMY_BINDS"] = {}
+app.config["GOOGLE_CLIENT"] = StubGoogleClient(dataset.ADMIN_EMAIL)
+app.config["SLOW_REQUEST_THRESHOLD"] = float("inf")
+app.config["RECOVER_JOBS_ON_START"] = False
+enactus_app.submission_store = uploads.ContentStore(os.path.join(_workdir, "uploads"),
+                                                    app.config["UPLOAD_CHUNK_SIZE"],
+                                                    app.config["MAX_SUBMISSION_SIZE"])
+
+_ids = None
+
+
+def seeded_ids():
+    """ Seeds the database once per test run, as the app's in-process caches cannot be reset between seeds
+
+    Returns: the ids returned by dataset.seed
+
+    """
+    global _ids
+    if _ids is None:
+        with app.app_context():
+            _ids = dataset.seed(enactus_app, USERS, TEAMS, TASKS)
+        _ids["users"] = USERS
+    return _ids
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+class AppTestCase(unittest.TestCase):
+    """ Test case with clients logged in as the seeded administrator and team member """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ids = seeded_ids()
+        cls.admin = cls.client(dataset.ADMIN_EMAIL)
+        cls.member = cls.client(dataset.MEMBER_EMAIL)
+
+    @staticmethod
+    def client(email):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["username"] = email
+        return client
+
+    @classmethod
+    def request(cls, client, method, path, data=None):
+        """ Sends a request, with data encoded as JSON, and reads the whole response
+
+        Returns: a tuple of the response and its decoded JSON body
+
+        """
+        kwargs = {"data": json.dumps(data), "content_type": "application/json"} if data is not None else {}
+        response = getattr(client, method)(path, **kwargs)
+        return response, json.loads(response.get_data())
+
+    @contextmanager
+    def count_queries(self):
+        """ Context manager yielding a QueryCounter of the statements executed within it """
+        counter = QueryCounter()
+        with app.app_context():
+            engine = enactus_app.db.engine
+        event.listen(engine, "before_cursor_execute", counter)
+        try:
+            yield counter
+        finally:
+            event.remove(engine, "before_cursor_execute", counter)
+
+    def query_count(self, client, path):
+        """ Returns: the number of statements executed by a GET request, which must succeed """
+        with self.count_queries() as counter:
+            response, body = self.request(client, "get", path)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body["success"], body)
+        return counter.count
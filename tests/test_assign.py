@@ -0,0 +1,62 @@
+import constants
+import enactus_app
+from tests.support import AppTestCase, app
+
+
+class AssignChangeSeqTest(AppTestCase):
+
+    def change_seq(self):
+        with app.app_context():
+            return enactus_app.get_cache_version("change_seq")
+
+    def test_assignment_allocates_change_seq_only_when_it_writes(self):
+        userid, taskid = self.ids["users"] - 2, self.ids["task_ids"][2]
+        with app.app_context():
+            enactus_app.TaskStatus.query.filter_by(user_id=userid, task_id=taskid).delete()
+            enactus_app.db.session.commit()
+        before = self.change_seq()
+        response, body = self.request(self.admin, "post", "/assign", {"users": [userid], "tasks": [taskid]})
+        self.assertEqual(body["data"], {"inserted": 1, "promoted": 0})
+        self.assertEqual(self.change_seq(), before + 1)
+        with app.app_context():
+            taskstatus = enactus_app.TaskStatus.query.filter_by(user_id=userid, task_id=taskid).one()
+            self.assertEqual((taskstatus.status, taskstatus.change_seq), (constants.STATUS_AVAILABLE, before + 1))
+            self.assertEqual(enactus_app.TaskStatus.query.filter_by(
+                change_seq=enactus_app.PENDING_CHANGE_SEQ).count(), 0)
+        response, body = self.request(self.admin, "post", "/assign", {"users": [userid], "tasks": [taskid]})
+        self.assertEqual(body["data"], {"inserted": 0, "promoted": 0})
+        self.assertEqual(self.change_seq(), before + 1)
+
+
+class AssignTasksTest(AppTestCase):
+
+    def test_assignment_in_chunks(self):
+        userids = []
+        for name in ("first", "second", "third"):
+            response, body = self.request(self.admin, "post", "/user", {
+                "email": "%s@assign.local" % name, "display_name": name, "privilege": 1})
+            userids.append(body["data"]["id"])
+        seeded_userid, taskids = self.ids["users"] - 3, self.ids["task_ids"][3:5]
+        with app.app_context():
+            enactus_app.TaskStatus.query.filter_by(user_id=seeded_userid, task_id=taskids[0]) \
+                .update({enactus_app.TaskStatus.status: constants.STATUS_UNAVAILABLE})
+            enactus_app.TaskStatus.query.filter_by(user_id=seeded_userid, task_id=taskids[1]).delete()
+            enactus_app.db.session.commit()
+        batch_size = app.config["ASSIGN_BATCH_SIZE"]
+        # Each chunk covers one user, so the assignment takes four chunks
+        app.config["ASSIGN_BATCH_SIZE"] = 3
+        try:
+            request = {"users": userids + [seeded_userid, 99999], "tasks": taskids + [99999]}
+            response, body = self.request(self.admin, "post", "/assign", request)
+            self.assertEqual(body["data"], {"inserted": 7, "promoted": 1})
+            response, body = self.request(self.admin, "post", "/assign", request)
+            self.assertEqual(body["data"], {"inserted": 0, "promoted": 0})
+        finally:
+            app.config["ASSIGN_BATCH_SIZE"] = batch_size
+        with app.app_context():
+            statuses = enactus_app.db.session.query(enactus_app.TaskStatus.user_id, enactus_app.TaskStatus.task_id,
+                                                    enactus_app.TaskStatus.status) \
+                .filter(enactus_app.TaskStatus.user_id.in_(userids + [seeded_userid]),
+                        enactus_app.TaskStatus.task_id.in_(taskids)).all()
+        self.assertEqual(sorted(statuses), [(userid, taskid, constants.STATUS_AVAILABLE)
+                                            for userid in sorted(userids + [seeded_userid]) for taskid in taskids])
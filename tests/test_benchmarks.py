@@ -0,0 +1,54 @@
+import sys
+import unittest
+from StringIO import StringIO
+
+from benchmarks import run
+
+
+class SummaryTest(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([run.percentile(values, percent) for percent in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(run.percentile([7], 99), 7)
+        self.assertEqual(run.percentile([], 50), 0)
+
+    def test_summarize(self):
+        result = run.summarize([0.004, 0.001, 0.002, 0.003], 10, 1, 1000, 1500)
+        self.assertEqual(result["requests"], 4)
+        self.assertAlmostEqual(result["throughput"], 400)
+        self.assertAlmostEqual(result["p50_ms"], 2)
+        self.assertAlmostEqual(result["p99_ms"], 4)
+        self.assertEqual((result["queries"], result["errors"]), (2.5, 1))
+        self.assertEqual((result["peak_rss_kb"], result["rss_growth_kb"]), (1500, 500))
+        result = run.summarize([], 0, 0, None, None)
+        self.assertEqual((result["throughput"], result["queries"], result["rss_growth_kb"]), (None, 0, None))
+
+
+class CompareTest(unittest.TestCase):
+
+    def result(self, p95_ms, queries):
+        return {"p50_ms": p95_ms / 2, "p95_ms": p95_ms, "queries": queries}
+
+    def compare(self, baseline, results, tolerance=0.2):
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            return run.compare(baseline, results, tolerance)
+        finally:
+            sys.stdout = stdout
+
+    def test_regressions_are_reported(self):
+        baseline = {
+            "GET /a": self.result(10, 2),
+            "GET /b": self.result(10, 2),
+            "GET /c": self.result(10, 2),
+            "GET /removed": self.result(10, 2)
+        }
+        results = {
+            "GET /a": self.result(11.9, 2),
+            "GET /b": self.result(12.1, 2),
+            "GET /c": self.result(5, 3),
+            "GET /added": self.result(100, 100)
+        }
+        self.assertEqual(self.compare(baseline, results), ["GET /b", "GET /c"])
+        self.assertEqual(self.compare(baseline, results, tolerance=0.5), ["GET /c"])
@@ -0,0 +1,60 @@
+import time
+import unittest
+
+import caching
+
+
+class TTLCacheTest(unittest.TestCase):
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = caching.TTLCache(2, 60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+
+    def test_entries_expire(self):
+        cache = caching.TTLCache(10, 60)
+        cache.set("expired", 1, ttl=-1)
+        cache.set("fresh", 2)
+        self.assertEqual(cache.get("expired", "default"), "default")
+        self.assertEqual(cache.get("fresh"), 2)
+        cache.invalidate("fresh")
+        self.assertIsNone(cache.get("fresh"))
+
+
+class VersionedSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.version = 1
+        self.version_checks = 0
+        self.loads = []
+        self.snapshot = caching.VersionedSnapshot(self.load, self.get_version, 60)
+
+    def load(self, version):
+        self.loads.append(version)
+        return "snapshot %d" % version
+
+    def get_version(self):
+        self.version_checks += 1
+        return self.version
+
+    def test_version_is_checked_once_per_interval(self):
+        self.assertEqual(self.snapshot.get(), "snapshot 1")
+        self.version = 2
+        self.assertEqual(self.snapshot.get(), "snapshot 1")
+        self.assertEqual(self.snapshot.current(), "snapshot 1")
+        self.assertEqual(self.version_checks, 1)
+        self.assertEqual(self.snapshot.get(max_age=0), "snapshot 2")
+        self.assertEqual(self.loads, [1, 2])
+
+    def test_invalidate_forces_a_version_check(self):
+        self.snapshot.get()
+        self.snapshot.invalidate()
+        self.assertEqual(self.snapshot.get(), "snapshot 1")
+        self.assertEqual((self.version_checks, self.loads), (2, [1]))
+        self.version = 3
+        self.snapshot.invalidate()
+        self.assertEqual(self.snapshot.get(), "snapshot 3")
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import constants
+import enactus_app
+from tests.support import AppTestCase, app
+
+
+class TaskStatusChangesTest(AppTestCase):
+
+    def setUp(self):
+        self.poll_interval = app.config["CHANGES_POLL_INTERVAL"]
+        app.config["CHANGES_POLL_INTERVAL"] = 0.05
+
+    def tearDown(self):
+        app.config["CHANGES_POLL_INTERVAL"] = self.poll_interval
+
+    def changes(self, since=None, wait=None):
+        path = "/tasks/changes?" + "&".join(["%s=%s" % (name, value) for name, value in
+                                             [("since", since), ("wait", wait)] if value is not None])
+        response, body = self.request(self.member, "get", path)
+        self.assertTrue(body["success"], body)
+        return body["data"]
+
+    def grade(self, taskid):
+        """ Changes the status of one of the member's taskStatus through /grade """
+        with app.app_context():
+            status = enactus_app.TaskStatus.query.filter_by(user_id=self.ids["member_id"], task_id=taskid).one().status
+        status = constants.STATUS_SUBMITTED if status != constants.STATUS_SUBMITTED else constants.STATUS_AVAILABLE
+        response, body = self.request(self.admin, "post", "/grade", [{
+            "user_id": self.ids["member_id"], "task_id": taskid, "status": status, "points": 0}])
+        self.assertTrue(body["data"][0]["success"], body)
+
+    def test_changes_since_cursor(self):
+        data = self.changes()
+        with app.app_context():
+            count = enactus_app.TaskStatus.query.filter_by(user_id=self.ids["member_id"]).count()
+        self.assertEqual(len(data["task_statuses"]), count)
+        self.assertEqual(data["tasks"], [])
+        cursor = data["cursor"]
+        self.assertEqual(self.changes(cursor), {"cursor": cursor, "task_statuses": [], "tasks": []})
+
+        taskid = data["task_statuses"][0]["task"]["id"]
+        self.grade(taskid)
+        data = self.changes(cursor)
+        self.assertGreater(data["cursor"], cursor)
+        self.assertEqual([status["task"]["id"] for status in data["task_statuses"]], [taskid])
+        self.assertEqual(data["tasks"], [])
+
+        cursor = data["cursor"]
+        task = data["task_statuses"][0]["task"]
+        task["description"] = "Changed description"
+        response, body = self.request(self.admin, "put", "/task", task)
+        self.assertTrue(body["success"], body)
+        data = self.changes(cursor)
+        self.assertEqual([(task["id"], task["description"]) for task in data["tasks"]],
+                         [(taskid, "Changed description")])
+        self.assertEqual(data["task_statuses"], [])
+
+    def test_long_poll_returns_once_a_change_is_committed(self):
+        data = self.changes()
+        cursor, taskid = data["cursor"], data["task_statuses"][-1]["task"]["id"]
+        start = time.time()
+        self.assertEqual(self.changes(cursor, wait=0.2)["task_statuses"], [])
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+        grader = threading.Timer(0.2, self.grade, [taskid])
+        grader.start()
+        start = time.time()
+        try:
+            data = self.changes(cursor, wait=10)
+        finally:
+            grader.join()
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual([status["task"]["id"] for status in data["task_statuses"]], [taskid])
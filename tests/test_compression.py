@@ -0,0 +1,71 @@
+import json
+import unittest
+import zlib
+
+import compression
+import enactus_app
+from tests.support import AppTestCase, app
+
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class CompressionTest(unittest.TestCase):
+
+    def test_streamed_chunks_are_flushed(self):
+        chunks = ["[" + ",".join(['{"id":%d,"name":"Team %d"}' % (i, i) for i in range(j, j + 50)]) + "]"
+                  for j in range(0, 200, 50)]
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decompressed = []
+        for compressed in compression.iter_compressed(iter(chunks), "gzip"):
+            decompressed.append(decompressor.decompress(compressed))
+        # Each chunk can be decompressed as soon as it is received
+        self.assertEqual(decompressed[:len(chunks)], chunks)
+        self.assertEqual("".join(decompressed), "".join(chunks))
+        self.assertEqual(gunzip(compression.compress("".join(chunks), "gzip")), "".join(chunks))
+
+
+class ResponseCompressionTest(AppTestCase):
+
+    def get(self, path, encoding="gzip"):
+        """ Returns: the response, which has been read, so that its streamed body no longer holds the request context
+        """
+        headers = {"Accept-Encoding": encoding} if encoding is not None else {}
+        response = self.member.get(path, headers=headers)
+        response.get_data()
+        return response
+
+    def test_streamed_responses_are_compressed(self):
+        plain = self.get("/teams", None)
+        compressed = self.get("/teams")
+        self.assertIsNone(plain.headers.get("Content-Encoding"))
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", compressed.headers["Vary"])
+        self.assertEqual(gunzip(compressed.get_data()), plain.get_data())
+        self.assertLess(len(compressed.get_data()), len(plain.get_data()))
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.get("/task/%d?fields=id" % self.ids["task_ids"][0])
+        self.assertLess(len(response.get_data()), app.config["COMPRESSION_MIN_SIZE"])
+        self.assertIsNone(response.headers.get("Content-Encoding"))
+        self.assertTrue(json.loads(response.get_data())["success"])
+
+    def test_task_payloads_are_compressed_once_per_version(self):
+        taskid = self.ids["task_ids"][7]
+        compress = compression.compress
+        calls = []
+
+        def counting_compress(data, encoding, level=6):
+            calls.append(encoding)
+            return compress(data, encoding, level)
+
+        enactus_app.compression.compress = counting_compress
+        try:
+            responses = [self.get("/task/%d" % taskid) for i in range(3)]
+        finally:
+            enactus_app.compression.compress = compress
+        self.assertLessEqual(len(calls), 1)
+        for response in responses:
+            self.assertEqual(response.headers["Content-Encoding"], "gzip")
+            self.assertEqual(gunzip(response.get_data()), self.get("/task/%d" % taskid, None).get_data())
@@ -0,0 +1,75 @@
+import json
+
+import constants
+from tests.support import AppTestCase
+
+
+class ConditionalGetTest(AppTestCase):
+
+    def get(self, client, path, etag=None):
+        headers = {"If-None-Match": '"%s"' % etag} if etag is not None else {}
+        return client.get(path, headers=headers)
+
+    def test_task_etag(self):
+        response = self.get(self.member, "/task/3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Cache-Control"], "private, max-age=60")
+        etag = response.get_etag()[0]
+        response = self.get(self.member, "/task/3", etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b"")
+        self.assertEqual(response.get_etag()[0], etag)
+        response, body = self.request(self.admin, "put", "/task", {
+            "id": 3, "name": "Task 3", "description": "Updated", "max_points": 10, "type": 0, "category": 0})
+        self.assertTrue(body["success"], body)
+        response = self.get(self.member, "/task/3", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.get_etag()[0], etag)
+        self.assertIn(b"Updated", response.get_data())
+
+    def test_team_etag_changes_with_membership(self):
+        teamid = self.ids["team_ids"][-1]
+        response = self.get(self.member, "/team/%d" % teamid)
+        self.assertEqual(response.headers["Cache-Control"], "private, no-cache")
+        etag = response.get_etag()[0]
+        self.assertEqual(self.get(self.member, "/team/%d" % teamid, etag).status_code, 304)
+        response, body = self.request(self.admin, "post", "/user", {
+            "email": "joiner@benchmark.local", "display_name": "Joiner", "privilege": 1})
+        joinerid = body["data"]["id"]
+        response, body = self.request(self.admin, "get", "/team/%d" % teamid)
+        userids = [user["id"] for user in body["data"]["users"]]
+        response, body = self.request(self.admin, "put", "/team", {"id": teamid, "userids": userids + [joinerid]})
+        self.assertTrue(body["success"], body)
+        self.assertEqual(self.get(self.member, "/team/%d" % teamid, etag).status_code, 200)
+
+    def test_list_etags_short_circuit_before_loading_rows(self):
+        for client, path in [(self.member, "/tasks"), (self.member, "/teams"),
+                             (self.admin, "/user/%d/tasks" % self.ids["member_id"])]:
+            with self.count_queries() as full:
+                response = self.get(client, path)
+                response.get_data()
+            etag = response.get_etag()[0]
+            with self.count_queries() as conditional:
+                response = self.get(client, path, etag)
+            self.assertEqual(response.status_code, 304, path)
+            self.assertLess(conditional.count, full.count, path)
+
+    def test_etags_change_with_the_data(self):
+        path = "/user/%d" % self.ids["member_id"]
+        etag = self.get(self.member, path).get_etag()[0]
+        self.assertEqual(self.get(self.member, path, etag).status_code, 304)
+        response, body = self.request(self.member, "put", "/user", {
+            "id": self.ids["member_id"], "display_name": "Renamed member"})
+        self.assertTrue(body["success"], body)
+        self.assertEqual(self.get(self.member, path, etag).status_code, 200)
+
+        response = self.get(self.member, "/tasks")
+        response.get_data()
+        etag = response.get_etag()[0]
+        taskstatus = json.loads(response.get_data())["data"][1]
+        status = constants.STATUS_SUBMITTED if taskstatus["status"] != constants.STATUS_SUBMITTED else \
+            constants.STATUS_AVAILABLE
+        response, body = self.request(self.admin, "post", "/grade", [{
+            "user_id": self.ids["member_id"], "task_id": taskstatus["task"]["id"], "status": status, "points": 0}])
+        self.assertTrue(body["data"][0]["success"], body)
+        self.assertEqual(self.get(self.member, "/tasks", etag).status_code, 200)
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+import enactus_app
+from tests.support import AppTestCase, QueryCounter, app
+
+
+class ConnectionPingTest(unittest.TestCase):
+
+    def test_dead_idle_connection_is_replaced_on_checkout(self):
+        engine = sqlalchemy.create_engine("sqlite://", poolclass=QueuePool)
+        counter = QueryCounter()
+        event.listen(engine, "before_cursor_execute", counter)
+        connection = engine.connect()
+        dbapi_connection, record = connection.connection.connection, connection.connection._connection_record
+        connection.close()
+        dbapi_connection.close()
+        record.info["checked_in_at"] -= app.config["DATABASE_PING_IDLE_TIME"] + 1
+        self.assertEqual(engine.scalar("SELECT 2"), 2)
+        # The ping is made on the DBAPI connection, so only the statement itself is counted
+        self.assertEqual(counter.count, 1)
+
+    def test_recently_used_connection_is_not_pinged(self):
+        engine = sqlalchemy.create_engine("sqlite://", poolclass=QueuePool)
+        connection = engine.connect()
+        dbapi_connection = connection.connection.connection
+        connection.close()
+        dbapi_connection.close()
+        # Within DATABASE_PING_IDLE_TIME of its last use, a connection is assumed to be alive
+        with self.assertRaises(sqlalchemy.exc.ProgrammingError):
+            engine.scalar("SELECT 2")
+
+
+class ReplicaRoutingTest(AppTestCase):
+    """ Uses a copy of the test database as the read replica, which then lags behind the writes made to the primary """
+
+    @classmethod
+    def setUpClass(cls):
+        super(ReplicaRoutingTest, cls).setUpClass()
+        cls.workdir = tempfile.mkdtemp(prefix="enactus-replica-")
+        with app.app_context():
+            cls.teamid, cls.team_name = enactus_app.db.session.query(enactus_app.Team.id, enactus_app.Team.name) \
+                .order_by(enactus_app.Team.id).first()
+            primary = enactus_app.db.engine.url.database
+        replica = os.path.join(cls.workdir, "replica.db")
+        shutil.copyfile(primary, replica)
+        cls.original_binds = app.config["SQLALCHEMY_BINDS"]
+        app.config["SQLALCHEMY_BINDS"] = {enactus_app.REPLICA_BIND: "sqlite:///%s" % replica}
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config["SQLALCHEMY_BINDS"] = cls.original_binds
+        shutil.rmtree(cls.workdir, ignore_errors=True)
+
+    def setUp(self):
+        self.rename_on_primary("Renamed on the primary")
+        with app.app_context():
+            self.primary = enactus_app.db.engine
+            self.replica = enactus_app.db.get_engine(app, bind=enactus_app.REPLICA_BIND)
+        self.primary_queries, self.replica_queries = QueryCounter(), QueryCounter()
+        event.listen(self.primary, "before_cursor_execute", self.primary_queries)
+        event.listen(self.replica, "before_cursor_execute", self.replica_queries)
+
+    def tearDown(self):
+        event.remove(self.primary, "before_cursor_execute", self.primary_queries)
+        event.remove(self.replica, "before_cursor_execute", self.replica_queries)
+        self.rename_on_primary(self.team_name)
+
+    def rename_on_primary(self, name):
+        with app.app_context():
+            team = enactus_app.Team.__table__
+            enactus_app.db.session.execute(team.update().where(team.c.id == self.teamid).values(name=name))
+            enactus_app.db.session.commit()
+
+    def read_team_name(self):
+        return enactus_app.db.session.query(enactus_app.Team.name).filter_by(id=self.teamid).scalar()
+
+    def test_read_replica_handler_reads_from_replica(self):
+        response, body = self.request(self.member, "get", "/team/%d" % self.teamid)
+        self.assertEqual(body["data"]["name"], self.team_name)
+        self.assertGreater(self.replica_queries.count, 0)
+
+    def test_writes_and_reads_after_writes_go_to_primary(self):
+        with app.test_request_context():
+            enactus_app.db.session().use_replica = True
+            self.assertEqual(self.read_team_name(), self.team_name)
+            self.assertEqual(self.primary_queries.count, 0)
+            team = enactus_app.Team.__table__
+            enactus_app.db.session.execute(team.update().where(team.c.id == self.teamid).values(name="Written"))
+            self.assertFalse(enactus_app.db.session().use_replica)
+            self.assertEqual(self.read_team_name(), "Written")
+            enactus_app.db.session.rollback()
+        self.assertEqual(self.replica_queries.count, 1)
+
+    def test_primary_reads_bypass_replica(self):
+        with app.test_request_context():
+            enactus_app.db.session().use_replica = True
+            with enactus_app.primary_reads():
+                self.assertEqual(self.read_team_name(), "Renamed on the primary")
+            self.assertTrue(enactus_app.db.session().use_replica)
+        self.assertEqual(self.replica_queries.count, 0)
@@ -0,0 +1,66 @@
+import threading
+
+import constants
+import enactus_app
+import error_codes
+from tests.support import AppTestCase, app
+
+
+class GradeVersionTest(AppTestCase):
+
+    def test_promotion_conflicts_with_stale_grade(self):
+        userid, taskid = self.ids["users"], self.ids["task_ids"][0]
+        with app.app_context():
+            taskstatus = enactus_app.TaskStatus.query.filter_by(user_id=userid, task_id=taskid).one()
+            taskstatus.status = constants.STATUS_UNAVAILABLE
+            enactus_app.db.session.commit()
+            version = taskstatus.version
+        response, body = self.request(self.admin, "post", "/assign", {"users": [userid], "tasks": [taskid]})
+        self.assertEqual(body["data"]["promoted"], 1)
+        response, body = self.request(self.admin, "post", "/grade", [{
+            "user_id": userid, "task_id": taskid, "status": constants.STATUS_COMPLETED, "points": 5,
+            "version": version}])
+        self.assertFalse(body["data"][0]["success"])
+        self.assertEqual(body["data"][0]["code"], error_codes.VERSION_CONFLICT)
+
+    def test_grades_are_reapplied_after_concurrent_modification(self):
+        userid, taskid = self.ids["users"] - 1, self.ids["task_ids"][1]
+        with app.app_context():
+            table = enactus_app.TaskStatus.__table__
+            enactus_app.db.session.execute(
+                table.update().where(table.c.user_id == userid).where(table.c.task_id == taskid)
+                .values(status=constants.STATUS_SUBMITTED, points=0))
+            enactus_app.db.session.commit()
+            version = enactus_app.TaskStatus.query.filter_by(user_id=userid, task_id=taskid).one().version
+        next_change_seq = enactus_app.next_change_seq
+        calls = []
+
+        def modify_concurrently():
+            with app.app_context():
+                enactus_app.db.session.execute(
+                    table.update().where(table.c.user_id == userid).where(table.c.task_id == taskid)
+                    .values(version=table.c.version + 1))
+                enactus_app.db.session.commit()
+
+        def next_change_seq_after_modification():
+            # The first attempt is preceded by a write committed between its SELECT and UPDATE
+            if len(calls) == 0:
+                writer = threading.Thread(target=modify_concurrently)
+                writer.start()
+                writer.join(10)
+            calls.append(True)
+            return next_change_seq()
+
+        enactus_app.next_change_seq = next_change_seq_after_modification
+        try:
+            response, body = self.request(self.admin, "post", "/grade", [{
+                "user_id": userid, "task_id": taskid, "status": constants.STATUS_COMPLETED, "points": 5}])
+        finally:
+            enactus_app.next_change_seq = next_change_seq
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(body["data"][0]["success"], body)
+        self.assertEqual(body["data"][0]["version"], version + 2)
+        with app.app_context():
+            taskstatus = enactus_app.TaskStatus.query.filter_by(user_id=userid, task_id=taskid).one()
+            self.assertEqual((taskstatus.status, taskstatus.points, taskstatus.version),
+                             (constants.STATUS_COMPLETED, 5, version + 2))
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import unittest
+
+import ingest
+
+
+class IterJsonArrayTest(unittest.TestCase):
+
+    def parse(self, text, read_size):
+        return list(ingest.iter_json_array(io.BytesIO(text.encode("utf-8")), read_size))
+
+    def test_elements_split_across_reads(self):
+        values = [{"name": u"café %d" % i, "points": i * 1001} for i in range(50)] + [12345, u"é", [], None]
+        text = u" [ " + u" ,\n ".join(json.dumps(value, ensure_ascii=False) for value in values) + u" ] "
+        for read_size in (1, 2, 3, 7, 64, 65536):
+            self.assertEqual(self.parse(text, read_size), values, read_size)
+
+    def test_empty_array(self):
+        self.assertEqual(self.parse(u"[]", 1), [])
+        self.assertEqual(self.parse(u" [ \n ] ", 2), [])
+
+    def test_malformed_arrays(self):
+        for text in (u"", u"{}", u"[1 2]", u"[1,", u"[1", u"[1,]"):
+            with self.assertRaises(ValueError):
+                self.parse(text, 2)
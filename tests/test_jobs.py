@@ -0,0 +1,86 @@
+import json
+import time
+
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+
+import constants
+import enactus_app
+from tests.support import AppTestCase, app
+
+
+class JobRecoveryTest(AppTestCase):
+
+    def add_job(self, status):
+        with app.app_context():
+            job = enactus_app.Job()
+            job.kind = "assign"
+            job.status = status
+            job.params = json.dumps({"users": [self.ids["users"]], "tasks": [self.ids["task_ids"][0]]})
+            enactus_app.db.session.add(job)
+            enactus_app.db.session.commit()
+            return job.id
+
+    def job(self, jobid):
+        with app.app_context():
+            return enactus_app.Job.query.filter_by(id=jobid).one().serialize()
+
+    def test_recover_jobs_command_runs_queued_jobs(self):
+        queued, running = self.add_job(constants.JOB_QUEUED), self.add_job(constants.JOB_RUNNING)
+        result = CliRunner().invoke(app.cli, ["recover-jobs"], obj=ScriptInfo(create_app=lambda info: app))
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.job(queued)["status"], constants.JOB_COMPLETED)
+        self.assertEqual(self.job(queued)["total"], 1)
+        self.assertEqual(self.job(running)["status"], constants.JOB_FAILED)
+
+    def test_claimed_job_is_not_run_again(self):
+        jobid = self.add_job(constants.JOB_QUEUED)
+        enactus_app.run_job(jobid)
+        self.assertEqual(self.job(jobid)["status"], constants.JOB_COMPLETED)
+        with app.app_context():
+            enactus_app.Job.query.filter_by(id=jobid).update({enactus_app.Job.processed: 0})
+            enactus_app.db.session.commit()
+        enactus_app.run_job(jobid)
+        self.assertEqual(self.job(jobid)["processed"], 0)
+
+
+class BackgroundJobTest(AppTestCase):
+
+    def wait_for_job(self, jobid):
+        """ Returns: the job once it has finished, as returned by /jobs/<jobid> """
+        deadline = time.time() + 10
+        while True:
+            response, body = self.request(self.admin, "get", "/jobs/%d" % jobid)
+            self.assertTrue(body["success"], body)
+            if body["data"]["status"] in (constants.JOB_COMPLETED, constants.JOB_FAILED) or time.time() > deadline:
+                return body["data"]
+            time.sleep(0.05)
+
+    def test_background_assignment(self):
+        userids, taskid = [self.ids["users"] - 5, self.ids["users"] - 6], self.ids["task_ids"][9]
+        with app.app_context():
+            enactus_app.TaskStatus.query.filter(enactus_app.TaskStatus.user_id.in_(userids),
+                                                enactus_app.TaskStatus.task_id == taskid).delete(False)
+            enactus_app.db.session.commit()
+        response, body = self.request(self.admin, "post", "/assign",
+                                      {"users": userids, "tasks": [taskid], "background": True})
+        self.assertTrue(body["success"], body)
+        self.assertEqual(body["data"]["kind"], "assign")
+        job = self.wait_for_job(body["data"]["id"])
+        self.assertEqual(job["status"], constants.JOB_COMPLETED)
+        self.assertEqual((job["processed"], job["total"]), (2, 2))
+        self.assertEqual(job["result"], {"inserted": 2, "promoted": 0})
+
+    def test_failed_job(self):
+        def fail(job, params, progress):
+            raise RuntimeError("job failed")
+
+        enactus_app.JOB_RUNNERS["failing"] = fail
+        try:
+            with app.test_request_context():
+                jobid = enactus_app.enqueue_job("failing", {}).id
+            job = self.wait_for_job(jobid)
+        finally:
+            del enactus_app.JOB_RUNNERS["failing"]
+        self.assertEqual(job["status"], constants.JOB_FAILED)
+        self.assertEqual(job["result"], "Job failed due to an internal error")
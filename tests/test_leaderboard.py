@@ -0,0 +1,58 @@
+import constants
+import enactus_app
+from tests.support import AppTestCase, app
+
+
+class LeaderboardTest(AppTestCase):
+
+    def scores(self):
+        """ Returns: a tuple of dicts of each user's and team's (points, completed), as stored in the score tables """
+        with app.app_context():
+            users = dict((userid, (points, completed)) for userid, teamid, points, completed in
+                         enactus_app.db.session.query(enactus_app.UserScore.user_id, enactus_app.UserScore.team_id,
+                                                      enactus_app.UserScore.points, enactus_app.UserScore.completed))
+            teams = dict((teamid, (points, completed)) for teamid, points, completed in
+                         enactus_app.db.session.query(enactus_app.TeamScore.team_id, enactus_app.TeamScore.points,
+                                                      enactus_app.TeamScore.completed))
+            return users, teams
+
+    def assertScoresMatchRebuild(self):
+        scores = self.scores()
+        with app.app_context():
+            enactus_app.rebuild_leaderboard()
+        self.assertEqual(scores, self.scores())
+
+    def leaderboard(self, kind):
+        response, body = self.request(self.member, "get", "/leaderboard/%s?limit=1000" % kind)
+        self.assertTrue(body["success"], body)
+        return body["data"]
+
+    def test_grades_update_user_and_team_scores(self):
+        # Other tests write some taskStatus directly, without updating the scores
+        with app.app_context():
+            enactus_app.rebuild_leaderboard()
+        with app.app_context():
+            taskstatus = enactus_app.TaskStatus.query.join(enactus_app.User) \
+                .filter(enactus_app.User.team_id.isnot(None),
+                        enactus_app.TaskStatus.status == constants.STATUS_SUBMITTED).first()
+            userid, taskid, points = taskstatus.user_id, taskstatus.task_id, taskstatus.points
+            teamid = taskstatus.user.team_id
+        users, teams = self.scores()
+        response, body = self.request(self.admin, "post", "/grade", [{
+            "user_id": userid, "task_id": taskid, "status": constants.STATUS_COMPLETED, "points": points + 1}])
+        self.assertTrue(body["data"][0]["success"], body)
+        new_users, new_teams = self.scores()
+        self.assertEqual(new_users[userid], (users[userid][0] + 1, users[userid][1] + 1))
+        self.assertEqual(new_teams[teamid], (teams[teamid][0] + 1, teams[teamid][1] + 1))
+        self.assertScoresMatchRebuild()
+        entry = [entry for entry in self.leaderboard("users") if entry["user_id"] == userid][0]
+        self.assertEqual((entry["points"], entry["completed"], entry["team_id"]), new_users[userid] + (teamid,))
+
+    def test_leaderboards_are_ordered_by_points(self):
+        for kind, key in [("users", "user_id"), ("teams", "team_id")]:
+            entries = self.leaderboard(kind)
+            self.assertGreater(len(entries), 1)
+            order = [(-entry["points"], -entry[key]) for entry in entries]
+            self.assertEqual(order, sorted(order))
+        response, body = self.request(self.member, "get", "/leaderboard/users?limit=3")
+        self.assertEqual(len(body["data"]), 3)
@@ -0,0 +1,115 @@
+import json
+import logging
+import threading
+import time
+import unittest
+from Queue import Queue
+
+import enactus_app
+import structured_logging
+from tests.support import AppTestCase, app
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self, delay=0):
+        logging.Handler.__init__(self)
+        self.delay = delay
+        self.records = []
+        self.received = threading.Event()
+
+    def emit(self, record):
+        time.sleep(self.delay)
+        self.records.append(record)
+        self.received.set()
+
+
+def queue_logger(name, queue):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.handlers = []
+    handler = structured_logging.QueueHandler(queue)
+    logger.addHandler(handler)
+    return logger, handler
+
+
+class QueueListenerTest(unittest.TestCase):
+
+    def test_queue_is_drained_on_stop(self):
+        recorder = RecordingHandler(delay=0.001)
+        listener = structured_logging.QueueListener(Queue(), recorder)
+        logger, handler = queue_logger("tests.drained", listener.queue)
+        listener.start()
+        for i in range(200):
+            logger.warning("record %d", i)
+        listener.stop()
+        self.assertEqual([record.getMessage() for record in recorder.records], ["record %d" % i for i in range(200)])
+        listener.stop()
+
+    def test_records_are_prepared_in_the_calling_thread(self):
+        listener = structured_logging.QueueListener(Queue())
+        logger, handler = queue_logger("tests.prepared", listener.queue)
+        details = {"state": "before"}
+        try:
+            raise ValueError("failed")
+        except ValueError:
+            logger.exception("details %s", details)
+        details["state"] = "after"
+        record = listener.queue.get_nowait()
+        self.assertEqual(record.getMessage(), "details {'state': 'before'}")
+        self.assertIsNone(record.exc_info)
+        self.assertIn("ValueError: failed", record.exc_text)
+
+    def test_records_are_dropped_when_the_queue_is_full(self):
+        logger, handler = queue_logger("tests.full", Queue(2))
+        for i in range(5):
+            logger.warning("record %d", i)
+        self.assertEqual(handler.dropped, 3)
+
+
+class FilterTest(unittest.TestCase):
+
+    def record(self, name, level, request_id=None):
+        record = logging.LogRecord(name, level, __file__, 0, "message", (), None)
+        record.request_id = request_id
+        return record
+
+    def test_sampling(self):
+        sql = structured_logging.SamplingFilter(0, name="sqlalchemy.engine")
+        self.assertFalse(sql.filter(self.record("sqlalchemy.engine.base.Engine", logging.INFO)))
+        self.assertTrue(sql.filter(self.record("sqlalchemy.pool", logging.INFO)))
+        self.assertTrue(sql.filter(self.record("enactus_app", logging.INFO)))
+        debug = structured_logging.SamplingFilter(0.5, below_level=logging.INFO)
+        self.assertTrue(debug.filter(self.record("enactus_app", logging.WARNING)))
+        for request_id in ("a", "b", "c", "d"):
+            passed = set(debug.filter(self.record("enactus_app", logging.DEBUG, request_id)) for i in range(5))
+            self.assertEqual(len(passed), 1, request_id)
+
+    def test_json_lines(self):
+        record = self.record("enactus_app", logging.WARNING, "request-1")
+        record.duration = 1.5
+        line = structured_logging.JsonFormatter().format(record)
+        self.assertNotIn("\n", line)
+        data = json.loads(line)
+        self.assertEqual((data["level"], data["message"], data["request_id"], data["duration"]),
+                         ("WARNING", "message", "request-1", 1.5))
+
+
+class RequestLoggingTest(AppTestCase):
+
+    def test_request_records_carry_the_request_id(self):
+        recorder = RecordingHandler()
+        handlers = enactus_app.log_listener.handlers
+        threshold = app.config["SLOW_REQUEST_THRESHOLD"]
+        enactus_app.log_listener.handlers = handlers + (recorder,)
+        app.config["SLOW_REQUEST_THRESHOLD"] = 0
+        try:
+            response = self.member.get("/user", headers={"X-Request-Id": "logged-request"})
+            self.assertTrue(recorder.received.wait(10))
+        finally:
+            app.config["SLOW_REQUEST_THRESHOLD"] = threshold
+            enactus_app.log_listener.handlers = handlers
+        self.assertEqual(response.headers["X-Request-Id"], "logged-request")
+        record = recorder.records[0]
+        self.assertEqual((record.request_id, record.route), ("logged-request", "/user"))
+        self.assertTrue(record.getMessage().startswith("Slow request GET /user"))
@@ -0,0 +1,56 @@
+import time
+
+from benchmarks import dataset
+from benchmarks.run import StubGoogleClient
+from tests.support import AppTestCase, app
+
+
+class CountingGoogleClient(StubGoogleClient):
+
+    def __init__(self, email, access_token, expires_in=3600):
+        super(CountingGoogleClient, self).__init__(email)
+        self.token = {"access_token": access_token, "expires_at": time.time() + expires_in}
+        self.calls = 0
+
+    def get(self, url):
+        self.calls += 1
+        return super(CountingGoogleClient, self).get(url)
+
+
+class GoogleProfileCacheTest(AppTestCase):
+
+    def setUp(self):
+        self.original_client = app.config["GOOGLE_CLIENT"]
+
+    def tearDown(self):
+        app.config["GOOGLE_CLIENT"] = self.original_client
+
+    def visit(self, google_client):
+        app.config["GOOGLE_CLIENT"] = google_client
+        client = app.test_client()
+        response = client.get("/")
+        with client.session_transaction() as session:
+            return response, session.get("username")
+
+    def test_profile_is_cached_against_the_token(self):
+        google_client = CountingGoogleClient(dataset.MEMBER_EMAIL, "cached-token")
+        for i in range(3):
+            response, username = self.visit(google_client)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(username, dataset.MEMBER_EMAIL)
+        self.assertEqual(google_client.calls, 1)
+        other_client = CountingGoogleClient(dataset.ADMIN_EMAIL, "other-token")
+        response, username = self.visit(other_client)
+        self.assertEqual(username, dataset.ADMIN_EMAIL)
+        self.assertEqual(other_client.calls, 1)
+
+    def test_profile_is_not_cached_past_token_expiry(self):
+        google_client = CountingGoogleClient(dataset.MEMBER_EMAIL, "expired-token", expires_in=-1)
+        self.visit(google_client)
+        self.visit(google_client)
+        self.assertEqual(google_client.calls, 2)
+
+    def test_unregistered_account(self):
+        response, username = self.visit(CountingGoogleClient("stranger@example.com", "stranger-token"))
+        self.assertIn("not a registered user", response.get_data())
+        self.assertIsNone(username)
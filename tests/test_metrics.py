@@ -0,0 +1,61 @@
+import unittest
+
+import enactus_app
+import error_codes
+import metrics
+from tests.support import AppTestCase
+
+
+class RequestMetricsTest(AppTestCase):
+
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+        self.original_registry, enactus_app.request_metrics = enactus_app.request_metrics, self.registry
+
+    def tearDown(self):
+        enactus_app.request_metrics = self.original_registry
+
+    def histogram(self, name, route):
+        return self.registry._histograms[(name, route)]
+
+    def test_streamed_responses_record_serialize_time(self):
+        for path, route in [("/tasks", "/tasks"), ("/teams", "/teams")]:
+            response, body = self.request(self.member if path == "/tasks" else self.admin, "get", path)
+            self.assertTrue(body["success"], body)
+            serialize = self.histogram("enactus_request_serialize_seconds", route)
+            self.assertEqual(serialize.count, 1)
+            self.assertGreater(serialize.sum, 0)
+            self.assertEqual(self.histogram("enactus_response_bytes", route).sum, len(response.get_data()))
+
+    def metric_lines(self):
+        response = self.admin.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/plain")
+        return response.get_data().splitlines()
+
+    def test_metrics_are_rendered_per_route(self):
+        with self.count_queries() as counter:
+            response, body = self.request(self.admin, "get", "/task/%d" % self.ids["task_ids"][0])
+        self.assertTrue(body["success"], body)
+        lines = self.metric_lines()
+        self.assertIn("# TYPE enactus_request_queries histogram", lines)
+        self.assertIn('enactus_request_queries_count{route="/task/<taskid>"} 1', lines)
+        self.assertIn('enactus_request_queries_sum{route="/task/<taskid>"} %d' % counter.count, lines)
+        self.assertIn('enactus_request_duration_seconds_bucket{route="/task/<taskid>",le="+Inf"} 1', lines)
+        self.assertIn('enactus_response_bytes_sum{route="/task/<taskid>"} %d' % len(response.get_data()), lines)
+
+    def test_metrics_require_privilege_4(self):
+        response, body = self.request(self.member, "get", "/metrics")
+        self.assertFalse(body["success"])
+        self.assertEqual(body["code"], error_codes.INSUFFICIENT_PRIVILEGE)
+
+
+class RequestStatsTest(unittest.TestCase):
+
+    def test_slowest_queries_are_kept(self):
+        stats = metrics.RequestStats(worst_queries=2)
+        for elapsed, statement in [(0.2, "a"), (0.1, "b"), (0.5, "c"), (0.3, "d")]:
+            stats.record_query(statement, elapsed)
+        self.assertEqual(stats.query_count, 4)
+        self.assertAlmostEqual(stats.db_time, 1.1)
+        self.assertEqual(stats.worst_queries(), [(0.5, "c"), (0.3, "d")])
@@ -0,0 +1,94 @@
+import unittest
+
+import sqlalchemy
+from sqlalchemy.engine.reflection import Inspector
+
+import enactus_app
+import migrations
+
+
+class MigrationSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine("sqlite://")
+        self.metadata = sqlalchemy.MetaData()
+        self.table = sqlalchemy.Table(
+            "item", self.metadata,
+            sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+            sqlalchemy.Column("name", sqlalchemy.String(80), nullable=False),
+            sqlalchemy.Column("rank", sqlalchemy.Integer, nullable=False, server_default="0"),
+            sqlalchemy.Index("item_name_rank", "name", "rank"))
+        self.migration_set = migrations.MigrationSet()
+        self.calls = []
+
+        @self.migration_set.migration(2, "Add ranks")
+        def add_rank(connection):
+            self.calls.append(2)
+            migrations.add_column(connection, self.table.c.rank)
+            migrations.create_index(connection, migrations.find_index(self.table, "item_name_rank"))
+
+        @self.migration_set.migration(1, "Create the item table")
+        def create_item(connection):
+            self.calls.append(1)
+            migrations.create_table(connection, self.table)
+
+    def columns(self):
+        return [column["name"] for column in Inspector.from_engine(self.engine).get_columns("item")]
+
+    def indexes(self):
+        return [index["name"] for index in Inspector.from_engine(self.engine).get_indexes("item")]
+
+    def test_upgrade_applies_each_migration_once_in_order(self):
+        self.assertEqual([migration.version for migration in self.migration_set.upgrade(self.engine)], [1, 2])
+        self.assertEqual(self.migration_set.upgrade(self.engine), [])
+        self.assertEqual(self.calls, [1, 2])
+        with self.engine.connect() as connection:
+            self.assertEqual(self.migration_set.applied_versions(connection), set([1, 2]))
+        self.assertEqual(self.columns(), ["id", "name", "rank"])
+        self.assertEqual(self.indexes(), ["item_name_rank"])
+
+    def test_upgrade_of_database_created_from_the_models(self):
+        self.metadata.create_all(self.engine)
+        self.assertEqual(len(self.migration_set.upgrade(self.engine)), 2)
+        self.assertEqual(self.columns(), ["id", "name", "rank"])
+        self.assertEqual(self.indexes(), ["item_name_rank"])
+
+    def test_add_column_to_older_table(self):
+        with self.engine.begin() as connection:
+            connection.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL)")
+            connection.execute("INSERT INTO item (name) VALUES ('old')")
+        self.migration_set.upgrade(self.engine)
+        self.assertEqual(self.columns(), ["id", "name", "rank"])
+        self.assertEqual(list(self.engine.execute("SELECT name, rank FROM item")), [("old", 0)])
+
+    def test_create_index_skips_index_on_same_columns(self):
+        with self.engine.begin() as connection:
+            migrations.create_table(connection, self.table)
+            connection.execute("DROP INDEX item_name_rank")
+            connection.execute("CREATE INDEX legacy_name_rank ON item (name, rank)")
+            migrations.create_index(connection, migrations.find_index(self.table, "item_name_rank"))
+        self.assertEqual(self.indexes(), ["legacy_name_rank"])
+
+    def test_duplicate_version(self):
+        with self.assertRaises(AssertionError):
+            self.migration_set.migration(1, "Duplicate")(lambda connection: None)
+
+
+class SchemaMigrationsTest(unittest.TestCase):
+
+    def test_migrations_create_the_models_schema(self):
+        migrated = sqlalchemy.create_engine("sqlite://")
+        enactus_app.schema_migrations.upgrade(migrated)
+        created = sqlalchemy.create_engine("sqlite://")
+        enactus_app.db.Model.metadata.create_all(created)
+        migrated_inspector, created_inspector = Inspector.from_engine(migrated), Inspector.from_engine(created)
+        self.assertEqual(set(migrated_inspector.get_table_names()),
+                         set(created_inspector.get_table_names()) | set(["schema_version"]))
+        for table in created_inspector.get_table_names():
+            self.assertEqual(sorted(column["name"] for column in migrated_inspector.get_columns(table)),
+                             sorted(column["name"] for column in created_inspector.get_columns(table)), table)
+            self.assertEqual(sorted(index["name"] for index in migrated_inspector.get_indexes(table)),
+                             sorted(index["name"] for index in created_inspector.get_indexes(table)), table)
+        schema_migrations = enactus_app.schema_migrations
+        self.assertEqual(len(schema_migrations.upgrade(created)), len(schema_migrations.migrations))
+        self.assertEqual(schema_migrations.upgrade(created), [])
@@ -0,0 +1,51 @@
+import error_codes
+from tests.support import AppTestCase
+
+
+class KeysetPaginationTest(AppTestCase):
+
+    def pages(self, client, path, key, limit):
+        """ Returns: the keys of the results of each page of a list endpoint, following the "after" cursor until a
+            page has fewer than limit results
+        """
+        pages = []
+        after = None
+        while True:
+            separator = "&" if "?" in path else "?"
+            page_path = path + separator + "limit=%d" % limit + ("&after=%d" % after if after is not None else "")
+            response, body = self.request(client, "get", page_path)
+            self.assertTrue(body["success"], body)
+            pages.append([key(result) for result in body["data"]])
+            if len(body["data"]) < limit:
+                return pages
+            after = pages[-1][-1]
+
+    def assertPagesCover(self, client, path, key, limit):
+        response, body = self.request(client, "get", path)
+        everything = [key(result) for result in body["data"]]
+        pages = self.pages(client, path, key, limit)
+        self.assertTrue(all(len(page) == limit for page in pages[:-1]))
+        self.assertEqual(sum(pages, []), everything)
+        self.assertGreater(len(pages), 2)
+
+    def test_teams(self):
+        self.assertPagesCover(self.member, "/teams", lambda team: team["id"], 2)
+
+    def test_team_search(self):
+        teamids = []
+        for i in range(5):
+            response, body = self.request(self.admin, "post", "/team", {"name": "Keyset pager %d" % i, "charter": ""})
+            teamids.append(body["data"]["id"])
+        pages = self.pages(self.member, "/teams?name=SET%20PAG", lambda team: team["id"], 2)
+        self.assertEqual(sum(pages, []), teamids)
+        self.assertEqual(len(pages), 3)
+
+    def test_task_statuses(self):
+        task_id = lambda status: status["task"]["id"]
+        self.assertPagesCover(self.member, "/tasks", task_id, 3)
+        self.assertPagesCover(self.admin, "/user/%d/tasks" % self.ids["member_id"], task_id, 3)
+
+    def test_invalid_cursor(self):
+        for path in ["/teams?after=x", "/tasks?limit=many"]:
+            response, body = self.request(self.member, "get", path)
+            self.assertEqual(body["code"], error_codes.INVALID_PARAMETERS, path)
@@ -0,0 +1,31 @@
+from tests.support import AppTestCase
+
+
+class QueryCountTest(AppTestCase):
+    """ The list and team endpoints load the rows they serialize eagerly, so their query count does not depend on the
+    number of rows returned
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(QueryCountTest, cls).setUpClass()
+        response, body = cls.request(cls.admin, "post", "/team", {"name": "Empty team", "charter": ""})
+        cls.empty_team_id = body["data"]["id"]
+
+    def assertConstantQueries(self, client, small_path, large_path):
+        # The first request warms the caches shared by both
+        self.query_count(client, large_path)
+        self.assertEqual(self.query_count(client, small_path), self.query_count(client, large_path))
+
+    def test_task_statuses(self):
+        self.assertConstantQueries(self.member, "/tasks?limit=1", "/tasks")
+
+    def test_task_statuses_of_user(self):
+        self.assertConstantQueries(self.admin, "/user/%d/tasks?limit=1" % self.ids["member_id"],
+                                   "/user/%d/tasks" % self.ids["member_id"])
+
+    def test_team(self):
+        self.assertConstantQueries(self.member, "/team/%d" % self.empty_team_id, "/team/%d" % self.ids["team_ids"][0])
+
+    def test_teams(self):
+        self.assertConstantQueries(self.member, "/teams?limit=1", "/teams")
@@ -0,0 +1,16 @@
+import random
+
+import enactus_app
+from benchmarks import query_plans
+from tests.support import AppTestCase, app
+
+
+class QueryPlanTest(AppTestCase):
+
+    def test_no_endpoint_scans_a_hot_table(self):
+        with app.app_context():
+            # Planners only pick the indexes the access paths need once they have statistics
+            enactus_app.db.session.execute("ANALYZE")
+            enactus_app.db.session.commit()
+        regressions = query_plans.check(enactus_app, self.ids, random.Random(0))
+        self.assertEqual(regressions, [], "\n".join("%s scans %s: %s" % regression for regression in regressions))
@@ -0,0 +1,80 @@
+import json
+import unittest
+
+import serializers
+
+
+class Point(object):
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Line(object):
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+
+def make_serializer():
+    serializer = serializers.Serializer()
+    serializer.register(Point, ["x", "y"])
+    serializer.register(Line, ["start", "end", "length"], nested=["start", "end"],
+                        getters={"length": lambda line: abs(line.end.x - line.start.x)})
+    return serializer
+
+
+class SerializerTest(unittest.TestCase):
+
+    def test_registered_models_are_converted(self):
+        serializer = make_serializer()
+        line = Line(Point(1, 2), Point(4, 6))
+        self.assertEqual(serializer.to_data(line), {"start": {"x": 1, "y": 2}, "end": {"x": 4, "y": 6}, "length": 3})
+        self.assertEqual(serializer.to_data({"lines": [line], "count": 1}),
+                         {"lines": [serializer.to_data(line)], "count": 1})
+
+    def test_envelopes_are_compact_json(self):
+        serializer = make_serializer()
+        data = [Point(1, 2), Point(3, 4)]
+        encoded = serializer.encode_envelope(True, 0, data)
+        self.assertTrue(encoded.endswith("\n"))
+        self.assertNotIn(" ", encoded)
+        self.assertEqual(json.loads(encoded),
+                         {"success": True, "code": 0, "data": [{"x": 1, "y": 2}, {"x": 3, "y": 4}]})
+        raw = serializer.encode_envelope_raw(True, 0, serializer.encoder.encode(serializer.to_data(data)))
+        self.assertEqual(raw, encoded)
+
+    def test_streamed_envelope_is_identical(self):
+        serializer = make_serializer()
+        points = [Point(i, -i) for i in range(100)]
+        read = []
+
+        def items():
+            for point in points:
+                read.append(point)
+                yield point
+
+        recorded = []
+        chunks = serializer.iter_envelope(True, 0, items(), buffer_size=64, record_time=recorded.append)
+        first = next(chunks)
+        self.assertEqual(read, [])
+        rest = list(chunks)
+        self.assertGreater(len(rest), 2)
+        self.assertEqual(first + "".join(rest), serializer.encode_envelope(True, 0, points))
+        self.assertEqual(len(recorded), 1)
+        self.assertEqual("".join(serializer.iter_envelope(False, 5, [])), serializer.encode_envelope(False, 5, []))
+
+
+class SelectionCacheTest(unittest.TestCase):
+
+    def test_compiled_selections_are_bounded(self):
+        serializer = serializers.Serializer(selection_cache_size=4)
+        serializer.register(Point, ["x", "y"])
+        point = Point(1, 2)
+        for i in range(50):
+            selection = serializers.parse_selection("x,unknown%d" % i, None)
+            self.assertEqual(serializer.to_data(point, selection), {"x": 1})
+        self.assertEqual(len(serializer._selected._entries), 4)
+        self.assertEqual(serializer.to_data(point, serializers.parse_selection("y", None)), {"y": 2})
@@ -0,0 +1,41 @@
+import threading
+
+import constants
+import enactus_app
+from tests.support import AppTestCase, app
+
+
+class StatsInvalidationTest(AppTestCase):
+
+    def completed(self, taskid):
+        response, body = self.request(self.admin, "get", "/stats/tasks")
+        self.assertTrue(body["success"], body)
+        return dict((stats["task_id"], stats["completed"]) for stats in body["data"]).get(taskid, 0)
+
+    def test_stats_read_before_commit_are_refreshed(self):
+        with app.app_context():
+            taskstatus = enactus_app.TaskStatus.query.filter_by(status=constants.STATUS_AVAILABLE) \
+                .order_by(enactus_app.TaskStatus.user_id.desc()).first()
+            userid, taskid = taskstatus.user_id, taskstatus.task_id
+        completed = self.completed(taskid)
+        written, read = threading.Event(), threading.Event()
+
+        def complete_task():
+            # Sessions are scoped to threads, so the write is made in another thread to keep it uncommitted while
+            # the statistics are read
+            with app.app_context():
+                table = enactus_app.TaskStatus.__table__
+                enactus_app.db.session.execute(
+                    table.update().where(table.c.user_id == userid).where(table.c.task_id == taskid)
+                    .values(status=constants.STATUS_COMPLETED, change_seq=enactus_app.next_change_seq()))
+                written.set()
+                read.wait(10)
+                enactus_app.db.session.commit()
+
+        writer = threading.Thread(target=complete_task)
+        writer.start()
+        self.assertTrue(written.wait(10))
+        self.assertEqual(self.completed(taskid), completed)
+        read.set()
+        writer.join(10)
+        self.assertEqual(self.completed(taskid), completed + 1)
@@ -0,0 +1,48 @@
+import json
+
+import enactus_app
+from tests.support import AppTestCase, app
+
+
+class StreamedListTest(AppTestCase):
+    """ The list endpoints stream their data array, reading the rows in batches of STREAM_BATCH_SIZE """
+
+    def setUp(self):
+        self.batch_size = app.config["STREAM_BATCH_SIZE"]
+        app.config["STREAM_BATCH_SIZE"] = 2
+
+    def tearDown(self):
+        app.config["STREAM_BATCH_SIZE"] = self.batch_size
+
+    def stream(self, client, path):
+        response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        return response
+
+    def test_envelope_is_sent_before_the_rows_are_read(self):
+        response = self.stream(self.admin, "/teams")
+        chunks = iter(response.response)
+        with self.count_queries() as counter:
+            first = next(chunks)
+        self.assertEqual(counter.count, 0)
+        self.assertTrue(first.endswith("["), first)
+        body = json.loads(first + "".join(chunks))
+        self.assertTrue(body["success"])
+        self.assertEqual([team["id"] for team in body["data"]], self.team_ids())
+        response.close()
+
+    def test_streamed_lists_contain_every_row(self):
+        userid = self.ids["member_id"]
+        with app.app_context():
+            taskids = [status.task_id for status in
+                       enactus_app.TaskStatus.query.filter_by(user_id=userid).order_by(enactus_app.TaskStatus.task_id)]
+        self.assertGreater(len(taskids), app.config["STREAM_BATCH_SIZE"])
+        for client, path in [(self.member, "/tasks"), (self.admin, "/user/%d/tasks" % userid)]:
+            body = json.loads(self.stream(client, path).get_data())
+            self.assertEqual([status["task"]["id"] for status in body["data"]], taskids, path)
+
+    def team_ids(self):
+        with app.app_context():
+            query = enactus_app.db.session.query(enactus_app.Team.id).order_by(enactus_app.Team.id)
+            return [teamid for teamid, in query]
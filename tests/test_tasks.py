@@ -0,0 +1,115 @@
+import threading
+
+import enactus_app
+import error_codes
+from tests.support import AppTestCase, app
+
+
+class TaskTestCase(AppTestCase):
+
+    def task(self, name, **fields):
+        task = {"name": name, "max_points": 10, "type": 0, "category": 0}
+        task.update(fields)
+        return task
+
+
+class BulkTaskUpsertTest(TaskTestCase):
+
+    def test_mixed_items(self):
+        response, body = self.request(self.admin, "post", "/tasks/bulk", [
+            self.task("Bulk task 1"),
+            self.task(5),
+            self.task("Task 1", description="Updated by the bulk upsert"),
+            "not a task",
+            self.task("Bulk task 2", max_points=0),
+            self.task("bulk TASK 1"),
+            self.task("Bulk task 3", url="https://example.com/task.txt"),
+            self.task(["Bulk task 4"])
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body["success"], body)
+        results = body["data"]
+        self.assertEqual([result["index"] for result in results], list(range(8)))
+        self.assertEqual([result["success"] for result in results],
+                         [True, False, True, False, False, False, False, False])
+        self.assertEqual([result["code"] for result in results], [
+            0, error_codes.INVALID_TASK_DETAILS, 0, error_codes.INVALID_PARAMETERS, error_codes.INVALID_TASK_DETAILS,
+            error_codes.DUPLICATE_TASK_NAME, error_codes.INVALID_TASK_URL, error_codes.INVALID_TASK_DETAILS])
+        self.assertTrue(results[0]["created"])
+        self.assertFalse(results[2]["created"])
+        self.assertEqual(results[2]["id"], 1)
+        response, body = self.request(self.member, "get", "/task/%d" % results[0]["id"])
+        self.assertEqual(body["data"]["name"], "Bulk task 1")
+        response, body = self.request(self.member, "get", "/task/1")
+        self.assertEqual(body["data"]["description"], "Updated by the bulk upsert")
+
+    def test_existing_names_match_case_insensitively(self):
+        response, body = self.request(self.admin, "post", "/tasks/bulk", [
+            self.task("TASK 2", description="Updated through a differently cased name")])
+        result = body["data"][0]
+        self.assertTrue(result["success"], result)
+        self.assertEqual((result["id"], result["created"]), (2, False))
+
+    def test_chunk_conflicting_with_concurrent_creation(self):
+        bump_cache_version = enactus_app.bump_cache_version
+
+        def create_concurrently():
+            with app.app_context():
+                enactus_app.db.session.add(enactus_app.Task(**self.task("Concurrent task")))
+                enactus_app.db.session.commit()
+
+        def bump_after_concurrent_creation(name):
+            # The first chunk is written after another request has created one of its tasks
+            if name == "task_catalog" and not created.is_set():
+                created.set()
+                writer = threading.Thread(target=create_concurrently)
+                writer.start()
+                writer.join(10)
+            bump_cache_version(name)
+
+        created = threading.Event()
+        chunk_size = app.config["BULK_CHUNK_SIZE"]
+        app.config["BULK_CHUNK_SIZE"] = 2
+        enactus_app.bump_cache_version = bump_after_concurrent_creation
+        try:
+            response, body = self.request(self.admin, "post", "/tasks/bulk", [
+                self.task("Concurrent task"), self.task("Chunk task"), self.task("Later task")])
+        finally:
+            enactus_app.bump_cache_version = bump_cache_version
+            app.config["BULK_CHUNK_SIZE"] = chunk_size
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["code"] for result in body["data"]],
+                         [error_codes.DUPLICATE_TASK_NAME, error_codes.DUPLICATE_TASK_NAME, 0])
+        self.assertTrue(body["data"][2]["created"])
+        with app.app_context():
+            self.assertIsNone(enactus_app.Task.query.filter_by(name="Chunk task").first())
+
+
+class TaskCatalogTest(TaskTestCase):
+
+    def test_catalog_is_rebuilt_after_writes(self):
+        taskid = self.ids["task_ids"][5]
+        response, body = self.request(self.admin, "put", "/task", self.task("Renamed catalog task", id=taskid))
+        self.assertTrue(body["success"], body)
+        response, body = self.request(self.member, "get", "/task/%d" % taskid)
+        self.assertEqual(body["data"]["name"], "Renamed catalog task")
+        response, body = self.request(self.member, "get", "/tasks")
+        self.assertIn("Renamed catalog task", [status["task"]["name"] for status in body["data"]])
+        response, body = self.request(self.admin, "post", "/task", self.task("Catalog task"))
+        with app.app_context():
+            self.assertIn(body["data"]["id"], enactus_app.task_catalog.get().ids)
+
+    def test_catalog_follows_the_shared_version(self):
+        taskid = self.ids["task_ids"][6]
+        with app.app_context():
+            catalog = enactus_app.task_catalog.get()
+            # Another process renames the task
+            enactus_app.Task.query.filter_by(id=taskid).update({enactus_app.Task.name: "Renamed elsewhere"})
+            enactus_app.bump_cache_version("task_catalog")
+            enactus_app.db.session.commit()
+            self.assertIs(enactus_app.task_catalog.current(), catalog)
+            refreshed = enactus_app.task_catalog.get(max_age=0)
+        self.assertEqual(refreshed.version, catalog.version + 1)
+        self.assertEqual(refreshed.tasks[taskid]["name"], "Renamed elsewhere")
+        self.assertEqual(refreshed.encoded_tasks[taskid],
+                         enactus_app.serializer.encoder.encode(refreshed.tasks[taskid]))
@@ -0,0 +1,100 @@
+from sqlalchemy import event
+
+import enactus_app
+import error_codes
+from tests.support import AppTestCase, app
+
+
+class TeamNameSearchTest(AppTestCase):
+
+    def search(self, name):
+        response, body = self.request(self.member, "get", "/teams?name=%s" % name)
+        self.assertTrue(body["success"], body)
+        return [team["name"] for team in body["data"]]
+
+    def test_search_follows_created_renamed_and_deleted_teams(self):
+        response, body = self.request(self.admin, "post", "/team", {"name": "Quokka Ventures", "charter": ""})
+        teamid = body["data"]["id"]
+        self.assertEqual(self.search("okka"), ["Quokka Ventures"])
+        self.assertEqual(self.search("QUOKKA v"), ["Quokka Ventures"])
+        response, body = self.request(self.admin, "put", "/team", {"id": teamid, "name": "Wombat Works"})
+        self.assertTrue(body["success"], body)
+        self.assertEqual(self.search("okka"), [])
+        self.assertEqual(self.search("mbat"), ["Wombat Works"])
+        self.request(self.admin, "delete", "/team/%d" % teamid)
+        self.assertEqual(self.search("mbat"), [])
+
+    def test_non_string_details_are_rejected(self):
+        with app.app_context():
+            teams = enactus_app.Team.query.count()
+        for details in ({"name": 5}, {"name": ["Team"]}, {"name": "Charter team", "charter": {"a": 1}}):
+            response, body = self.request(self.admin, "post", "/team", details)
+            self.assertEqual(body["code"], error_codes.INVALID_TEAM_DETAILS, details)
+        with app.app_context():
+            self.assertEqual(enactus_app.Team.query.count(), teams)
+        response, body = self.request(self.admin, "put", "/team", {"id": self.ids["team_ids"][0], "name": 5})
+        self.assertEqual(body["code"], error_codes.INVALID_TEAM_DETAILS)
+        self.assertNotEqual(self.search(self.team_name()), [])
+
+    def team_name(self):
+        with app.app_context():
+            return enactus_app.Team.query.filter_by(id=self.ids["team_ids"][0]).one().name
+
+
+class TeamMembershipTest(AppTestCase):
+
+    def members(self, teamid):
+        with app.app_context():
+            query = enactus_app.db.session.query(enactus_app.User.id).filter_by(team_id=teamid)
+            return set(userid for userid, in query)
+
+    def team_points(self, teamid):
+        with app.app_context():
+            return enactus_app.TeamScore.query.filter_by(team_id=teamid).one().points
+
+    def user_points(self, userids):
+        with app.app_context():
+            return sum(score.points for score in enactus_app.UserScore.query.filter(
+                enactus_app.UserScore.user_id.in_(userids)))
+
+    def update_team(self, details):
+        """ Returns: a tuple of the response data and the number of UPDATE statements on the user table """
+        statements = []
+        listener = lambda conn, cursor, statement, parameters, context, executemany: statements.append(statement)
+        with app.app_context():
+            engine = enactus_app.db.engine
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response, body = self.request(self.admin, "put", "/team", details)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        self.assertTrue(body["success"], body)
+        return body["data"], len([statement for statement in statements if statement.startswith("UPDATE user ")])
+
+    def test_membership_changes_move_users_and_scores(self):
+        with app.app_context():
+            enactus_app.rebuild_leaderboard()
+        teamid = self.ids["team_ids"][1]
+        members = sorted(self.members(teamid))
+        self.assertGreater(len(members), 3)
+        leaving, staying = members[:2], members[2:]
+        data, user_updates = self.update_team({"id": teamid, "userids": staying, "leader_id": staying[0]})
+        self.assertEqual(sorted(user["id"] for user in data["users"]), staying)
+        self.assertEqual(user_updates, 1)
+        self.assertEqual(self.members(teamid), set(staying))
+        self.assertTrue(set(leaving) <= self.members(None))
+        self.assertEqual(self.team_points(teamid), self.user_points(staying))
+
+        # Swap one member back in for another, which takes one UPDATE for each direction
+        userids = staying[1:] + leaving[:1]
+        data, user_updates = self.update_team({"id": teamid, "userids": userids, "leader_id": staying[1]})
+        self.assertEqual(sorted(user["id"] for user in data["users"]), sorted(userids))
+        self.assertTrue(all(user["team_id"] == teamid for user in data["users"]))
+        self.assertEqual(user_updates, 2)
+        self.assertEqual(self.members(teamid), set(userids))
+        self.assertEqual(self.team_points(teamid), self.user_points(userids))
+
+        response, body = self.request(self.admin, "post", "/team", {"name": "Leavers", "userids": [staying[0]]})
+        self.assertEqual(self.team_points(body["data"]["id"]), self.user_points([staying[0]]))
+        response, body = self.request(self.admin, "put", "/team", {"id": teamid, "userids": [staying[0]]})
+        self.assertEqual(body["code"], error_codes.USERS_ALREADY_IN_TEAM)
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from io import BytesIO
+
+import constants
+import enactus_app
+import error_codes
+import uploads
+from tests.support import AppTestCase, app
+
+
+class ContentStoreExpiryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="enactus-uploads-")
+        self.store = uploads.ContentStore(self.root, expiry=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def age(self, owner, upload_id, seconds):
+        path = self.store.partial_path(owner, upload_id)
+        then = time.time() - seconds
+        os.utime(path, (then, then))
+
+    def test_resume_unknown_upload(self):
+        with self.assertRaises(uploads.NoSuchUpload):
+            self.store.append("1-2", self.store.new_upload_id(), 5, BytesIO(b"data"))
+
+    def test_resume_expired_upload(self):
+        upload_id = self.store.new_upload_id()
+        self.assertEqual(self.store.append("1-2", upload_id, 0, BytesIO(b"hello"))[0], 5)
+        self.age("1-2", upload_id, 120)
+        with self.assertRaises(uploads.NoSuchUpload):
+            self.store.append("1-2", upload_id, 5, BytesIO(b" world"))
+        self.assertIsNone(self.store.received("1-2", upload_id))
+
+    def test_remove_expired(self):
+        stale, fresh = self.store.new_upload_id(), self.store.new_upload_id()
+        self.store.append("1-2", stale, 0, BytesIO(b"stale"))
+        self.store.append("1-2", fresh, 0, BytesIO(b"fresh"))
+        self.age("1-2", stale, 120)
+        self.assertEqual(self.store.remove_expired(), 1)
+        self.assertIsNone(self.store.received("1-2", stale))
+        self.assertEqual(self.store.received("1-2", fresh), 5)
+
+
+class SubmissionUploadTest(AppTestCase):
+
+    def test_resume_unknown_upload(self):
+        # Even-numbered tasks accept file submissions, and the administrator's tasks are left open
+        upload_id = enactus_app.submission_store.new_upload_id()
+        response = self.admin.post("/task/2/submission?upload_id=%s&offset=4" % upload_id, data=b"more")
+        body = json.loads(response.get_data())
+        self.assertFalse(body["success"])
+        self.assertEqual(body["code"], error_codes.NO_SUCH_UPLOAD)
+
+    def test_rejected_submission_stores_no_file(self):
+        store = enactus_app.submission_store
+        userid, taskid = self.ids["admin_id"], 4
+        append = store.append
+
+        def append_then_close_task(owner, upload_id, offset, stream):
+            # The task is graded by another request while the upload is received
+            received = append(owner, upload_id, offset, stream)
+            with app.app_context():
+                enactus_app.TaskStatus.query.filter_by(user_id=userid, task_id=taskid) \
+                    .update({enactus_app.TaskStatus.status: constants.STATUS_COMPLETED})
+                enactus_app.db.session.commit()
+            return received
+
+        store.append = append_then_close_task
+        try:
+            response = self.admin.post("/task/%d/submission" % taskid, data=b"rejected submission content")
+        finally:
+            del store.append
+        body = json.loads(response.get_data())
+        self.assertEqual(body["code"], error_codes.TASK_NOT_SUBMITTABLE)
+        self.assertFalse(os.path.exists(store.content_path(hashlib.sha256(b"rejected submission content").hexdigest())))
+        owner = "%d-%d-" % (userid, taskid)
+        self.assertEqual([name for name in os.listdir(store.partial_root) if name.startswith(owner)], [])
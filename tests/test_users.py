@@ -0,0 +1,74 @@
+from sqlalchemy import event, exc
+
+import enactus_app
+import error_codes
+from tests.support import AppTestCase, app
+
+
+class CurrentUserTest(AppTestCase):
+
+    def test_current_user_matches_user(self):
+        response, body = self.request(self.member, "get", "/user")
+        user_response, user_body = self.request(self.member, "get", "/user/%d" % self.ids["member_id"])
+        self.assertEqual(body, user_body)
+        self.assertEqual(response.get_data(), user_response.get_data())
+
+    def test_team_deletion_updates_current_user(self):
+        response, body = self.request(self.admin, "post", "/user", {
+            "email": "leaver@benchmark.local", "display_name": "Leaver", "privilege": 1})
+        userid = body["data"]["id"]
+        client = self.client("leaver@benchmark.local")
+        response, body = self.request(self.admin, "post", "/team", {
+            "name": "Deleted team", "charter": "", "userids": [userid]})
+        teamid = body["data"]["id"]
+        response, body = self.request(client, "get", "/user")
+        self.assertEqual(body["data"]["team_id"], teamid)
+        response, body = self.request(self.admin, "delete", "/team/%d" % teamid)
+        self.assertTrue(body["success"], body)
+        response, body = self.request(client, "get", "/user")
+        self.assertIsNone(body["data"]["team_id"])
+
+
+class BulkUserImportTest(AppTestCase):
+
+    def user(self, name, **fields):
+        user = {"email": "%s@import.local" % name, "display_name": name, "privilege": 1}
+        user.update(fields)
+        return user
+
+    def test_invalid_field_types(self):
+        response, body = self.request(self.admin, "post", "/users/bulk", [
+            self.user("bools", quiz_completed=True, goals_set=False),
+            self.user("notbool", goals_set="notbool"),
+            self.user("numbername", display_name=5),
+            self.user("profile", learning_profile=["visual"])
+        ])
+        self.assertTrue(body["success"], body)
+        self.assertEqual([result["code"] for result in body["data"]], [
+            0, error_codes.INVALID_USER_DETAILS, error_codes.INVALID_USER_DETAILS, error_codes.INVALID_USER_DETAILS])
+
+    def test_failed_chunk_is_reported_per_row(self):
+        def fail_chunk(conn, cursor, statement, parameters, context, executemany):
+            if executemany and any(row.get("email") == "fails@import.local" for row in context.compiled_parameters):
+                raise exc.OperationalError(statement, parameters, Exception("injected failure"))
+
+        with app.app_context():
+            engine = enactus_app.db.engine
+        chunk_size = app.config["BULK_CHUNK_SIZE"]
+        app.config["BULK_CHUNK_SIZE"] = 2
+        event.listen(engine, "before_cursor_execute", fail_chunk)
+        try:
+            response, body = self.request(self.admin, "post", "/users/bulk", [
+                self.user("before"), self.user("chunk"), self.user("fails"), self.user("failing"), self.user("after")
+            ])
+        finally:
+            event.remove(engine, "before_cursor_execute", fail_chunk)
+            app.config["BULK_CHUNK_SIZE"] = chunk_size
+        self.assertTrue(body["success"], body)
+        results = body["data"]
+        self.assertEqual([result["row"] for result in results], list(range(5)))
+        self.assertEqual([result["code"] for result in results],
+                         [0, 0, error_codes.DATABASE_ERROR, error_codes.DATABASE_ERROR, 0])
+        self.assertEqual([result["id"] is not None for result in results], [True, True, False, False, True])
+        with app.app_context():
+            self.assertIsNone(enactus_app.User.query.filter_by(email="fails@import.local").first())
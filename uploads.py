@@ -0,0 +1,197 @@
+import errno
+import hashlib
+import os
+import re
+import time
+import uuid
+
+UPLOAD_ID_PATTERN = re.compile(r"\A[0-9a-f]{32}\Z")
+
+
+class UploadError(Exception):
+    """ Raised when an upload cannot be continued, e.g. because the offset does not match the bytes received """
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class NoSuchUpload(UploadError):
+    """ Raised when resuming an upload that was never started, or that expired and was removed """
+    pass
+
+
+class ContentStore(object):
+    """ Stores uploaded files on disk under the sha256 of their content, so that identical files are stored once.
+    Uploads are streamed to a partial file in fixed-size chunks and can be resumed from the number of bytes received.
+    """
+
+    def __init__(self, root, chunk_size=65536, max_size=None, expiry=None):
+        """
+        Args:
+            root: the directory files are stored in. Partial uploads are kept in its "partial" subdirectory
+            chunk_size: the number of bytes read and written at a time
+            max_size: the maximum size of a file in bytes, or None for no limit
+            expiry: the number of seconds after which an upload that has not received any data expires, or None if
+                uploads never expire. The partial files of expired uploads are removed when new uploads are started,
+                at most once every expiry seconds, or by remove_expired.
+        """
+        self.root = root
+        self.partial_root = os.path.join(root, "partial")
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.expiry = expiry
+        self._removed_expired_at = 0
+
+    def new_upload_id(self):
+        return uuid.uuid4().hex
+
+    def partial_path(self, owner, upload_id):
+        """ Returns the path of the partial file of an upload
+
+        Args:
+            owner: a string identifying the owner of the upload, which must not contain path separators
+            upload_id: the upload id
+
+        Raises:
+            UploadError: if the upload id is not valid
+
+        """
+        if not UPLOAD_ID_PATTERN.match(upload_id):
+            raise UploadError("Invalid upload id")
+        return os.path.join(self.partial_root, "%s-%s" % (owner, upload_id))
+
+    def content_path(self, digest):
+        return os.path.join(self.root, digest)
+
+    def append(self, owner, upload_id, offset, stream):
+        """ Appends a stream to the partial file of an upload, reading, hashing and writing one chunk at a time.
+        When resuming, the part already received is hashed first, so that the content never has to be read again.
+
+        Args:
+            owner: see partial_path
+            upload_id: the upload id
+            offset: the number of bytes of the upload that the client has already sent, which must equal the size of
+                the partial file. An offset of 0 starts the upload
+            stream: the file-like object to read the data from
+
+        Returns: a tuple of the number of bytes received so far and the hex sha256 of those bytes
+        Raises:
+            NoSuchUpload: if the offset is not 0 and the upload does not exist or has expired
+            UploadError: if the offset does not match the partial file
+            UploadTooLarge: if the upload exceeds max_size. The partial file is removed
+
+        """
+        path = self.partial_path(owner, upload_id)
+        digest = hashlib.sha256()
+        if offset == 0:
+            self._remove_expired_periodically()
+            _makedirs(self.partial_root)
+            mode = "wb"
+        else:
+            received = self.received(owner, upload_id)
+            if received is None:
+                raise NoSuchUpload("No such upload, or the upload has expired")
+            if received != offset:
+                raise UploadError("Offset does not match the %s bytes received" % received)
+            with open(path, "rb") as partial:
+                for data in iter(lambda: partial.read(self.chunk_size), b""):
+                    digest.update(data)
+            mode = "ab"
+        size = offset
+        with open(path, mode) as partial:
+            for data in iter(lambda: stream.read(self.chunk_size), b""):
+                size += len(data)
+                if self.max_size is not None and size > self.max_size:
+                    partial.close()
+                    self.discard(owner, upload_id)
+                    raise UploadTooLarge("Uploads may not be larger than %d bytes" % self.max_size)
+                digest.update(data)
+                partial.write(data)
+        return size, digest.hexdigest()
+
+    def received(self, owner, upload_id):
+        """ Returns: the number of bytes received for an upload, or None if there is no such upload or it has
+            expired
+        """
+        try:
+            stat = os.stat(self.partial_path(owner, upload_id))
+        except OSError:
+            return None
+        if self._expired(stat, time.time()):
+            self.discard(owner, upload_id)
+            return None
+        return stat.st_size
+
+    def complete(self, owner, upload_id, digest):
+        """ Moves the partial file of an upload into the store under the sha256 of its content, or discards it if the
+        store already holds a file with the same content
+
+        Args:
+            owner: see partial_path
+            upload_id: the upload id
+            digest: the hex sha256 of the content, as returned by append
+
+        Returns: the path of the stored file
+
+        """
+        path = self.content_path(digest)
+        if os.path.exists(path):
+            self.discard(owner, upload_id)
+        else:
+            os.rename(self.partial_path(owner, upload_id), path)
+        return path
+
+    def discard(self, owner, upload_id):
+        """ Removes the partial file of an upload, if any """
+        _remove(self.partial_path(owner, upload_id))
+
+    def remove_expired(self):
+        """ Removes the partial files of expired uploads
+
+        Returns: the number of partial files removed
+
+        """
+        if self.expiry is None:
+            return 0
+        now = time.time()
+        self._removed_expired_at = now
+        try:
+            names = os.listdir(self.partial_root)
+        except OSError:
+            return 0
+        removed = 0
+        for name in names:
+            path = os.path.join(self.partial_root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if self._expired(stat, now) and _remove(path):
+                removed += 1
+        return removed
+
+    def _expired(self, stat, now):
+        return self.expiry is not None and now - stat.st_mtime > self.expiry
+
+    def _remove_expired_periodically(self):
+        if self.expiry is not None and time.time() - self._removed_expired_at > self.expiry:
+            self.remove_expired()
+
+
+def _remove(path):
+    """ Returns: whether the file was removed, i.e. it existed """
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise